@@ -0,0 +1,110 @@
+# File: benchmarks/bench_compact_diff.py
+"""
+Input-token savings of the compact diff encoding on a fixed corpus of commits,
+and optionally (--llm, needs ANTHROPIC_API_KEY) the quality of the messages
+written from each encoding.
+
+The corpus is the non-merge commits of a git range, or a JSONL file saved with
+--save so that later runs compare against exactly the same diffs. Quality is
+the word overlap of a generated subject with the commit's real subject, for
+the raw and the compact diff.
+
+Usage:
+    python benchmarks/bench_compact_diff.py [--repo PATH] [--range A..B] [--limit 50]
+        [--save corpus.jsonl | --corpus corpus.jsonl] [--llm]
+"""
+import argparse
+import asyncio
+import io
+import json
+import re
+import statistics
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from codelibre.utils.compact_diff import compact_diff
+from codelibre.utils.estimate_tokens import estimate_text_tokens
+
+
+def git(repo, *args):
+    return subprocess.run(["git", *args], cwd=repo, capture_output=True, text=True, errors="replace", check=True).stdout
+
+
+def load_corpus(args):
+    """[{"sha", "subject", "diff"}] from --corpus, or from the commits of --range in --repo."""
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    log = git(args.repo, "log", "--no-merges", f"-n{args.limit}", "--format=%H%x00%s", *([args.range] if args.range else []))
+    corpus = []
+    for line in log.splitlines():
+        sha, subject = line.split("\0", 1)
+        diff = git(args.repo, "show", "--format=", "--no-color", "--no-ext-diff", "-M", sha)
+        if diff.strip():
+            corpus.append({"sha": sha, "subject": subject, "diff": diff})
+    return corpus
+
+
+def words(text):
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def overlap(generated, reference):
+    """Jaccard similarity of the words of two commit subjects (0-1)."""
+    a, b = words(generated), words(reference)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def generate(diff):
+    from codelibre.cli import stream_commit_message
+
+    with redirect_stdout(io.StringIO()):
+        return asyncio.run(stream_commit_message(diff, use_cache=False, interactive=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repo", default=".")
+    parser.add_argument("--range", help="git revision range, e.g. v1.0..v1.2 (default: HEAD)")
+    parser.add_argument("--limit", type=int, default=50, help="most recent commits taken from the range")
+    parser.add_argument("--corpus", help="read the corpus from this JSONL file")
+    parser.add_argument("--save", help="write the corpus to this JSONL file")
+    parser.add_argument("--llm", action="store_true", help="also generate messages from both encodings")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args)
+    if not corpus:
+        print("Empty corpus")
+        return 1
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in corpus)
+
+    savings, raw_total, compact_total = [], 0, 0
+    raw_scores, compact_scores = [], []
+    print(f"{'commit':<10} {'raw':>8} {'compact':>8} {'saved':>7}")
+    for entry in corpus:
+        compacted = compact_diff(entry["diff"])
+        raw_tokens, compact_tokens = estimate_text_tokens(entry["diff"]), estimate_text_tokens(compacted)
+        raw_total += raw_tokens
+        compact_total += compact_tokens
+        savings.append(1 - compact_tokens / raw_tokens if raw_tokens else 0.0)
+        line = f"{entry['sha'][:10]} {raw_tokens:>8} {compact_tokens:>8} {savings[-1]:>7.1%}"
+
+        if args.llm:
+            raw_message, compact_message = generate(entry["diff"]), generate(compacted)
+            raw_scores.append(overlap(raw_message, entry["subject"]))
+            compact_scores.append(overlap(compact_message, entry["subject"]))
+            line += f"  {raw_message!r} / {compact_message!r} (was {entry['subject']!r})"
+        print(line)
+
+    print(f"\n{len(corpus)} commits: {raw_total} -> {compact_total} tokens, "
+          f"{1 - compact_total / raw_total:.1%} saved overall, median {statistics.median(savings):.1%} per commit")
+    if args.llm:
+        print(f"Subject word overlap: raw {statistics.mean(raw_scores):.3f}, compact {statistics.mean(compact_scores):.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
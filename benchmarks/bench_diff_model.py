@@ -0,0 +1,110 @@
+# File: benchmarks/bench_diff_model.py
+"""
+Parse time and memory of the parsed diff model (utils/diff_model.py) on very
+large synthetic diffs, against splitting the text line by line into copied
+per-file and per-hunk strings.
+
+Memory is the tracemalloc peak while parsing, on top of the diff text itself.
+
+Usage:
+    python benchmarks/bench_diff_model.py [--sizes 1MB 10MB 50MB] [--repeat 3]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from codelibre.utils.diff_model import parse_diff
+from synthetic_repo import format_size, parse_size
+
+
+def make_diff(size, seed=0):
+    """A unified diff of about `size` bytes: files of 1-8 hunks of context, removed and added lines."""
+    rng = random.Random(seed)
+    parts, total, index = [], 0, 0
+    while total < size:
+        path = f"src/pkg{index % 50}/module_{index}.py"
+        file = [f"diff --git a/{path} b/{path}\nindex 83db48f..bf269f4 100644\n--- a/{path}\n+++ b/{path}\n"]
+        for hunk in range(rng.randint(1, 8)):
+            start = hunk * 40 + 1
+            file.append(f"@@ -{start},7 +{start},7 @@ def function_{hunk}():\n")
+            file += [f"     context = {rng.random()!r}\n" for _ in range(3)]
+            file += [f"-    value = compute({rng.randint(0, 10 ** 6)})\n", f"+    value = compute({rng.randint(0, 10 ** 6)})\n"]
+            file += [f"     context = {rng.random()!r}\n" for _ in range(3)]
+        text = "".join(file)
+        parts.append(text)
+        total += len(text)
+        index += 1
+    return "".join(parts)
+
+
+def split_by_lines(diff):
+    """Files and hunks as copied strings, read line by line (the model's predecessor)."""
+    files, current = [], []
+    for line in diff.splitlines(keepends=True):
+        if line.startswith("diff --git ") and current:
+            files.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        files.append("".join(current))
+
+    parsed = []
+    for file in files:
+        header, hunks, hunk = [], [], None
+        for line in file.splitlines(keepends=True):
+            if line.startswith("@@"):
+                if hunk is not None:
+                    hunks.append("".join(hunk))
+                hunk = [line]
+            elif hunk is None:
+                header.append(line)
+            else:
+                hunk.append(line)
+        if hunk is not None:
+            hunks.append("".join(hunk))
+        parsed.append(("".join(header), hunks))
+    return parsed
+
+
+def parse_model(diff):
+    parse_diff.cache_clear()
+    return parse_diff(diff)
+
+
+def measure(parse, diff, repeat):
+    """(best seconds, peak bytes allocated) for parse(diff)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(diff)
+        best = min(best, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = parse(diff)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", default=["1MB", "10MB", "50MB"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>6} {'files':>7} {'hunks':>8}  {'lines (s)':>10} {'model (s)':>10}  {'lines (MB)':>10} {'model (MB)':>10}")
+    for size in map(parse_size, args.sizes):
+        diff = make_diff(size)
+        parsed = parse_model(diff)
+        hunks = sum(len(file.hunks) for file in parsed.files)
+        line_time, line_peak = measure(split_by_lines, diff, args.repeat)
+        model_time, model_peak = measure(parse_model, diff, args.repeat)
+        print(f"{format_size(size):>6} {len(parsed.files):>7} {hunks:>8}  {line_time:>10.3f} {model_time:>10.3f}  "
+              f"{line_peak / 2 ** 20:>10.1f} {model_peak / 2 ** 20:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
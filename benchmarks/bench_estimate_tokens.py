@@ -0,0 +1,76 @@
+# File: benchmarks/bench_estimate_tokens.py
+"""
+Micro-benchmark for the token estimator on multi-megabyte diffs.
+
+Compares the previous string-concatenating estimator with the per-message
+estimator and with incremental TokenCounter updates.
+
+Usage:
+    python benchmarks/bench_estimate_tokens.py [size_mb ...]
+"""
+import random
+import re
+import sys
+import timeit
+from langchain_core.messages import AIMessage, HumanMessage
+from codelibre.utils.estimate_tokens import TokenCounter, estimate_anthropic_tokens
+
+
+def legacy_estimate(messages):
+    """The original estimator: one big concatenated string plus a regex pass."""
+    text = ""
+    for m in messages:
+        text += m if isinstance(m, str) else m.content
+    return int(len(re.sub(r"\s+", " ", text)) / 4 + len(messages) * 4)
+
+
+def synthetic_diff(size_mb, seed=0):
+    """Unified-diff-looking text of roughly `size_mb` megabytes."""
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    file_index = 0
+    while size < size_mb * 1024 * 1024:
+        if not lines or rng.random() < 0.01:
+            file_index += 1
+            lines.append(f"diff --git a/src/mod_{file_index}.py b/src/mod_{file_index}.py\n@@ -1,40 +1,40 @@\n")
+        indent = "    " * rng.randint(0, 4)
+        line = f"{rng.choice('+- ')}{indent}value_{rng.randint(0, 999)} = compute(x, y)  # note\n"
+        lines.append(line)
+        size += len(line)
+    return "".join(lines)
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def run(sizes):
+    print(f"{'size':>8} {'legacy':>10} {'per-msg':>10} {'speedup':>8} {'add/remove':>12}")
+    for size_mb in sizes:
+        diff = synthetic_diff(size_mb)
+        messages = [HumanMessage(content=diff)]
+        for i in range(20):
+            messages.append(AIMessage(content=f"feat: proposal {i}"))
+            messages.append(HumanMessage(content=f"Feedback: round {i}"))
+
+        legacy = best_of(lambda: legacy_estimate(messages))
+        current = best_of(lambda: estimate_anthropic_tokens(messages))
+
+        # Incremental updates, as done by the truncation loop
+        counter = TokenCounter(messages)
+        feedback = HumanMessage(content="Feedback: make it shorter")
+
+        def update():
+            counter.add(feedback)
+            counter.remove(feedback)
+
+        per_update = best_of(lambda: [update() for _ in range(1000)]) / 1000
+        print(
+            f"{size_mb:>6}MB {legacy * 1e3:>8.1f}ms {current * 1e3:>8.1f}ms "
+            f"{legacy / current:>7.1f}x {per_update * 1e6:>10.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    run([float(arg) for arg in sys.argv[1:]] or [1, 4, 16])
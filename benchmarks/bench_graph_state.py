@@ -0,0 +1,90 @@
+# File: benchmarks/bench_graph_state.py
+"""
+Graph overhead per feedback round as a chat session grows.
+
+Runs the interactive chat graph for --rounds feedback rounds against an instant
+fake LLM, with the message cache and token calibration stubbed out, and reports
+the mean time of a round over windows of the session (rounds 1-10, 91-100, ...).
+With a flat profile, a step costs the same however long the conversation is.
+
+Usage:
+    python benchmarks/bench_graph_state.py [--rounds 400] [--window 10] [--diff-size 20KB] [--checkpointed]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+
+from fake_llm import FakeChatModel
+from synthetic_repo import parse_size
+
+
+def run_session(rounds, diff_size, checkpointed):
+    """Perf-counter time at which each round asked for feedback."""
+    from langchain_core.messages import HumanMessage
+    from codelibre.config import BASE_TEMPLATE, SYSTEM_PROMPT
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.state import ChatState
+
+    diff = ("+    value = compute(x, y)\n" * (diff_size // 28 + 1))[:diff_size]
+    state = ChatState(
+        messages=[HumanMessage(content=BASE_TEMPLATE.format(diff=diff))],
+        system_prompt=SYSTEM_PROMPT,
+        use_cache=False,
+    )
+    stamps = []
+
+    def answer(prompt=""):
+        stamps.append(time.perf_counter())
+        return "y" if len(stamps) > rounds else "make it shorter"
+
+    config = {"recursion_limit": 10 * (rounds + 2)}
+    if checkpointed:
+        config["configurable"] = {"thread_id": "bench"}
+    with patch("builtins.input", side_effect=answer), redirect_stdout(io.StringIO()):
+        asyncio.run(get_chat_app(True, checkpointed=checkpointed).ainvoke(state, config))
+    return stamps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=400)
+    parser.add_argument("--window", type=int, default=10, help="rounds averaged per reported row")
+    parser.add_argument("--diff-size", default="20KB")
+    parser.add_argument("--checkpointed", action="store_true", help="also save every step to the session database")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="codelibre-bench-")
+    os.environ.update({
+        "ANTHROPIC_API_KEY": "benchmark",
+        "DEFAULT_MODEL": "fake-benchmark",
+        "DEFAULT_TOKEN_LIMIT": "1000000",
+        "CODELIBRE_CACHE_DIR": workdir,
+    })
+    from codelibre.graph import nodes
+
+    cache = MagicMock()
+    cache.get.return_value = None
+    with patch.object(nodes, "get_llm", return_value=FakeChatModel()), \
+            patch.object(nodes, "get_message_cache", return_value=cache), \
+            patch.object(nodes, "record_token_usage"):
+        stamps = run_session(args.rounds, parse_size(args.diff_size), args.checkpointed)
+
+    rounds = [later - earlier for earlier, later in zip(stamps, stamps[1:])]
+    print(f"{'rounds':>11} {'ms/round':>9}")
+    starts = sorted({0, *range(args.window * 9, len(rounds), args.window * 10)})
+    for start in starts:
+        window = rounds[start:start + args.window]
+        if window:
+            print(f"{start + 1:>5}-{start + len(window):<5} {sum(window) / len(window) * 1000:>9.3f}")
+    print(f"{'all':>11} {sum(rounds) / len(rounds) * 1000:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
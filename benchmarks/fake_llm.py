@@ -0,0 +1,78 @@
+# File: benchmarks/fake_llm.py
+"""
+Local stand-in for ChatAnthropic with configurable latency and streaming rate,
+so benchmarks measure CodeLibre's own overhead without network calls.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers every request with `response` after `latency` seconds (time to first
+    token), then streams it at `tokens_per_second`, one word per token.
+    Reports usage like the Anthropic integration does.
+    """
+
+    response: str = "feat: add synthetic benchmark change"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0  # 0 streams everything at once
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _tokens(self) -> List[str]:
+        words = self.response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(self._tokens())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        time.sleep(self.latency + self._token_delay() * len(self._tokens()))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self._token_delay() * len(self._tokens()))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        time.sleep(self.latency)
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self._token_delay())
+            usage = self._usage(messages) if i == len(tokens) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        tokens = self._tokens()
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self._token_delay())
+            usage = self._usage(messages) if i == len(tokens) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
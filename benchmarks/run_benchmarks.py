@@ -0,0 +1,252 @@
+# File: benchmarks/run_benchmarks.py
+"""
+Offline benchmark suite for CodeLibre.
+
+Builds synthetic git repositories with staged diffs of the requested sizes,
+replaces ChatAnthropic with a local fake (benchmarks/fake_llm.py) and measures:
+
+    startup/*        cold import of the CLI, usage output, graph import + compile
+    diff_read/*      streaming the staged diff within the CLI's budget, and in full
+    tokens/*         token estimation (fixed ratio and calibrated) on the full diff
+    truncation/*     fitting the diff message into DEFAULT_TOKEN_LIMIT
+    graph/round      graph overhead per feedback round (fake LLM without latency)
+    e2e/*            diff read to final message, and to first streamed token
+
+Results (seconds, or bytes for *_peak_bytes) are written as JSON; --compare
+reports entries that got slower than a previous run by more than --threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 1KB,1MB,10MB,100MB] [--latency 0.3] [--rate 80]
+        [--rounds 5] [--repeat 3] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+from fake_llm import FakeChatModel
+from synthetic_repo import format_size, make_repo, parse_size
+
+
+DEFAULT_SIZES = "1KB,100KB,1MB,10MB,100MB"
+TOKEN_LIMIT = 1024
+
+
+def best_of(func, repeat):
+    """Fastest of `repeat` timed calls, and the last result."""
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def fresh_interpreter_time(code, repeat):
+    """Best wall time of running `code` in a new interpreter."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_startup(results, repeat):
+    results["startup/import_cli"] = fresh_interpreter_time("import codelibre.cli", repeat)
+    results["startup/usage"] = fresh_interpreter_time(
+        "import sys; sys.argv = ['codelibre']; from codelibre.cli import cli; cli()", repeat
+    )
+    results["startup/graph_compile"] = fresh_interpreter_time(
+        "from codelibre.graph.graph import build_chat_graph; build_chat_graph().compile()", repeat
+    )
+
+
+def bench_size(results, repo, label, repeat):
+    from langchain_core.messages import HumanMessage
+    from codelibre.config import BASE_TEMPLATE, DIFF_READ_BUDGET_FACTOR, SYSTEM_PROMPT
+    from codelibre.utils.calibration import TokenCalibration
+    from codelibre.utils.estimate_tokens import estimate_text_tokens
+    from codelibre.utils.git_helpers import read_staged_diff
+    from codelibre.utils.truncation import fit_messages_to_budget
+
+    budget = TOKEN_LIMIT * DIFF_READ_BUDGET_FACTOR
+    results[f"diff_read/{label}"], staged = best_of(lambda: read_staged_diff(budget, cwd=str(repo)), repeat)
+    results[f"diff_read_full/{label}"], full = best_of(lambda: read_staged_diff(None, cwd=str(repo)), 1)
+
+    tracemalloc.start()
+    read_staged_diff(budget, cwd=str(repo))
+    results[f"diff_read_peak_bytes/{label}"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results[f"tokens/estimate/{label}"], _ = best_of(lambda: estimate_text_tokens(full.text), repeat)
+    calibration = TokenCalibration("fake-benchmark")
+    message = HumanMessage(content=BASE_TEMPLATE.format(diff=full.text))
+    results[f"tokens/calibrated/{label}"], _ = best_of(lambda: calibration.message_tokens(message), repeat)
+
+    budget_message = HumanMessage(content=BASE_TEMPLATE.format(diff=staged.text))
+    results[f"truncation/{label}"], _ = best_of(
+        lambda: fit_messages_to_budget([budget_message], SYSTEM_PROMPT, TOKEN_LIMIT), repeat
+    )
+
+    total, first_token = asyncio.run(time_to_message(repo))
+    results[f"e2e/time_to_message/{label}"] = total
+    results[f"e2e/time_to_first_token/{label}"] = first_token
+
+
+async def time_to_message(repo):
+    """Runs the CLI's path from diff to message with the fake LLM: (total, first token) seconds."""
+    from langchain_core.messages import HumanMessage
+    from codelibre.config import (
+        BASE_TEMPLATE,
+        MAP_DIGEST_TEMPLATE,
+        MAP_REDUCE_READ_BUDGET_FACTOR,
+        MAP_REDUCE_THRESHOLD_FACTOR,
+        SYSTEM_PROMPT,
+    )
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.map_reduce import summarize_diff
+    from codelibre.graph.state import ChatState
+    from codelibre.utils.estimate_tokens import estimate_text_tokens
+    from codelibre.utils.git_helpers import read_staged_diff
+
+    start = time.perf_counter()
+    diff = read_staged_diff(TOKEN_LIMIT * MAP_REDUCE_READ_BUDGET_FACTOR, cwd=str(repo)).text.strip()
+    if estimate_text_tokens(diff) > TOKEN_LIMIT * MAP_REDUCE_THRESHOLD_FACTOR:
+        diff = MAP_DIGEST_TEMPLATE.format(summaries=await summarize_diff(diff, use_cache=False))
+
+    state = ChatState(
+        messages=[HumanMessage(content=BASE_TEMPLATE.format(diff=diff))],
+        system_prompt=SYSTEM_PROMPT,
+        use_cache=False,
+    )
+    first_token = None
+    async for mode, payload in get_chat_app(False).astream(state, stream_mode=["messages", "values"]):
+        if mode == "messages" and first_token is None and payload[1]["langgraph_node"] == "ask":
+            first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return total, first_token if first_token is not None else total
+
+
+def bench_graph_rounds(results, rounds, repeat):
+    """Graph overhead per round: a feedback loop with an instant fake LLM."""
+    from langchain_core.messages import HumanMessage
+    from codelibre.config import BASE_TEMPLATE, SYSTEM_PROMPT
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.state import ChatState
+
+    def run():
+        state = ChatState(
+            messages=[HumanMessage(content=BASE_TEMPLATE.format(diff="+value = compute(x, y)\n"))],
+            system_prompt=SYSTEM_PROMPT,
+            use_cache=False,
+        )
+        answers = ["make it shorter"] * rounds + ["y"]
+        with patch("builtins.input", side_effect=answers), redirect_stdout(io.StringIO()):
+            asyncio.run(get_chat_app(True).ainvoke(state, {"recursion_limit": 10 * (rounds + 2)}))
+
+    elapsed, _ = best_of(run, repeat)
+    results["graph/round"] = elapsed / (rounds + 1)
+
+
+def compare(results, baseline, threshold):
+    """Prints how results moved against a baseline; returns the keys that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(results):
+        if key not in baseline or not baseline[key]:
+            continue
+        change = results[key] / baseline[key] - 1
+        flag = " <-- slower" if change > threshold else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:<40} {baseline[key]:>12.6g} {results[key]:>12.6g} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated diff sizes (e.g. 1KB,10MB)")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake LLM time to first token (s)")
+    parser.add_argument("--rate", type=float, default=80.0, help="fake LLM streaming rate (tokens/s)")
+    parser.add_argument("--rounds", type=int, default=5, help="feedback rounds for graph/round")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as regression")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="codelibre-bench-"))
+    os.environ.update({
+        "ANTHROPIC_API_KEY": "benchmark",
+        "DEFAULT_MODEL": "fake-benchmark",
+        "DEFAULT_TOKEN_LIMIT": str(TOKEN_LIMIT),
+        "CODELIBRE_CACHE_DIR": str(workdir / "cache"),
+        "CODELIBRE_DAEMON_SOCKET": str(workdir / "no-daemon.sock"),
+    })
+
+    from codelibre.graph import map_reduce, nodes
+
+    results = {}
+    print("startup...")
+    bench_startup(results, args.repeat)
+
+    timed_fake = FakeChatModel(latency=args.latency, tokens_per_second=args.rate)
+    with patch.object(nodes, "get_llm", return_value=FakeChatModel()):
+        print("graph rounds...")
+        bench_graph_rounds(results, args.rounds, args.repeat)
+
+    with patch.object(nodes, "get_llm", return_value=timed_fake), patch.object(map_reduce, "get_llm", return_value=timed_fake):
+        for size in [parse_size(s) for s in args.sizes.split(",")]:
+            label = format_size(size)
+            print(f"{label}: building repository...")
+            repo = make_repo(workdir / f"repo-{label}", size)
+            print(f"{label}: measuring...")
+            with redirect_stdout(io.StringIO()):
+                bench_size(results, repo, label, args.repeat)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fake_llm": {"latency": args.latency, "tokens_per_second": args.rate},
+            "token_limit": TOKEN_LIMIT,
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        unit = "B" if key.startswith("diff_read_peak_bytes") else "s"
+        print(f"{key:<{width}} {value:>12.6g} {unit}")
+    print(f"\nSaved {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
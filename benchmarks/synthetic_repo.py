@@ -0,0 +1,81 @@
+# File: benchmarks/synthetic_repo.py
+"""
+Builds throwaway git repositories whose staged diff has a given size.
+"""
+import os
+import random
+import re
+import subprocess
+from pathlib import Path
+
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """Bytes in a size like "1KB", "2.5MB" or "512"."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?B)?\s*", text.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or "B"])
+
+
+def format_size(size: int) -> str:
+    for unit in ("GB", "MB", "KB"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+def _git(repo: Path, *args: str) -> None:
+    env = {
+        **os.environ,
+        "GIT_CONFIG_GLOBAL": os.devnull,
+        "GIT_AUTHOR_NAME": "Bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+        "GIT_COMMITTER_NAME": "Bench", "GIT_COMMITTER_EMAIL": "bench@example.com",
+    }
+    env.pop("GIT_INDEX_FILE", None)
+    subprocess.run(["git", *args], cwd=repo, env=env, check=True, capture_output=True)
+
+
+def _source_lines(rng: random.Random, count: int):
+    for _ in range(count):
+        indent = "    " * rng.randint(0, 3)
+        yield f"{indent}value_{rng.randint(0, 9999)} = compute(x, y)  # {rng.randint(0, 99)}\n"
+
+
+def make_repo(path: Path, diff_size: int, seed: int = 0) -> Path:
+    """
+    Initializes a repository at `path` with a committed base and a staged change
+    whose diff is roughly `diff_size` bytes: edits to existing files plus new
+    files, spread over files of at most ~64KB like a real change set.
+    """
+    rng = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    _git(path, "init", "-q")
+
+    file_size = min(max(diff_size // 8, 512), 64 * 1024)
+    line_size = 40
+    file_count = max(diff_size // file_size, 1)
+
+    # Base commit: the files that will be edited
+    edited = max(file_count // 2, 1)
+    for i in range(edited):
+        target = path / "src" / f"pkg_{i // 100}" / f"mod_{i}.py"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text("".join(_source_lines(rng, file_size // line_size // 2)))
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "base")
+
+    # Staged change: rewrite every other line of edited files, add new files
+    for i in range(edited):
+        target = path / "src" / f"pkg_{i // 100}" / f"mod_{i}.py"
+        lines = target.read_text().splitlines(keepends=True)
+        replacements = iter(_source_lines(rng, len(lines)))
+        target.write_text("".join(next(replacements) if j % 2 else line for j, line in enumerate(lines)))
+    for i in range(edited, file_count):
+        target = path / "src" / f"pkg_{i // 100}" / f"new_{i}.py"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text("".join(_source_lines(rng, file_size // line_size)))
+    _git(path, "add", "-A")
+    return path
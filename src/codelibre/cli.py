@@ -1,16 +1,31 @@
 # File: src/codelibre/cli.py
 import sys
 import os
-from codelibre.utils.git_helpers import get_staged_diff, sanitize_commit_message, run_git_command, unstage_all_changes
-from codelibre.graph.graph import build_chat_graph
-from codelibre.config import BASE_TEMPLATE, SYSTEM_PROMPT
-from codelibre.graph.state import ChatState
-from codelibre.graph.nodes import ExitRequestedException
-from langchain_core.messages import HumanMessage
+import time
+from codelibre.utils.git_helpers import sanitize_commit_message, unstage_all_changes
+from codelibre.utils.git_session import GitSession, find_worktree_root, session_id
+from codelibre.config import (
+    BASE_TEMPLATE,
+    CANDIDATES_MAX,
+    SYSTEM_PROMPT,
+    DIFF_READ_BUDGET_FACTOR,
+    MAP_DIGEST_TEMPLATE,
+    MAP_REDUCE_READ_BUDGET_FACTOR,
+    MAP_REDUCE_THRESHOLD_FACTOR,
+    load_settings,
+)
+from codelibre.utils.compact_diff import compact_diff
+from codelibre.utils.estimate_tokens import estimate_text_tokens
+from codelibre.utils.file_ranking import describe_reduced, load_rules, select_files
+from codelibre.utils.heuristics import trivial_commit_message
+from codelibre.utils.tracing import disable_tracing, enable_tracing, get_recorder, mark_first, span
+from codelibre.exceptions import ExitRequestedException, TruncationException, CodeLibreEnvironmentError, LLMRequestError
 from codelibre.config import Colors
-from anthropic import APIStatusError
 import traceback
 
+# NOTE: langgraph, langchain and anthropic are imported lazily (see generate_commit_message)
+# so that usage output, errors and git staging never pay for loading them.
+
 
 def print_header():
     """Print a clean header for the application."""
@@ -63,13 +78,14 @@ def get_user_confirmation(commit_message):
             print(f"{Colors.YELLOW}⚠ Please type 'y' to commit, 'e' to edit, or 'n' to cancel{Colors.RESET}")
 
 
-def execute_commit(commit_message):
+def execute_commit(commit_message, session=None):
     """Execute git commit with enhanced feedback."""
+    session = session or GitSession()
     try:
         print(f"\n{Colors.BLUE}⚙ Committing changes...{Colors.RESET}")
         print(f"  {Colors.DIM}git commit -m \"{commit_message}\"{Colors.RESET}")
         
-        result = run_git_command(["commit", "-m", commit_message])
+        result = session.commit(commit_message)
         
         print(f"\n{Colors.GREEN}{Colors.BOLD}✓ Successfully committed!{Colors.RESET}")
         
@@ -91,6 +107,20 @@ def print_usage():
     print(f"  {Colors.GREEN}--staged{Colors.RESET}      Generate message from staged changes")
     print(f"  {Colors.GREEN}--all{Colors.RESET}         Stage all files and generate message")
     print(f"  {Colors.GREEN}-e <files...>{Colors.RESET} Add specified files before generating message")
+    print(f"  {Colors.GREEN}--clear-cache{Colors.RESET} Delete cached commit messages")
+    print(f"  {Colors.GREEN}install-hook{Colors.RESET}  Write commit messages from git's prepare-commit-msg hook")
+    print(f"  {Colors.GREEN}daemon <cmd>{Colors.RESET}  start|stop|status|serve a background daemon that keeps the AI warm")
+    print(f"  {Colors.GREEN}reword <range>{Colors.RESET} Rewrite the messages of a range of commits ending at HEAD (--dry-run to preview)")
+
+    print(f"\n{Colors.BOLD}Flags:{Colors.RESET}")
+    print(f"  {Colors.GREEN}--no-cache{Colors.RESET}    Ignore cached messages and ask the AI again")
+    print(f"  {Colors.GREEN}--truncate{Colors.RESET}    Truncate very large diffs instead of summarizing them")
+    print(f"  {Colors.GREEN}--no-heuristics{Colors.RESET} Ask the AI even for trivial changes (docs, tests, version bumps)")
+    print(f"  {Colors.GREEN}--raw-diff{Colors.RESET}    Send the diff as git prints it instead of the compact encoding")
+    print(f"  {Colors.GREEN}--resume{Colors.RESET}      Continue the interrupted session for the staged changes")
+    print(f"  {Colors.GREEN}--candidates <n>{Colors.RESET} Generate n messages at once (up to {CANDIDATES_MAX}) and pick one")
+    print(f"  {Colors.GREEN}--profile{Colors.RESET}     Print how long each stage took")
+    print(f"  {Colors.GREEN}--trace-file <path>{Colors.RESET} Write stage timings as a Chrome trace (JSON)")
     
     print(f"\n{Colors.DIM}Examples:")
     print("  python main.py --staged")
@@ -113,22 +143,306 @@ def print_status(message, status_type="info"):
     print(f"{icon} {message}{Colors.RESET}")
 
 
+def api_status_errors():
+    """
+    Returns the Anthropic APIStatusError class for use in an except clause,
+    or an empty tuple if the SDK was never loaded (so nothing can match).
+    """
+    anthropic = sys.modules.get("anthropic")
+    return (anthropic.APIStatusError,) if anthropic else ()
+
+
+def generate_commit_message(diff, use_cache=True, summarize=False, session=None, resume=False, candidates=1):
+    """
+    Runs the chat graph on the diff, streaming the AI output, and returns the accepted response.
+    With summarize, the diff is first summarized part by part (see graph/map_reduce.py).
+    With candidates above one, that many messages are generated at first to pick from.
+    With a session id, every step is checkpointed and resume continues where it stopped.
+    Runs in the background daemon if one is up (see daemon.py), in-process otherwise
+    or when profiling, so that every stage is timed.
+    """
+    if get_recorder() is None:
+        from codelibre.daemon import generate_via_daemon
+
+        response = generate_via_daemon(
+            diff, use_cache=use_cache, summarize=summarize, session=session, resume=resume, candidates=candidates
+        )
+        if response is not None:
+            return response
+
+    import asyncio
+
+    return asyncio.run(stream_commit_message(
+        diff, use_cache=use_cache, summarize=summarize, session=session, resume=resume, candidates=candidates
+    ))
+
+
+async def stream_commit_message(diff, use_cache=True, summarize=False, interactive=True, session=None, resume=False,
+                                candidates=1):
+    """
+    Async body of generate_commit_message; Ctrl+C cancels the graph cleanly.
+    Without interactive, the first answer is returned without asking for feedback.
+    Interactive runs with a session id are checkpointed under it: with resume they
+    continue from the last saved step, otherwise any earlier run is discarded.
+    """
+    from langchain_core.messages import HumanMessage
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.state import ChatState
+
+    checkpointed = interactive and session is not None
+    chat_app = get_chat_app(interactive, checkpointed=checkpointed)
+    config = {}
+    state = None
+    final_state = {}
+    if checkpointed and chat_app.checkpointer is not None:
+        config = {"configurable": {"thread_id": session}}
+        snapshot = await chat_app.aget_state(config)
+        saved = snapshot.values if snapshot.values.get("messages") else None
+        if resume and saved:
+            if not snapshot.next:
+                print_status("Resuming session: the message was already accepted", "success")
+                return saved.get("response", "")
+            print_status("Resuming the interrupted session...", "info")
+            if saved.get("response"):
+                print(f"{Colors.CYAN}{saved['response']}{Colors.RESET}")
+            final_state = saved
+        else:
+            if resume:
+                print_status("No interrupted session for these changes, starting over", "warning")
+            elif saved and snapshot.next:
+                print_status("Starting over (use --resume to continue an interrupted session)", "info")
+            await chat_app.checkpointer.adelete_thread(session)
+
+    if not final_state:
+        if summarize:
+            from codelibre.graph.map_reduce import summarize_diff
+
+            print_status("Large change, summarizing it in parts...", "process")
+            diff = MAP_DIGEST_TEMPLATE.format(summaries=await summarize_diff(diff, use_cache=use_cache))
+
+        # Create initial state with first message
+        state = ChatState(
+            messages=[HumanMessage(content=BASE_TEMPLATE.format(diff=diff))],
+            system_prompt=SYSTEM_PROMPT,
+            use_cache=use_cache,
+            candidate_count=candidates if interactive else 1,
+        )
+
+        print_status("Generating commit message...", "process")
+        print()
+
+    # Show a subtle progress indicator
+    print(f"{Colors.CYAN}", end='')
+
+    # Print tokens streamed by the 'ask' node; take the accepted response from the final state
+    # (a resumed run starts from its checkpoint, with no input)
+    async for mode, payload in chat_app.astream(
+        state,
+        config,
+        stream_mode=["messages", "values"],
+    ):
+        if mode == "values":
+            final_state = payload
+            continue
+        message_chunk, metadata = payload
+        if (message_chunk and metadata["langgraph_node"] == "ask"):
+            mark_first("llm.first_token", since="llm.request")
+            print(message_chunk.content, end='', flush=True)
+
+    print(f"{Colors.RESET}")  # Reset color and newline
+    print_run_summary(final_state)
+    return final_state.get("response", "")
+
+
+def print_run_summary(final_state):
+    """Shows how the LLM calls of a run used Anthropic's prompt cache, and what hedging cost."""
+    hits = final_state.get("prompt_cache_hits", 0)
+    misses = final_state.get("prompt_cache_misses", 0)
+    if hits or misses:
+        print(f"  {Colors.DIM}Prompt cache: {hits} hit(s), {misses} miss(es){Colors.RESET}")
+    hedged = final_state.get("hedged_requests", 0)
+    if hedged:
+        tokens = final_state.get("hedged_input_tokens", 0)
+        print(f"  {Colors.DIM}Hedged requests: {hedged} (~{tokens} extra input tokens){Colors.RESET}")
+
+
+def print_profile(recorder):
+    """Timing breakdown of a run, one line per stage (nested stages overlap)."""
+    print(f"\n{Colors.BOLD}⏱  Timing breakdown{Colors.RESET}")
+    for name, calls, total in recorder.summary():
+        count = f" ({calls} calls)" if calls > 1 else ""
+        print(f"  {name:<34} {total * 1000:>9.1f} ms{Colors.DIM}{count}{Colors.RESET}")
+    print(f"  {Colors.BOLD}{'total':<34} {(time.perf_counter() - recorder.origin) * 1000:>9.1f} ms{Colors.RESET}")
+
+
+def encode_compact(diff):
+    """The diff in compact encoding (see utils/compact_diff.py), reporting the tokens saved."""
+    with span("cli.compact_diff"):
+        compacted = compact_diff(diff).strip()
+    before, after = estimate_text_tokens(diff), estimate_text_tokens(compacted)
+    if before:
+        print(f"  {Colors.DIM}Compact diff: ~{before} → ~{after} tokens ({(before - after) / before:.0%} saved){Colors.RESET}")
+    return compacted
+
+
+def reduce_low_value_files(diff, token_budget, cwd=None):
+    """The diff with low-value files reduced to a stat line (see utils/file_ranking.py), reporting which."""
+    with span("cli.rank_files"):
+        selected, reduced = select_files(diff, token_budget, load_rules(find_worktree_root(cwd)))
+    if reduced:
+        print(f"  {Colors.DIM}Sent as a stat line: {describe_reduced(reduced)}{Colors.RESET}")
+    return selected
+
+
+def parse_candidates(value):
+    """Number of candidates given to --candidates (1 if absent). Raises ValueError if out of range."""
+    if value is None:
+        return 1
+    if not value.isdigit() or not 1 <= int(value) <= CANDIDATES_MAX:
+        raise ValueError(f"--candidates must be a number from 1 to {CANDIDATES_MAX}")
+    return int(value)
+
+
+def pop_flag(args, flag):
+    """Removes every occurrence of `flag` from args, returning whether it was present."""
+    present = flag in args
+    args[:] = [arg for arg in args if arg != flag]
+    return present
+
+
+def pop_option(args, option):
+    """
+    Removes `option` and the value following it from args, returning the value
+    (None if the option is absent). Raises ValueError if the value is missing.
+    """
+    if option not in args:
+        return None
+    index = args.index(option)
+    if index + 1 >= len(args):
+        raise ValueError(f"{option} needs a value")
+    value = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+def clear_message_cache():
+    """Delete all cached commit messages."""
+    from codelibre.utils.message_cache import MessageCache
+
+    removed = MessageCache().clear()
+    print_status(f"Cleared {removed} cached message(s)", "success")
+
+
+def daemon_command(action):
+    """Start, stop or query the background daemon, or run it in the foreground."""
+    from codelibre import daemon
+
+    if action == "start":
+        pid = daemon.start_daemon()
+        print_status(f"Daemon running (pid {pid})", "success")
+    elif action == "serve":
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif action == "stop":
+        if daemon.stop_daemon():
+            print_status("Daemon stopped", "success")
+        else:
+            print_status("Daemon is not running", "info")
+    elif action == "status":
+        pid = daemon.daemon_status()
+        if pid:
+            print_status(f"Daemon running (pid {pid})", "success")
+        else:
+            print_status("Daemon is not running", "info")
+    else:
+        print_status("Usage: codelibre daemon start|serve|stop|status", "error")
+
+
 def cli():
     """Main entry point for the CodeLibre."""
     args = sys.argv[1:]
 
+    # Global flags, valid alongside any option
+    use_cache = not pop_flag(args, "--no-cache")
+    allow_summary = not pop_flag(args, "--truncate")
+    resume = pop_flag(args, "--resume")
+    heuristics = not pop_flag(args, "--no-heuristics")
+    compact = not pop_flag(args, "--raw-diff")
+    profile = pop_flag(args, "--profile")
+    try:
+        trace_file = pop_option(args, "--trace-file")
+        candidates = parse_candidates(pop_option(args, "--candidates"))
+    except ValueError as e:
+        print_status(str(e), "error")
+        sys.exit(1)
+
     if not args:
         print_usage()
         return
 
+    if not (profile or trace_file):
+        run_command(args, use_cache, allow_summary, resume, heuristics, compact, candidates)
+        return
+
+    recorder = enable_tracing()
+    try:
+        run_command(args, use_cache, allow_summary, resume, heuristics, compact, candidates)
+    finally:
+        disable_tracing()
+        if profile:
+            print_profile(recorder)
+        if trace_file:
+            recorder.write_chrome_trace(trace_file)
+            print_status(f"Trace written to {trace_file}", "info")
+
+
+def run_command(args, use_cache=True, allow_summary=True, resume=False, heuristics=True, compact=True, candidates=1):
+    """Runs the option or subcommand in args (global flags already removed)."""
+    if args[0] == "--clear-cache":
+        clear_message_cache()
+        return
+
+    if args[0] == "hook":
+        from codelibre.hook import run_hook
+
+        sys.exit(run_hook(args[1:], use_cache=use_cache, heuristics=heuristics))
+
+    if args[0] == "reword":
+        from codelibre.reword import run_reword
+
+        sys.exit(run_reword(args[1:], use_cache=use_cache, heuristics=heuristics))
+
+    if args[0] == "install-hook":
+        from codelibre.hook import install_hook
+
+        try:
+            path = install_hook(force="--force" in args[1:])
+        except Exception as e:
+            print_status(f"Could not install hook: {e}", "error")
+            sys.exit(1)
+        print_status(f"Installed prepare-commit-msg hook at {path}", "success")
+        return
+
+    if args[0] == "daemon":
+        try:
+            daemon_command(args[1] if len(args) > 1 else "")
+        except Exception as e:
+            print_status(f"Daemon error: {e}", "error")
+            sys.exit(1)
+        return
+
     print_header()
+    session = GitSession()
 
     # Handle command line arguments
     if args[0] == "--staged":
         print_status("Using currently staged changes", "info")
     elif args[0] == "--all":
         print_status("Staging all files...", "process")
-        run_git_command(["add", "."])
+        with span("cli.stage"):
+            session.stage_all()
         print_status("All files staged successfully", "success")
     elif args[0] == "-e":
         files = args[1:]
@@ -143,11 +457,9 @@ def cli():
         files = [sanitize_commit_message(f) for f in files]
 
         try:
-            # Unstage any previously staged files that are not in the new list
-            run_git_command(["reset", "HEAD"] + files)
-
-            # Stage the specified files
-            run_git_command(["add"] + files)
+            # Stage the specified files (one git process, whatever the number of files)
+            with span("cli.stage"):
+                session.stage(files)
 
             print_status("Files staged successfully", "success")
             
@@ -164,36 +476,38 @@ def cli():
         print_separator()
         print_status("Analyzing staged changes...", "process")
         
-        diff = get_staged_diff()
+        token_limit = load_settings().token_limit
+        read_factor = MAP_REDUCE_READ_BUDGET_FACTOR if allow_summary else DIFF_READ_BUDGET_FACTOR
+        staged = session.staged_diff(token_budget=token_limit * read_factor)
+        diff = staged.text.strip()
         if not diff:
             print_status("No changes staged for commit", "warning")
             print(f"  {Colors.DIM}Tip: Use 'codelibre -e <files>' or run with --all{Colors.RESET}")
             return
+        if staged.omitted:
+            print_status(f"Diff too large, {len(staged.omitted)} file(s) left out of the analysis", "warning")
+        if staged.reduced:
+            print(f"  {Colors.DIM}Sent as a stat line: {describe_reduced(staged.reduced)}{Colors.RESET}")
         
-        # Build graph, create initial state with first message
-        chat_app = build_chat_graph().compile()
-        state = ChatState(messages=[], system_prompt=SYSTEM_PROMPT)
-        state.messages.append(HumanMessage(content=BASE_TEMPLATE.format(diff=diff)))
-   
-        print_status("Generating commit message...", "process")
-        print()
-        
-        # Show a subtle progress indicator
-        print(f"{Colors.CYAN}", end='')
-        
-        final_response = ""
-
-        # Process only 'ask' node events
-        for message_chunk, metadata in chat_app.stream( 
-            state,
-            stream_mode="messages",
-        ):
-            if (message_chunk and metadata["langgraph_node"] == "ask"):
-                print(message_chunk.content, end='', flush=True)
-                final_response += message_chunk.content
-        
-        print(f"{Colors.RESET}")  # Reset color and newline
-        
+        # Version bumps, whitespace, docs- or test-only changes need no AI
+        trivial = trivial_commit_message(staged) if heuristics and not resume else None
+        if trivial:
+            print_status(f"Trivial change ({trivial.rule}), message written without the AI", "success")
+            final_response = trivial.message
+        else:
+            if compact:
+                diff = encode_compact(diff)
+            # Lockfiles, bundles, generated code and .codelibreignore'd files add little to the message
+            diff = reduce_low_value_files(diff, token_limit, session.cwd)
+
+            # Far over the limit, truncation would lose too much: summarize the parts instead
+            summarize = allow_summary and estimate_text_tokens(diff) > token_limit * MAP_REDUCE_THRESHOLD_FACTOR
+            with span("cli.generate"):
+                final_response = generate_commit_message(
+                    diff, use_cache=use_cache, summarize=summarize, session=session_id(diff, session.cwd), resume=resume,
+                    candidates=candidates
+                )
+
         if not final_response:
             print_status("Unable to generate commit message", "error")
             print(f"  {Colors.DIM}Try with different changes or check your diff{Colors.RESET}")
@@ -202,10 +516,12 @@ def cli():
         sanitized_commit_msg = sanitize_commit_message(final_response.strip())
         
         # Get user confirmation and execute if approved
-        final_message, should_commit = get_user_confirmation(sanitized_commit_msg)
+        with span("cli.confirm"):
+            final_message, should_commit = get_user_confirmation(sanitized_commit_msg)
         
         if should_commit and final_message:
-            execute_commit(final_message)
+            with span("cli.commit"):
+                execute_commit(final_message, session)
         
         print()  # Final spacing
 
@@ -217,10 +533,28 @@ def cli():
         sys.exit(0)
 
     except KeyboardInterrupt:
+        # Ctrl+C at the feedback prompt cancels the graph rather than reaching add_input
+        if args[0] != "--staged":
+            unstage_all_changes()
         print(f"\n{Colors.YELLOW}⚡ Interrupted (Ctrl+C){Colors.RESET}")
         sys.exit(1)
 
-    except APIStatusError:
+    except TruncationException as e:
+        print(f"\n{Colors.RED}✗ Staged changes are too large to send: {e}{Colors.RESET}")
+        print(f"  {Colors.DIM}Try staging fewer files or raise DEFAULT_TOKEN_LIMIT{Colors.RESET}")
+        sys.exit(1)
+
+    except CodeLibreEnvironmentError as e:
+        print(f"\n{Colors.RED}✗ Missing configuration: {e}{Colors.RESET}")
+        print(f"  {Colors.DIM}Set it in your environment or a .env file (see .env.example){Colors.RESET}")
+        sys.exit(1)
+
+    except LLMRequestError as e:
+        print(f"\n{Colors.RED}✗ The AI did not answer in time: {e}{Colors.RESET}")
+        print(f"  {Colors.DIM}Check your connection or try again later.{Colors.RESET}")
+        sys.exit(1)
+
+    except api_status_errors():
         print(f"\n{Colors.RED}✗ API is currently overloaded. Please try again later.{Colors.RESET}")
         print(f"  {Colors.DIM}If this persists, check your API usage limits or contact support.{Colors.RESET}")
         sys.exit(1)
@@ -1,4 +1,12 @@
 # File: src/codelibre/config.py
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Mapping, Optional
+from codelibre.exceptions import CodeLibreEnvironmentError
+
 
 # Behavioral Configuration for CodeLibre commit message generation
 MAX_CHARACTERS = 45
@@ -18,14 +26,129 @@ Return ONLY the commit message. No quotes. No explanation.
 """
 
 
+# Output budget of one commit message: the longest prefix, ": " and the summary,
+# at a pessimistic 2 characters per token, plus a little slack
+COMMIT_PREFIX_MAX_CHARACTERS = 10
+COMMIT_MAX_TOKENS = (COMMIT_PREFIX_MAX_CHARACTERS + 2 + MAX_CHARACTERS) // 2 + 8
+
+# The message is a single line; generation stops at the first newline
+COMMIT_STOP_SEQUENCES = ["\n"]
+
+
+# --candidates: messages generated concurrently on the first call, to pick from instead of giving feedback
+CANDIDATES_MAX = 5  # each candidate is a full request, so the extra cost stays bounded
+
+
 # Template for the initial human prompt - wrapper
 BASE_TEMPLATE = "\nDiff:\n{diff}"
 
+# Text that precedes the diff inside the initial human message
+DIFF_PREFIX = BASE_TEMPLATE.split("{diff}")[0]
+
 
 # Added context for iterative feedback - wrapper  
 INPUT_TEMPLATE = "\nFeedback:\n{feedback}"
 
 
+# Staged diff reading (see utils/git_helpers.py)
+DIFF_READ_CHUNK_SIZE = 64 * 1024  # bytes read from the git pipe at a time
+DIFF_READ_BUDGET_FACTOR = 4  # read up to this many times DEFAULT_TOKEN_LIMIT, truncation trims the rest
+
+
+# Map-reduce summarization of very large diffs (see graph/map_reduce.py)
+MAP_REDUCE_THRESHOLD_FACTOR = 2  # summarize instead of truncating above this many times DEFAULT_TOKEN_LIMIT
+MAP_REDUCE_READ_BUDGET_FACTOR = 32  # read up to this many times DEFAULT_TOKEN_LIMIT for summarizing
+MAP_REDUCE_MAX_CONCURRENCY = 4  # default for MAP_REDUCE_CONCURRENCY: file groups summarized at once
+MAP_REDUCE_MAX_ROUNDS = 3  # times summaries may be summarized again to fit the limit
+
+MAP_SUMMARY_PROMPT = """
+You summarize one part of a large code diff so a commit message can be written later.
+
+Describe what changed and why it likely changed, in at most three short sentences.
+Mention file names only when they matter. No preamble.
+"""
+
+# Replaces the diff in the chat prompt when it was summarized
+MAP_DIGEST_TEMPLATE = "(The diff was too large to send; these are summaries of its parts.)\n\n{summaries}"
+
+# Text that opens a summarized diff
+MAP_DIGEST_PREFIX = MAP_DIGEST_TEMPLATE.split("{summaries}")[0]
+
+
+# Local commit messages for trivial diffs, without the LLM (see utils/heuristics.py)
+HEURISTIC_MIN_CONFIDENCE = 0.85  # below this the diff goes to the LLM
+HEURISTIC_MAX_CHANGED_LINES = 40  # docs/test changes larger than this are left to the LLM
+
+
+# File-importance ranking: low-value files sent as a stat line (see utils/file_ranking.py)
+RANKING_IGNORE_FILE = ".codelibreignore"  # repository-level ignore and priority rules
+RANKING_LOW_VALUE_SCORE = 0.5  # files scoring below this are reduced when the diff is over budget
+RANKING_LARGE_FILE_SHARE = 0.25  # files over this share of the token limit score half
+RANKING_GENERATED_SCAN_LINES = 10  # leading added lines searched for "generated" markers
+RANKING_MINIFIED_LINE_LENGTH = 300  # average added line length above which a file looks minified
+
+
+# Model routing: each run picks a model tier from the diff's size and complexity (see utils/model_routing.py)
+ROUTING_FAST_MAX_TOKENS = 2000  # default for ROUTING_FAST_MAX_TOKENS: larger diffs never go to FAST_MODEL
+ROUTING_STRONG_MIN_TOKENS = 12000  # default for ROUTING_STRONG_MIN_TOKENS: diffs this large go to STRONG_MODEL
+ROUTING_FAST_MAX_FILES = 3  # more files than this is not a routine change
+ROUTING_STRONG_MIN_FILES = 15  # changes spanning this many files go to STRONG_MODEL
+ROUTING_STRONG_MIN_KINDS = 4  # ... as do changes spanning this many file types
+
+
+# Batch rewording of a commit range (see reword.py)
+REWORD_MAX_CONCURRENCY = 8  # default for REWORD_CONCURRENCY: commits generated at once
+REWORD_REQUESTS_PER_MINUTE = 300  # default for REWORD_REQUESTS_PER_MINUTE: shared by all of them
+
+
+# Anthropic prompt caching: breakpoint put on the system prompt and the diff message
+PROMPT_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+# Background daemon keeping the LLM client and graph warm (see daemon.py)
+DAEMON_IDLE_TIMEOUT = 30 * 60  # seconds without requests before the daemon exits
+DAEMON_START_TIMEOUT = 10.0  # seconds to wait for a started daemon to answer
+
+
+# prepare-commit-msg hook (see hook.py)
+HOOK_TIME_BUDGET = 8.0  # seconds before falling back to a locally built message
+
+
+# LLM request retries (see utils/retry.py)
+LLM_MAX_ATTEMPTS = 5
+LLM_RETRY_BASE_DELAY = 1.0  # seconds, doubled on every attempt before jitter
+LLM_RETRY_MAX_DELAY = 30.0  # seconds, cap for a single backoff wait
+LLM_REQUEST_DEADLINE = 120.0  # seconds, overall budget for one LLM call incl. retries
+
+
+# Hedged LLM requests: a second request when the first token is late (see utils/hedging.py)
+HEDGE_PERCENTILE = 90  # default for LLM_HEDGE_PERCENTILE: of recent times to first token
+HEDGE_MAX_PERCENT = 10  # default for LLM_HEDGE_MAX_PERCENT: of the last HEDGE_HISTORY requests that may be hedged
+HEDGE_HISTORY = 100  # requests remembered per model
+HEDGE_MIN_SAMPLES = 10  # times to first token needed before the percentile is used
+HEDGE_DEFAULT_DELAY = 8.0  # seconds, hedge delay until then
+HEDGE_MIN_DELAY = 0.5  # seconds, never hedge sooner than this
+
+
+# Resumable chat sessions, checkpointed to SQLite (see graph/checkpoint.py)
+SESSION_DB_NAME = "sessions.sqlite"
+SESSION_MAX_AGE = 7 * 24 * 60 * 60  # seconds since a session's last step
+SESSION_MAX_THREADS = 50  # sessions kept; older ones are pruned
+
+
+# Local cache of generated commit messages (see utils/message_cache.py)
+MESSAGE_CACHE_MAX_ENTRIES = 500
+MESSAGE_CACHE_MAX_BYTES = 5 * 1024 * 1024
+MESSAGE_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds since last use
+
+
+# Self-calibrating token estimator (see utils/calibration.py)
+CALIBRATION_LEARNING_RATE = 0.3  # how far each observation moves a ratio (0-1)
+CALIBRATION_MIN_RATIO = 1.0  # chars per token bounds for learned ratios
+CALIBRATION_MAX_RATIO = 8.0
+CALIBRATION_HISTORY = 200  # estimate/actual pairs kept for inspection
+
+
 # Colors and styling
 class Colors:
     BLUE = '\033[94m'
@@ -38,4 +161,174 @@ class Colors:
     DIM = '\033[2m'
     RESET = '\033[0m'
 
-    
\ No newline at end of file
+
+# Environment configuration (loaded lazily so the CLI starts without touching .env)
+@dataclass(frozen=True)
+class Settings:
+    api_key: str
+    default_model: str
+    token_limit: int
+    map_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY
+    fast_model: str = ""  # FAST_MODEL, DEFAULT_MODEL when unset
+    strong_model: str = ""  # STRONG_MODEL, DEFAULT_MODEL when unset
+    routing_fast_max_tokens: int = ROUTING_FAST_MAX_TOKENS
+    routing_strong_min_tokens: int = ROUTING_STRONG_MIN_TOKENS
+    hedge: bool = False  # LLM_HEDGE
+    reword_concurrency: int = REWORD_MAX_CONCURRENCY
+    reword_requests_per_minute: int = REWORD_REQUESTS_PER_MINUTE
+    hedge_percentile: int = HEDGE_PERCENTILE
+    hedge_max_percent: int = HEDGE_MAX_PERCENT
+
+    def tier_model(self, tier: str) -> str:
+        """Model configured for a routing tier ("fast", "default" or "strong")."""
+        model = {"fast": self.fast_model, "strong": self.strong_model}.get(tier)
+        return model or self.default_model
+
+
+# Environment variables read into Settings; daemon clients send theirs with each request
+SETTINGS_ENV_VARS = (
+    "ANTHROPIC_API_KEY",
+    "DEFAULT_MODEL",
+    "DEFAULT_TOKEN_LIMIT",
+    "MAP_REDUCE_CONCURRENCY",
+    "FAST_MODEL",
+    "STRONG_MODEL",
+    "ROUTING_FAST_MAX_TOKENS",
+    "ROUTING_STRONG_MIN_TOKENS",
+    "LLM_HEDGE",
+    "LLM_HEDGE_PERCENTILE",
+    "LLM_HEDGE_MAX_PERCENT",
+    "REWORD_CONCURRENCY",
+    "REWORD_REQUESTS_PER_MINUTE",
+)
+
+# Loads the settings of the daemon request being served (see daemon.py); unset in-process
+request_settings: ContextVar[Optional[Callable[[], Settings]]] = ContextVar("request_settings", default=None)
+
+
+def _int_setting(env: Mapping[str, str], name: str, default: int, minimum: int) -> int:
+    """Integer variable `name` of `env`, `default` when unset."""
+    value = env.get(name) or str(default)
+    try:
+        value = int(value)
+    except ValueError:
+        raise CodeLibreEnvironmentError(message=f"{name} must be an integer")
+    if value < minimum:
+        raise CodeLibreEnvironmentError(message=f"{name} must be at least {minimum}")
+    return value
+
+
+def settings_from_env(env: Mapping[str, str]) -> Settings:
+    """
+    Validates the variables of `env` into Settings.
+
+    Raises:
+        CodeLibreEnvironmentError: If a required variable is missing or invalid
+    """
+    api_key = env.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise CodeLibreEnvironmentError(message="ANTHROPIC_API_KEY undefined")
+
+    default_model = env.get("DEFAULT_MODEL")
+    if not default_model:
+        raise CodeLibreEnvironmentError(message="DEFAULT_MODEL undefined")
+
+    default_token_limit = env.get("DEFAULT_TOKEN_LIMIT")
+    if not default_token_limit:
+        raise CodeLibreEnvironmentError(message="DEFAULT_TOKEN_LIMIT undefined")
+    try:
+        token_limit = int(default_token_limit)
+    except ValueError:
+        raise CodeLibreEnvironmentError(message="DEFAULT_TOKEN_LIMIT must be an integer")
+
+    map_concurrency = _int_setting(env, "MAP_REDUCE_CONCURRENCY", MAP_REDUCE_MAX_CONCURRENCY, 1)
+    routing_fast_max_tokens = _int_setting(env, "ROUTING_FAST_MAX_TOKENS", ROUTING_FAST_MAX_TOKENS, 0)
+    routing_strong_min_tokens = _int_setting(env, "ROUTING_STRONG_MIN_TOKENS", ROUTING_STRONG_MIN_TOKENS, 1)
+    hedge_percentile = _int_setting(env, "LLM_HEDGE_PERCENTILE", HEDGE_PERCENTILE, 1)
+    if hedge_percentile > 100:
+        raise CodeLibreEnvironmentError(message="LLM_HEDGE_PERCENTILE must be at most 100")
+
+    return Settings(
+        api_key=api_key,
+        default_model=default_model,
+        token_limit=token_limit,
+        map_concurrency=map_concurrency,
+        fast_model=env.get("FAST_MODEL", ""),
+        strong_model=env.get("STRONG_MODEL", ""),
+        routing_fast_max_tokens=routing_fast_max_tokens,
+        routing_strong_min_tokens=routing_strong_min_tokens,
+        hedge=env.get("LLM_HEDGE", "").lower() in ("1", "true", "yes", "on"),
+        hedge_percentile=hedge_percentile,
+        hedge_max_percent=_int_setting(env, "LLM_HEDGE_MAX_PERCENT", HEDGE_MAX_PERCENT, 0),
+        reword_concurrency=_int_setting(env, "REWORD_CONCURRENCY", REWORD_MAX_CONCURRENCY, 1),
+        reword_requests_per_minute=_int_setting(env, "REWORD_REQUESTS_PER_MINUTE", REWORD_REQUESTS_PER_MINUTE, 1),
+    )
+
+
+def find_env_file(cwd: str) -> str:
+    """The .env in `cwd` or its closest parent, else the one python-dotenv finds next to the package ("" if none)."""
+    directory = Path(cwd).resolve()
+    for candidate in (directory, *directory.parents):
+        if (candidate / ".env").is_file():
+            return str(candidate / ".env")
+    from dotenv import find_dotenv
+
+    return find_dotenv()
+
+
+@lru_cache(maxsize=1)
+def load_settings() -> Settings:
+    """
+    Loads .env (see find_env_file) and validates the required environment variables.
+    Cached, so the environment is only read once per process.
+
+    Raises:
+        CodeLibreEnvironmentError: If a required variable is missing or invalid
+    """
+    from dotenv import load_dotenv
+
+    env_file = find_env_file(os.getcwd())
+    if env_file:
+        load_dotenv(env_file)
+    return settings_from_env(os.environ)
+
+
+def client_settings(env: Mapping[str, str], cwd: str) -> Settings:
+    """
+    Settings of a daemon client: its SETTINGS_ENV_VARS over the .env it would
+    load from `cwd`, as load_settings() does in-process.
+
+    Raises:
+        CodeLibreEnvironmentError: If a required variable is missing or invalid
+    """
+    from dotenv import dotenv_values
+
+    env_file = find_env_file(cwd)
+    values = {name: value for name, value in dotenv_values(env_file).items() if value is not None} if env_file else {}
+    return settings_from_env({**values, **env})
+
+
+def current_settings() -> Settings:
+    """Settings of the daemon request being served, load_settings() otherwise."""
+    load = request_settings.get() or load_settings
+    return load()
+
+
+def get_cache_dir() -> Path:
+    """
+    Directory for CodeLibre's local caches.
+    CODELIBRE_CACHE_DIR wins, then $XDG_CACHE_HOME/codelibre, then ~/.cache/codelibre.
+    """
+    override = os.getenv("CODELIBRE_CACHE_DIR")
+    if override:
+        return Path(override).expanduser()
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "codelibre"
+
+
+def get_daemon_socket_path() -> Path:
+    """Unix socket of the CodeLibre daemon: CODELIBRE_DAEMON_SOCKET, or daemon.sock in the cache directory."""
+    override = os.getenv("CODELIBRE_DAEMON_SOCKET")
+    if override:
+        return Path(override)
+    return get_cache_dir() / "daemon.sock"
@@ -0,0 +1,402 @@
+# File: src/codelibre/daemon.py
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Optional
+from codelibre.config import (
+    DAEMON_IDLE_TIMEOUT,
+    DAEMON_START_TIMEOUT,
+    SETTINGS_ENV_VARS,
+    get_cache_dir,
+    get_daemon_socket_path,
+    load_settings,
+)
+from codelibre.exceptions import (
+    CodeLibreEnvironmentError,
+    DaemonError,
+    ExitRequestedException,
+    LLMRequestError,
+    TruncationException,
+)
+
+# The client side (connect, relay output and input) only uses the standard library,
+# so the CLI stays a thin client. The server imports asyncio, langgraph and the
+# LLM client once at startup and keeps them warm between requests.
+#
+# Protocol: one JSON object per line over a Unix socket.
+#   client -> daemon: {"type": "generate", "diff", "use_cache", "summarize", "interactive", "cwd", "env", ...}
+#                     | {"type": "ping"} | {"type": "shutdown"}
+#   daemon -> client: {"type": "output", "text"} | {"type": "input", "prompt"} | {"type": "result", "response"}
+#                     | {"type": "error", "kind", "message"} | {"type": "pong", "pid"} | {"type": "ok"}
+#   client -> daemon (answering "input"): {"type": "input", "text"} | {"type": "eof"}
+
+
+# Errors re-raised on the client side under their original type
+ERROR_KINDS = {
+    "exit": ExitRequestedException,
+    "truncation": TruncationException,
+    "environment": CodeLibreEnvironmentError,
+    "llm": LLMRequestError,
+}
+
+# Where print() output goes while a request is being served
+_output_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("output_sink", default=None)
+
+
+def _encode(message: dict) -> bytes:
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+# ----- Client -----
+
+def connect_daemon(path: Optional[Path] = None, timeout: Optional[float] = None) -> Optional[socket.socket]:
+    """Connected socket to a running daemon, or None if there is none."""
+    path = Path(path or get_daemon_socket_path())
+    if not hasattr(socket, "AF_UNIX") or not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def request_daemon(message: dict, path: Optional[Path] = None, timeout: float = 2.0) -> Optional[dict]:
+    """Sends a one-line request (ping, shutdown) and returns the reply, or None if no daemon answers."""
+    sock = connect_daemon(path, timeout=timeout)
+    if sock is None:
+        return None
+    try:
+        with sock, sock.makefile("rb") as replies:
+            sock.sendall(_encode(message))
+            line = replies.readline()
+            return json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+
+
+def generate_via_daemon(
+    diff: str,
+    use_cache: bool = True,
+    summarize: bool = False,
+    interactive: bool = True,
+    timeout: Optional[float] = None,
+    path: Optional[Path] = None,
+    session: Optional[str] = None,
+    resume: bool = False,
+    candidates: int = 1,
+) -> Optional[str]:
+    """
+    Runs generate_commit_message in the daemon, relaying its output to stdout and
+    its prompts to the terminal. Returns None if no daemon is running, so the
+    caller can run in-process instead. `timeout` bounds the whole run.
+    The working directory and SETTINGS_ENV_VARS are sent along, so the run uses
+    this process's configuration rather than the daemon's.
+
+    Raises:
+        The daemon's ExitRequested/Truncation/Environment/LLMRequest errors, or DaemonError
+        LLMRequestError: If `timeout` passes first
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    sock = connect_daemon(path, timeout=timeout)
+    if sock is None:
+        return None
+
+    request = {
+        "type": "generate",
+        "diff": diff,
+        "use_cache": use_cache,
+        "summarize": summarize,
+        "interactive": interactive,
+        "session": session,
+        "resume": resume,
+        "candidates": candidates,
+        "cwd": os.getcwd(),
+        "env": {name: os.environ[name] for name in SETTINGS_ENV_VARS if name in os.environ},
+    }
+    # Closing the socket (e.g. on Ctrl+C or timeout) cancels the run in the daemon
+    with sock, sock.makefile("rb") as replies:
+        sock.sendall(_encode(request))
+        while True:
+            if deadline is not None:
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                line = replies.readline()
+            except TimeoutError:
+                raise LLMRequestError("Daemon did not answer in time") from None
+            if not line:
+                break
+            message = json.loads(line)
+            kind = message.get("type")
+            if kind == "output":
+                sys.stdout.write(message["text"])
+                sys.stdout.flush()
+            elif kind == "input":
+                try:
+                    reply = {"type": "input", "text": input(message["prompt"])}
+                except EOFError:
+                    reply = {"type": "eof"}
+                sock.sendall(_encode(reply))
+            elif kind == "result":
+                return message["response"]
+            elif kind == "error":
+                raise ERROR_KINDS.get(message["kind"], DaemonError)(message["message"])
+    raise DaemonError("Daemon closed the connection")
+
+
+def daemon_status(path: Optional[Path] = None) -> Optional[int]:
+    """Process id of the running daemon, or None."""
+    reply = request_daemon({"type": "ping"}, path)
+    return reply.get("pid") if reply else None
+
+
+def start_daemon(path: Optional[Path] = None) -> int:
+    """
+    Starts the daemon in the background (unless one is running) and waits until it answers.
+    Its output goes to daemon.log in the cache directory.
+
+    Raises:
+        DaemonError: If it does not answer within DAEMON_START_TIMEOUT
+    """
+    pid = daemon_status(path)
+    if pid:
+        return pid
+
+    log_path = get_cache_dir() / "daemon.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ)
+    if path:
+        env["CODELIBRE_DAEMON_SOCKET"] = str(path)
+    with open(log_path, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, "-m", "codelibre.daemon"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # not killed with the terminal that started it
+            env=env,
+        )
+
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        pid = daemon_status(path)
+        if pid:
+            return pid
+        time.sleep(0.05)
+    raise DaemonError(f"Daemon did not start, see {log_path}")
+
+
+def stop_daemon(path: Optional[Path] = None) -> bool:
+    """Asks the running daemon to exit. Returns False if none was running."""
+    return request_daemon({"type": "shutdown"}, path) is not None
+
+
+# ----- Server -----
+
+class RoutedStdout:
+    """
+    sys.stdout stand-in for the daemon: text printed while serving a request
+    goes to that request's client, anything else to the daemon's own stdout.
+    """
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def write(self, text: str) -> int:
+        sink = _output_sink.get()
+        if sink is None:
+            return self._fallback.write(text)
+        sink(text)
+        return len(text)
+
+    def flush(self) -> None:
+        if _output_sink.get() is None:
+            self._fallback.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._fallback, name)
+
+
+def error_kind(error: BaseException) -> str:
+    for kind, error_type in ERROR_KINDS.items():
+        if isinstance(error, error_type):
+            return kind
+    return "error"
+
+
+def warm_up() -> None:
+    """Imports the LLM stack, builds the clients of every model tier and compiles the graph ahead of the first request."""
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.nodes import get_llm
+
+    get_chat_app()
+    get_llm()
+    settings = load_settings()
+    for tier in ("fast", "default", "strong"):
+        get_llm(settings.tier_model(tier))
+
+
+class DaemonServer:
+    """
+    Serves generate requests over a Unix socket from one long-lived event loop,
+    so the LLM client (and its HTTP connection pool), the compiled graph and the
+    caches stay warm. Several clients can be served at once; each sees only its
+    own output. Exits after `idle_timeout` seconds without a request.
+    """
+
+    def __init__(self, path: Optional[Path] = None, idle_timeout: float = DAEMON_IDLE_TIMEOUT):
+        self.path = Path(path or get_daemon_socket_path())
+        self.idle_timeout = idle_timeout
+        self._active = 0
+        self._last_request = time.monotonic()
+
+    async def serve(self, ready: Optional[Callable[[], None]] = None) -> None:
+        import asyncio
+
+        self._stopped = asyncio.Event()
+        if self.path.exists():
+            if daemon_status(self.path):
+                raise DaemonError(f"A daemon is already listening on {self.path}")
+            self.path.unlink()  # left behind by a daemon that did not exit cleanly
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # The socket is private from the moment it is bound: other local users must
+        # never get to send requests that run with the owner's API key
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=str(self.path))
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+        original_stdout, sys.stdout = sys.stdout, RoutedStdout(sys.stdout)
+        try:
+            if ready:
+                ready()
+            while not self._stopped.is_set():
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=min(self.idle_timeout, 60))
+                except TimeoutError:
+                    if not self._active and time.monotonic() - self._last_request > self.idle_timeout:
+                        break
+        finally:
+            sys.stdout = original_stdout
+            server.close()
+            await server.wait_closed()
+            if self.path.exists():
+                self.path.unlink()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def _handle(self, reader, writer) -> None:
+        self._active += 1
+        self._last_request = time.monotonic()
+        try:
+            line = await reader.readline()
+            request = json.loads(line) if line else {}
+            kind = request.get("type")
+            if kind == "ping":
+                writer.write(_encode({"type": "pong", "pid": os.getpid()}))
+            elif kind == "shutdown":
+                writer.write(_encode({"type": "ok"}))
+                self.stop()
+            elif kind == "generate":
+                await self._generate(request, reader, writer)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._active -= 1
+            self._last_request = time.monotonic()
+            writer.close()
+
+    async def _generate(self, request: dict, reader, writer) -> None:
+        import asyncio
+        from codelibre.cli import stream_commit_message
+        from codelibre.config import client_settings, request_settings
+        from codelibre.utils.async_input import input_handler
+
+        loop = asyncio.get_running_loop()
+        loop_thread = threading.get_ident()
+        answers = asyncio.Queue()
+
+        def send(message: dict) -> None:
+            # Synchronous graph nodes print from worker threads
+            if threading.get_ident() == loop_thread:
+                writer.write(_encode(message))
+            else:
+                loop.call_soon_threadsafe(writer.write, _encode(message))
+
+        async def ask_client(prompt: str) -> str:
+            send({"type": "input", "prompt": prompt})
+            answer = await answers.get()
+            if answer is None:
+                raise EOFError
+            return answer
+
+        async def run() -> str:
+            # Set inside the task, so the context only applies to this request
+            _output_sink.set(lambda text: send({"type": "output", "text": text}))
+            input_handler.set(ask_client)
+            if "cwd" in request:
+                # Resolved on first use, so a missing variable fails the run as it would in-process
+                request_settings.set(lru_cache(maxsize=1)(partial(client_settings, request.get("env", {}), request["cwd"])))
+            return await stream_commit_message(
+                request.get("diff", ""),
+                use_cache=request.get("use_cache", True),
+                summarize=request.get("summarize", False),
+                interactive=request.get("interactive", True),
+                session=request.get("session"),
+                resume=request.get("resume", False),
+                candidates=request.get("candidates", 1),
+            )
+
+        task = asyncio.create_task(run())
+
+        async def read_answers() -> None:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    task.cancel()  # client went away (Ctrl+C): stop working for it
+                    return
+                message = json.loads(line)
+                if message.get("type") == "input":
+                    answers.put_nowait(message.get("text", ""))
+                elif message.get("type") == "eof":
+                    answers.put_nowait(None)
+
+        reading = asyncio.create_task(read_answers())
+        try:
+            response = await task
+            send({"type": "result", "response": response})
+        except asyncio.CancelledError:
+            if not task.cancelled() or asyncio.current_task().cancelling():
+                raise
+        except Exception as e:
+            send({"type": "error", "kind": error_kind(e), "message": str(e)})
+        finally:
+            reading.cancel()
+
+
+def serve_forever(path: Optional[Path] = None) -> None:
+    """Runs the daemon in the foreground until it is stopped or idles out."""
+    import asyncio
+
+    warm_up()
+    server = DaemonServer(path)
+    print(f"CodeLibre daemon {os.getpid()} listening on {server.path}", flush=True)
+    asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    serve_forever()
@@ -25,4 +25,16 @@ class CodeLibreEnvironmentError(Exception):
 class GitCommandError(Exception):
     """Raised if a Git command fails."""
     def __init__(self, message="Git command failed"):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+
+class LLMRequestError(Exception):
+    """Raised if an LLM request cannot be completed within its deadline."""
+    def __init__(self, message="LLM request failed"):
+        super().__init__(message)
+
+
+class DaemonError(Exception):
+    """Raised if the CodeLibre daemon cannot complete a request."""
+    def __init__(self, message="Daemon request failed"):
+        super().__init__(message)
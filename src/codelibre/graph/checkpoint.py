@@ -0,0 +1,283 @@
+# File: src/codelibre/graph/checkpoint.py
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS
+from codelibre.config import SESSION_DB_NAME, SESSION_MAX_AGE, SESSION_MAX_THREADS, get_cache_dir
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    created REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer keeping chat sessions in a local SQLite file, so an
+    interrupted feedback loop can be resumed (see cli --resume).
+
+    Only what resuming needs is kept: the latest checkpoint of each thread and
+    its parent (with their pending writes). Threads idle for more than
+    `max_age` seconds, and all but the `max_threads` most recent, are pruned
+    when the database is opened.
+    """
+
+    def __init__(self, path: Path, max_age: float = SESSION_MAX_AGE, max_threads: int = SESSION_MAX_THREADS):
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        self.prune(max_age, max_threads)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def prune(self, max_age: float = SESSION_MAX_AGE, max_threads: int = SESSION_MAX_THREADS) -> int:
+        """Deletes expired threads and the oldest ones beyond `max_threads`. Returns how many went."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, MAX(created) AS last FROM checkpoints GROUP BY thread_id ORDER BY last DESC"
+            ).fetchall()
+            cutoff = time.time() - max_age
+            stale = [thread for i, (thread, last) in enumerate(rows) if i >= max_threads or last < cutoff]
+            for thread in stale:
+                self._delete_thread(thread)
+        return len(stale)
+
+    def _delete_thread(self, thread_id: str) -> None:
+        self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            self._delete_thread(thread_id)
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, data, metadata_type, metadata = row
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        sends = []
+        if parent_id:
+            sends = self.conn.execute(
+                "SELECT type, value FROM writes"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ?"
+                " ORDER BY task_path, task_id, idx",
+                (thread_id, checkpoint_ns, parent_id, TASKS),
+            ).fetchall()
+
+        checkpoint = self.serde.loads_typed((type_, data))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "pending_sends": [self.serde.loads_typed(send) for send in sends]},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task, channel, self.serde.loads_typed((t, v))) for task, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = (
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints WHERE 1 = 1"
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+            tuples = [self._tuple(row[0], row[1], row[2:]) for row in rows]
+
+        count = 0
+        for item in tuples:
+            if filter and any(item.metadata.get(key) != value for key, value in filter.items()):
+                continue
+            if limit is not None and count >= limit:
+                break
+            count += 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Stores `checkpoint` with its channel values inline and drops what comes before its parent."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        data = checkpoint.copy()
+        data.pop("pending_sends", None)
+        type_, blob = self.serde.dumps_typed(data)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, blob, metadata_type, metadata_blob, time.time()),
+                )
+                keep = (checkpoint["id"], parent_id or checkpoint["id"])
+                for table in ("checkpoints", "writes"):
+                    self.conn.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (?, ?)",
+                        (thread_id, checkpoint_ns, *keep),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special writes (errors, interrupts) are replaced; regular ones are kept from the first attempt
+        special, regular = [], []
+        for index, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, index), channel, type_, blob, task_path)
+            (special if channel in WRITES_IDX_MAP else regular).append(row)
+
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+            self.conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+
+    # SQLite calls on a local file take microseconds: the async API runs them inline
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+
+@lru_cache(maxsize=1)
+def get_checkpointer() -> Optional[SqliteCheckpointer]:
+    """
+    Shared session database in the cache directory, or None if it cannot be
+    opened (sessions are then simply not resumable).
+    """
+    try:
+        return SqliteCheckpointer(get_cache_dir() / SESSION_DB_NAME)
+    except (OSError, sqlite3.Error):
+        return None
@@ -1,26 +1,56 @@
 # File: src/codelibre/graph/graph.py
+from functools import lru_cache
 from langgraph.graph import StateGraph, END 
 from codelibre.graph.state import ChatState
-from codelibre.graph.nodes import truncate_messages, ask, add_input, update_conversation_history
+from codelibre.graph.nodes import choose_model, truncate_messages, ask, add_input, update_conversation_history
+from codelibre.utils.tracing import span
 
 
-def build_chat_graph():
+def build_chat_graph(interactive: bool = True):
+    """
+    Chat graph generating a commit message from the diff in the first message.
+    Interactive graphs loop on user feedback; non-interactive ones (git hooks)
+    end after the first answer and never prompt.
+    """
     graph = StateGraph(ChatState)
 
     # Add nodes
+    graph.add_node("choose_model", choose_model)
     graph.add_node("truncate_messages", truncate_messages)
     graph.add_node("ask", ask)
+
+    graph.set_entry_point("choose_model")
+    graph.add_edge("choose_model", "truncate_messages")
+    graph.add_edge("truncate_messages", "ask")
+    if not interactive:
+        graph.add_edge("ask", END)
+        return graph
+
     graph.add_node("update_conversation_history", update_conversation_history)
     graph.add_node("add_input", add_input)
 
     # Wire it up
-    graph.set_entry_point("truncate_messages")
-    graph.add_edge("truncate_messages", "ask")
     graph.add_edge("ask", "update_conversation_history")
     graph.add_edge("update_conversation_history", "add_input")
     graph.add_conditional_edges(
         "add_input",
-        lambda state: END if not state.reiterate else "truncate_messages"
+        lambda state: END if not state.get("reiterate") else "truncate_messages"
     )
 
     return graph
+
+
+@lru_cache(maxsize=4)
+def get_chat_app(interactive: bool = True, checkpointed: bool = False):
+    """
+    Compiled chat graph, built once per process and reused for every run.
+    Checkpointed graphs save every step to the local session database
+    (see graph/checkpoint.py), so runs need a thread_id and can be resumed.
+    """
+    checkpointer = None
+    if checkpointed:
+        from codelibre.graph.checkpoint import get_checkpointer
+
+        checkpointer = get_checkpointer()
+    with span("graph.compile"):
+        return build_chat_graph(interactive).compile(checkpointer=checkpointer)
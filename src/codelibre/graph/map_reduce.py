@@ -0,0 +1,195 @@
+# File: src/codelibre/graph/map_reduce.py
+import operator
+import time
+from typing import Annotated, List, Optional, Tuple, TypedDict
+from pydantic import BaseModel
+from langchain_core.messages import SystemMessage, HumanMessage
+from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from codelibre.config import (
+    Colors,
+    LLM_REQUEST_DEADLINE,
+    MAP_REDUCE_MAX_ROUNDS,
+    MAP_SUMMARY_PROMPT,
+    current_settings,
+)
+from codelibre.graph.nodes import get_llm, get_message_cache, get_token_estimator, record_token_usage
+from codelibre.utils.diff_model import FILE_HEADER_PREFIX, parse_diff
+from codelibre.utils.diff_utils import file_diff_path, file_kind
+from codelibre.utils.estimate_tokens import MESSAGE_OVERHEAD_TOKENS, TokenEstimator
+from codelibre.utils.message_cache import message_cache_key
+from codelibre.utils.retry import retry_async
+from codelibre.utils.tracing import span, traced
+from codelibre.utils.truncation import truncate_diff
+
+
+class MapReduceState(TypedDict, total=False):
+    """
+    Map-reduce graph state. Like ChatState, nodes return only the keys they
+    change, so a step never re-validates the diff or the summaries so far.
+    """
+    diff: str  # text being summarized: the diff, then the summaries of the previous round
+    groups: List[str]
+    # (round, group index, summary), appended to concurrently by summarize_group
+    summaries: Annotated[List[Tuple[int, int, str]], operator.add]
+    digest: str
+    rounds: int
+    use_cache: bool
+
+
+class SummaryTask(BaseModel):
+    round: int
+    index: int
+    total: int
+    text: str
+    use_cache: bool = True
+
+
+def _unit_tokens(estimator: TokenEstimator, unit: str) -> float:
+    if unit.startswith(FILE_HEADER_PREFIX):
+        return estimator.text_tokens(unit, file_kind(file_diff_path(unit)))
+    return estimator.text_tokens(unit)
+
+
+def group_file_diffs(text: str, group_budget: int, estimator: Optional[TokenEstimator] = None) -> List[str]:
+    """
+    Packs a diff into groups of whole files of at most `group_budget` tokens each,
+    keeping the diff's file order. Text without file headers (summaries from an
+    earlier round) is packed by paragraph instead. A single file larger than the
+    budget is truncated to fit (see truncate_diff).
+    """
+    estimator = estimator or TokenEstimator()
+    if FILE_HEADER_PREFIX in text:
+        units = parse_diff(text).chunks()
+    else:
+        units = [paragraph + "\n\n" for paragraph in text.split("\n\n") if paragraph.strip()]
+
+    groups, current, current_tokens = [], [], 0.0
+    for unit in units:
+        tokens = _unit_tokens(estimator, unit)
+        if tokens > group_budget:
+            if unit.startswith(FILE_HEADER_PREFIX):
+                unit = truncate_diff(unit, group_budget, estimator) + "\n"
+            else:
+                unit = unit[:int(group_budget * estimator.ratio())]
+            tokens = _unit_tokens(estimator, unit)
+        if current and current_tokens + tokens > group_budget:
+            groups.append("".join(current))
+            current, current_tokens = [], 0.0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        groups.append("".join(current))
+    return groups
+
+
+def _budgets() -> Tuple[int, int]:
+    """Token budgets for one summarized group and for the final digest."""
+    settings = current_settings()
+    estimator = get_token_estimator(settings.default_model)
+    group_budget = int(
+        settings.token_limit - estimator.message_tokens(MAP_SUMMARY_PROMPT) - MESSAGE_OVERHEAD_TOKENS
+    )
+    # The digest replaces the diff in the chat, which also needs room for feedback rounds
+    return max(group_budget, 1), settings.token_limit // 2
+
+
+def split_diff(state: MapReduceState) -> dict:
+    """Splits the text to summarize into groups that each fit one request."""
+    group_budget, _ = _budgets()
+    estimator = get_token_estimator(current_settings().default_model)
+    return {"groups": group_file_diffs(state["diff"], group_budget, estimator), "rounds": state.get("rounds", 0) + 1}
+
+
+def fan_out(state: MapReduceState) -> List[Send]:
+    """Sends every group to its own summarize_group task; LangGraph runs them concurrently."""
+    return [
+        Send("summarize_group", SummaryTask(
+            round=state["rounds"],
+            index=index,
+            total=len(state["groups"]),
+            text=group,
+            use_cache=state.get("use_cache", True)
+        ))
+        for index, group in enumerate(state["groups"])
+    ]
+
+
+@traced("node.summarize_group")
+async def summarize_group(task: SummaryTask) -> dict:
+    """
+    Summarizes one group with the LLM, under the same retry policy and deadline
+    as the ask node. Summaries are kept in the message cache, so a re-run on a
+    mostly unchanged diff only pays for the groups that changed.
+    """
+    model = current_settings().default_model
+    cache_key = message_cache_key(task.text, MAP_SUMMARY_PROMPT, model, [])
+    summary = get_message_cache().get(cache_key) if task.use_cache else None
+
+    if summary is None:
+        messages = [SystemMessage(content=MAP_SUMMARY_PROMPT), HumanMessage(content=task.text)]
+        with span("llm.summary_request"):
+            response = await retry_async(
+                lambda: get_llm().ainvoke(messages),
+                deadline=time.monotonic() + LLM_REQUEST_DEADLINE,
+            )
+        summary = str(response.content).strip()
+        if not summary:
+            raise ValueError("LLM returned an empty summary")
+        get_message_cache().put(cache_key, summary)
+        record_token_usage(model, messages, response)
+
+    print(f"{Colors.DIM}  ✓ Summarized part {task.index + 1}/{task.total}{Colors.RESET}")
+    return {"summaries": [(task.round, task.index, summary)]}
+
+
+def collect_summaries(state: MapReduceState) -> dict:
+    """Joins this round's summaries, in diff order, into the digest."""
+    current = sorted(s for s in state["summaries"] if s[0] == state["rounds"])
+    digest = "\n\n".join(summary for _, _, summary in current)
+    return {"digest": digest, "diff": digest}
+
+
+def summaries_fit(state: MapReduceState) -> str:
+    """Ends once the digest fits; otherwise the summaries are summarized again."""
+    _, digest_budget = _budgets()
+    estimator = get_token_estimator(current_settings().default_model)
+    if (
+        estimator.text_tokens(state["digest"]) <= digest_budget
+        or len(state["groups"]) <= 1
+        or state["rounds"] >= MAP_REDUCE_MAX_ROUNDS
+    ):
+        return END
+    return "split_diff"
+
+
+def build_map_reduce_graph():
+    graph = StateGraph(MapReduceState)
+
+    # Add nodes
+    graph.add_node("split_diff", split_diff)
+    graph.add_node("summarize_group", summarize_group)
+    graph.add_node("collect_summaries", collect_summaries)
+
+    # Wire it up: split -> summarize each group in parallel -> collect -> (again, if too long)
+    graph.set_entry_point("split_diff")
+    graph.add_conditional_edges("split_diff", fan_out, ["summarize_group"])
+    graph.add_edge("summarize_group", "collect_summaries")
+    graph.add_conditional_edges("collect_summaries", summaries_fit, ["split_diff", END])
+
+    return graph
+
+
+@traced("map_reduce")
+async def summarize_diff(diff: str, use_cache: bool = True) -> str:
+    """
+    Map step for diffs far over DEFAULT_TOKEN_LIMIT: summarizes file groups
+    concurrently (at most MAP_REDUCE_CONCURRENCY requests at once) and returns
+    the joined summaries. The chat graph then writes the commit message from them.
+    """
+    app = build_map_reduce_graph().compile()
+    final = await app.ainvoke(
+        MapReduceState(diff=diff, use_cache=use_cache, summaries=[]),
+        config={"max_concurrency": current_settings().map_concurrency},
+    )
+    return final["digest"]
@@ -1,158 +1,384 @@
 # File: src/codelibre/graph/nodes.py
-import os
-from dotenv import load_dotenv
+import asyncio
+import time
+from contextlib import aclosing
+from functools import lru_cache
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_anthropic import ChatAnthropic
-from codelibre.config import Colors
-from codelibre.graph.state import ChatState
-from codelibre.exceptions import ExitRequestedException, CodeLibreEnvironmentError
+from langgraph.constants import TAG_NOSTREAM
+from codelibre.config import (
+    COMMIT_MAX_TOKENS,
+    COMMIT_STOP_SEQUENCES,
+    Colors,
+    DIFF_PREFIX,
+    LLM_MAX_ATTEMPTS,
+    LLM_REQUEST_DEADLINE,
+    MAP_DIGEST_PREFIX,
+    PROMPT_CACHE_CONTROL,
+    current_settings,
+)
+from codelibre.graph.state import ChatState, replace_messages
+from codelibre.exceptions import ExitRequestedException, LLMRequestError
+from codelibre.utils.truncation import fit_messages_to_budget
+from codelibre.utils.message_cache import MessageCache, message_cache_key
+from codelibre.utils.calibration import TokenCalibration
+from codelibre.utils.estimate_tokens import iter_content_text
+from codelibre.utils.git_helpers import complete_commit_line
+from codelibre.utils.hedging import HedgedLLM, LatencyHistory
+from codelibre.utils.model_routing import route_model
+from codelibre.utils.async_input import ainput
+from codelibre.utils.retry import describe_error, retry_async
+from codelibre.utils.tracing import span, traced
 
 
+def get_llm(model: str = ""):
+    """
+    ChatAnthropic client for `model` (DEFAULT_MODEL if empty) under the current
+    settings' API key, built on first use and reused afterwards. Deferred so
+    that importing this module never reads the environment or pulls in the
+    Anthropic SDK.
+    """
+    settings = current_settings()
+    return _chat_client(model or settings.default_model, settings.api_key)
 
-load_dotenv()
-api_key = os.getenv("ANTHROPIC_API_KEY")
-if not api_key:
-    raise CodeLibreEnvironmentError(message="ANTHROPIC_API_KEY undefined")
 
-default_model = os.getenv("DEFAULT_MODEL")
-if not default_model:
-    raise CodeLibreEnvironmentError(message="DEFAULT_MODEL undefined")
+@lru_cache(maxsize=None)
+def _chat_client(model: str, api_key: str):
+    """One client (and HTTP connection pool) per model and API key."""
+    from langchain_anthropic import ChatAnthropic
 
-default_token_limit = os.getenv("DEFAULT_TOKEN_LIMIT")
-if not default_token_limit:
-    raise CodeLibreEnvironmentError(message="DEFAULT_TOKEN_LIMIT undefined")
-else:
-    default_token_limit = int(default_token_limit)
+    return ChatAnthropic(
+        model=model,
+        anthropic_api_key=api_key,
+        max_tokens=500,
+        temperature=0.7,
+        max_retries=0  # retries are handled by ask() under a single deadline
+    )
 
 
-llm = ChatAnthropic(
-    model=default_model,
-    anthropic_api_key=api_key,
-    max_tokens=500,
-    temperature=0.7
-)
+@lru_cache(maxsize=1)
+def get_message_cache() -> MessageCache:
+    """Shared on-disk cache of generated commit messages."""
+    return MessageCache()
+
+
+@lru_cache(maxsize=None)
+def get_token_estimator(model: str) -> TokenCalibration:
+    """Token estimator calibrated from past API usage for `model`."""
+    return TokenCalibration(model)
+
+
+@lru_cache(maxsize=None)
+def get_latency_history(model: str) -> LatencyHistory:
+    """Recent times to first token for `model`, used to decide when to hedge a request."""
+    return LatencyHistory(model)
+
+
+def record_token_usage(model: str, messages, response) -> None:
+    """Feeds the input token count reported with a response back into calibration."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    actual_tokens = usage.get("input_tokens")
+    if not actual_tokens:
+        return
+    estimator = get_token_estimator(model)
+    if estimator.record(messages, actual_tokens) is not None:
+        estimator.save()
+
+
+def with_cache_breakpoint(message):
+    """
+    Copy of `message` whose last content block carries an Anthropic cache_control
+    breakpoint, so the prompt up to and including it is cached between requests.
+    """
+    content = message.content
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = [block if isinstance(block, dict) else {"type": "text", "text": block} for block in content]
+    if not blocks:
+        return message
+    blocks[-1] = {**blocks[-1], "cache_control": PROMPT_CACHE_CONTROL}
+    return message.model_copy(update={"content": blocks})
+
+
+def prompt_cache_read(response) -> bool:
+    """True if the response reports input tokens read from the prompt cache."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    return bool(details.get("cache_read"))
+
+
+def state_model(state: ChatState) -> str:
+    """Model the run was routed to, DEFAULT_MODEL for states from before routing."""
+    return state.get("model") or current_settings().default_model
+
+
+def conversation_cache_key(state: ChatState, model: str) -> str:
+    """Cache key for the next response: diff, system prompt, model and feedback so far."""
+    messages = state.get("messages", [])
+    diff = messages[0].content if messages else ""
+    feedback = [m.content for m in messages[1:] if isinstance(m, HumanMessage)]
+    return message_cache_key(str(diff), state.get("system_prompt", ""), model, [str(f) for f in feedback])
+
+
+# Candidate requests run concurrently; their tokens are not streamed to the terminal, where they would interleave
+CANDIDATE_CONFIG = {"tags": [TAG_NOSTREAM]}
+
+
+async def generate_commit_line(llm, messages, config=None):
+    """
+    Streams one commit message from `llm`, within COMMIT_MAX_TOKENS and stopping at
+    the first newline. The stream is closed (ending generation) as soon as a
+    complete `<prefix>: <summary>` line has arrived, for models that keep going.
+    Returns the merged response chunks and the message text.
+    """
+    for stop in (COMMIT_STOP_SEQUENCES, None):
+        options = {"stop": stop, "max_tokens": COMMIT_MAX_TOKENS}
+        if config:
+            options["config"] = config
+        response = None
+        async with aclosing(llm.astream(messages, **options)) as stream:
+            async for chunk in stream:
+                response = chunk if response is None else response + chunk
+                line = complete_commit_line("".join(iter_content_text(response.content)))
+                if line is not None:
+                    return response, line
+        text = "".join(iter_content_text(response.content)).strip() if response is not None else ""
+        # An answer opening with a blank line is cut to nothing by the stop sequence: ask once without it
+        if text or stop is None:
+            return response, text
 
 
+@traced("node.choose_model")
+def choose_model(state: ChatState) -> ChatState:
+    """
+    Routes the run to a model tier from the diff in the first message
+    (see utils/model_routing.py). Runs once per session: feedback rounds and
+    resumed sessions keep the model they started with.
+    """
+    if state.get("model"):
+        return {}
+    messages = state.get("messages", [])
+    diff = str(messages[0].content) if messages else ""
+    diff = diff[len(DIFF_PREFIX):] if diff.startswith(DIFF_PREFIX) else diff
+    route = route_model(diff, current_settings(), summarized=diff.startswith(MAP_DIGEST_PREFIX))
+    print(f"{Colors.DIM}  Model: {route.model} ({route.tier} tier, {route.reason}){Colors.RESET}")
+    return {"model": route.model, "model_tier": route.tier}
+
+
+def print_candidates(candidates, requested):
+    """
+    Numbered list of candidate messages, to pick from at the feedback prompt.
+    Duplicates were merged: if a single message is left it is shown without a
+    number, as add_input only offers picking between several.
+    """
+    if len(candidates) == 1:
+        print(f"{Colors.GREEN} ✓ All {requested} candidates were identical{Colors.RESET}")
+        print(f"{Colors.CYAN}{candidates[0]}{Colors.RESET}")
+        return
+    duplicates = f", {requested - len(candidates)} duplicate(s) merged" if requested > len(candidates) else ""
+    print(f"{Colors.GREEN} ✓ {len(candidates)} candidate(s){duplicates}{Colors.RESET}")
+    for number, candidate in enumerate(candidates, 1):
+        print(f"{Colors.CYAN}  [{number}] {candidate}{Colors.RESET}")
+
+
+@traced("node.truncate_messages")
 def truncate_messages(state: ChatState) -> ChatState:
     """
-    TODO: Implement message truncation logic.
-    For now, this is a placeholder that does nothing.
+    Fits the conversation into DEFAULT_TOKEN_LIMIT before it is sent to the LLM.
+    Old feedback rounds are dropped and diff hunks compressed or dropped as needed,
+    while the system prompt and the latest feedback are kept intact.
+    Sizes use the chars-per-token ratios learned from earlier API responses.
+    Raises TruncationException if the conversation cannot be made to fit.
     """
-    return state
+    settings = current_settings()
+    messages = state.get("messages", [])
+    fitted = fit_messages_to_budget(
+        messages,
+        state.get("system_prompt", ""),
+        settings.token_limit,
+        get_token_estimator(state_model(state))
+    )
+    # Nothing dropped and the diff untouched: leave the conversation as it is
+    if len(fitted) == len(messages) and (not fitted or fitted[0] is messages[0]):
+        return {}
+    return {"messages": replace_messages(fitted)}
 
 
-def add_input(state: ChatState) -> ChatState:
+@traced("node.add_input")
+async def add_input(state: ChatState) -> ChatState:
     """
     Node to handle user queries.
     Adds human follow-up input if present, then runs the next LLM step with full memory context.
     Each input is treated as a new message in the chain (maintaining conversation context).
+    A number picks one of the candidates listed by ask and ends the loop.
     """
+    candidates = state.get("candidates") or []
+    pick = f", 1-{len(candidates)} to pick a candidate" if len(candidates) > 1 else ""
     prompt = ""
     while not prompt:
         try:
             # Create a visually prominent input prompt
             input_text = (
                 f"\n{Colors.CYAN}{Colors.BOLD} INPUT REQUIRED {Colors.RESET}\n"
-                f"{Colors.DIM}{Colors.BOLD}→ Respond (or 'y' to continue, 'n' to exit): {Colors.RESET}"
+                f"{Colors.DIM}{Colors.BOLD}→ Respond (or 'y' to continue{pick}, 'n' to exit): {Colors.RESET}"
             )
-            prompt = input(input_text).strip()
-            
+            prompt = (await ainput(input_text)).strip()
+
+            if pick and prompt.isdigit() and 1 <= int(prompt) <= len(candidates):
+                print(f"{Colors.GREEN}✓ Using candidate {prompt}{Colors.RESET}")
+                return {"response": candidates[int(prompt) - 1], "reiterate": False}
             if prompt.lower() in ['y', 'yes']:
                 print(f"{Colors.GREEN}✓ Continuing...{Colors.RESET}")
-                return ChatState(
-                    messages=state.messages,
-                    system_prompt=state.system_prompt,
-                    reiterate=False
-                )
+                return {"reiterate": False}
             elif prompt.lower() in ['n', 'no', 'exit', 'quit']:
                 raise ExitRequestedException("User requested exit")
-            elif prompt:
-                state.reiterate = True
-                break
         except (EOFError, KeyboardInterrupt):
             print(f"\n{Colors.RED}✗ Interrupted by user{Colors.RESET}")
             raise ExitRequestedException("User interrupted")
 
-    state.messages.append(HumanMessage(content="Feedback: " + prompt))
-    state.response = ""  # reset response for new query
-    return ChatState(
-        messages=state.messages,
-        system_prompt=state.system_prompt,
-        response=state.response,
-        reiterate=True  # indicate we need to ask LLM again
-    )
+    return {
+        "messages": [HumanMessage(content="Feedback: " + prompt)],
+        "response": "",  # reset response for new query
+        "candidates": [],  # feedback refines a single message
+        "reiterate": True,  # indicate we need to ask LLM again
+    }
 
 
+@traced("node.update_conversation_history")
 def update_conversation_history(state: ChatState) -> ChatState:
     """
     Updates the conversation history with the AI response if one exists.
     This should be called before asking for new input to maintain context.
     """
-    if state.response and state.response.strip():
+    response = state.get("response", "")
+    messages = state.get("messages", [])
+    if response and response.strip():
         # Only add AI message if it's not already the last message
-        if not state.messages or not isinstance(state.messages[-1], AIMessage):
-            state.messages.append(AIMessage(content=state.response))
-    
-    return ChatState(
-        messages=state.messages,
-        system_prompt=state.system_prompt,
-        response=state.response,
-        reiterate=state.reiterate
-    )
+        if not messages or not isinstance(messages[-1], AIMessage):
+            return {"messages": [AIMessage(content=response)]}
+    return {}
 
 
-def ask(state: ChatState) -> ChatState:
+@traced("node.ask")
+async def ask(state: ChatState) -> ChatState:
     """
     Calls the LLM with the current conversation state,
     ensuring the system prompt is passed only at the top level.
-    Includes retry logic for API overload errors.
+    Rate limits, overload, transient server and connection errors are retried
+    with jittered exponential backoff (honoring Retry-After), all within
+    LLM_REQUEST_DEADLINE. Cancelling the task aborts the request immediately.
+    Responses are stored in the local message cache and replayed from it
+    when the same diff and feedback come up again (unless use_cache is off).
+    The system prompt and diff carry prompt cache breakpoints, so feedback
+    rounds read them from Anthropic's cache; hits and misses are counted.
+    The answer is streamed and stops at the first complete commit line
+    (see generate_commit_line). With LLM_HEDGE on, a request whose first token
+    is late is hedged with a second one (see utils/hedging.py); the extra
+    requests and their input tokens are counted.
+    With candidate_count above one, the first call generates that many
+    messages concurrently and lists them to pick from (see add_input).
     """
-    import time
-    from anthropic import APIStatusError
+    from anthropic import APIStatusError  # deferred like the client itself (see get_llm)
 
     # Prepare full prompt: system message + conversation history
+    conversation = state.get("messages", [])
+    system_prompt = state.get("system_prompt", "")
     messages = []
-    if state.system_prompt:
+    if system_prompt:
         # Initialize with system prompt if not found in context
-        if not any(isinstance(msg, SystemMessage) for msg in state.messages):
-            messages.append(SystemMessage(content=state.system_prompt))
+        if not any(isinstance(msg, SystemMessage) for msg in conversation):
+            messages.append(with_cache_breakpoint(SystemMessage(content=system_prompt)))
 
-    messages.extend(state.messages)  # the actual conversation history
+    messages.extend(conversation)  # the actual conversation history
 
-    # Retry logic for API overload
-    max_retries = 3
-    base_delay = 2  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"\n{Colors.BLUE}🤖 Asking AI...{Colors.RESET}")
-            response = llm.invoke(messages)
-            
-            if not response or not getattr(response, "content", "").strip():
-                raise ValueError("LLM returned an empty response")
-            
-            print(f"{Colors.GREEN} ✓ AI response{Colors.RESET}")
-            return ChatState(
-                messages=state.messages,
-                system_prompt=state.system_prompt,
-                response=response.content,
-                reiterate=False 
-            )
-            
-        except APIStatusError as e:
-            error_details = getattr(e, 'body', {}) or {}
-            error_type = error_details.get('error', {}).get('type', 'unknown')
-            
-            if error_type == 'overloaded_error' and attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)  # exponential backoff
-                print(f"{Colors.CYAN}⚠️  API is overloaded. Retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries}){Colors.RESET}")
-                time.sleep(delay)
-                continue
+    # Cache the prompt through the diff; later feedback rounds only pay for what follows it
+    if conversation:
+        messages[len(messages) - len(conversation)] = with_cache_breakpoint(conversation[0])
+
+    # Several candidates on the first call only; feedback rounds refine the message
+    count = 1 if any(isinstance(msg, AIMessage) for msg in conversation) else state.get("candidate_count", 1)
+
+    # Replay previously generated messages for the exact same conversation
+    model = state_model(state)
+    cache_key = conversation_cache_key(state, model if count == 1 else f"{model} x{count}")
+    if state.get("use_cache", True):
+        cached = get_message_cache().get(cache_key)
+        if cached:
+            print(f"\n{Colors.BLUE}⚡ Using cached response{Colors.RESET}")
+            candidates = cached.splitlines()
+            if count == 1:
+                print(f"{Colors.CYAN}{cached}{Colors.RESET}")
+                return {"response": cached, "reiterate": False}
+            print_candidates(candidates, count)
+            return {"response": candidates[0], "candidates": candidates, "reiterate": False}
+
+    def announce_retry(attempt, delay, error):
+        print(
+            f"{Colors.CYAN}⚠️  {describe_error(error)}. Retrying in {delay:.1f} seconds... "
+            f"(attempt {attempt + 1}/{LLM_MAX_ATTEMPTS}){Colors.RESET}"
+        )
+
+    def announce_hedge():
+        print(f"{Colors.CYAN}⚠️  First token is late, sending a second request...{Colors.RESET}")
+
+    settings = current_settings()
+    llm = get_llm(model)
+    if settings.hedge:
+        # The second request is not streamed, where its tokens would mix with the first one's
+        llm = HedgedLLM(
+            llm, get_latency_history(model), settings.hedge_percentile, settings.hedge_max_percent, announce_hedge,
+            hedge_tags=[TAG_NOSTREAM],
+        )
+
+    async def generate(config=None):
+        return await retry_async(
+            lambda: generate_commit_line(llm, messages, config),
+            deadline=time.monotonic() + LLM_REQUEST_DEADLINE,
+            on_retry=announce_retry,
+        )
+
+    print(f"\n{Colors.BLUE}🤖 Asking AI...{Colors.RESET}")
+    try:
+        with span("llm.request"):
+            if count == 1:
+                results = [await generate()]
             else:
-                raise
-        except Exception as e:
-            print(f"{Colors.RED}✗ Unexpected error: {str(e)}{Colors.RESET}")
-            raise
-    
-    # This should never be reached, but just in case
-    raise RuntimeError("Max retries exceeded for API calls")
\ No newline at end of file
+                results = await asyncio.gather(*(generate(CANDIDATE_CONFIG) for _ in range(count)), return_exceptions=True)
+                failures = [result for result in results if isinstance(result, Exception)]
+                results = [result for result in results if not isinstance(result, BaseException)]
+                if not results:
+                    raise failures[0]
+    except (APIStatusError, LLMRequestError):
+        raise
+    except Exception as e:
+        print(f"{Colors.RED}✗ Unexpected error: {str(e)}{Colors.RESET}")
+        raise
+
+    candidates = list(dict.fromkeys(text for _, text in results if text))
+    if not candidates:
+        raise ValueError("LLM returned an empty response")
+
+    response = results[0][0]
+    if count == 1:
+        if isinstance(llm, HedgedLLM) and llm.hedge_won:
+            print(f"{Colors.CYAN}{candidates[0]}{Colors.RESET}")  # answered by the unstreamed request
+        print(f"{Colors.GREEN} ✓ AI response{Colors.RESET}")
+    else:
+        print_candidates(candidates, count)
+    get_message_cache().put(cache_key, "\n".join(candidates))
+    record_token_usage(model, messages, response)
+    cache_hits = sum(prompt_cache_read(result) for result, _ in results)
+    update = {
+        "response": candidates[0],
+        "reiterate": False,
+        "prompt_cache_hits": cache_hits,
+        "prompt_cache_misses": len(results) - cache_hits,
+    }
+    if count > 1:
+        update["candidates"] = candidates
+    if isinstance(llm, HedgedLLM) and llm.hedged:
+        # A cancelled request is still billed for its input
+        usage = getattr(response, "usage_metadata", None) or {}
+        update["hedged_requests"] = llm.hedged
+        update["hedged_input_tokens"] = llm.hedged * usage.get("input_tokens", 0)
+    return update
@@ -1,14 +1,55 @@
 # File: src/codelibre/graph/state.py
-from pydantic import BaseModel, Field
-from typing import List
-from langchain_core.messages import BaseMessage
-
-
-class ChatState(BaseModel):
-    messages: List[BaseMessage] = Field(default_factory=list)
-    system_prompt: str = ""
-    response: str = ""
-    reiterate: bool = False
-    
-    class Config:
-        arbitrary_types_allowed = True  # Needed for BaseMessage
\ No newline at end of file
+import operator
+from typing import Annotated, List, TypedDict
+from langchain_core.messages import BaseMessage, RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+
+class Conversation(list):
+    """The messages list owned by a graph run's messages channel, which append_messages extends in place."""
+
+
+def append_messages(current: List[BaseMessage], update: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Reducer for ChatState.messages: nodes return only the messages they add.
+    An update starting with RemoveMessage(id=REMOVE_ALL_MESSAGES) replaces the
+    whole conversation instead (see replace_messages).
+
+    The list passed in with the input state is copied once into a Conversation;
+    later updates extend that in place, so a feedback round costs the same
+    however long the conversation is. The states streamed by a run therefore
+    share one list: copy `messages` to keep an earlier step's.
+    """
+    if update and isinstance(update[0], RemoveMessage) and update[0].id == REMOVE_ALL_MESSAGES:
+        return Conversation(update[1:])
+    if isinstance(current, Conversation):
+        current.extend(update)
+        return current
+    return Conversation(current + update)
+
+
+def replace_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """A messages update that replaces the conversation, e.g. after truncation."""
+    return [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]
+
+
+class ChatState(TypedDict, total=False):
+    """
+    Chat graph state. Nodes return partial updates holding only the keys they
+    change, so a step never copies or re-validates the conversation.
+    """
+    messages: Annotated[List[BaseMessage], append_messages]
+    system_prompt: str
+    response: str
+    reiterate: bool
+    use_cache: bool  # read commit messages from the local cache
+    candidate_count: int  # messages to generate on the first call (--candidates)
+    candidates: List[str]  # the messages generated, to pick from at the feedback prompt
+    model: str  # model the run was routed to (see choose_model)
+    model_tier: str  # its routing tier: "fast", "default" or "strong"
+    # LLM calls that read the system prompt and diff from Anthropic's prompt cache; nodes return increments
+    prompt_cache_hits: Annotated[int, operator.add]
+    prompt_cache_misses: Annotated[int, operator.add]
+    # Second requests sent for LLM calls whose first token was late, and the input tokens they cost
+    hedged_requests: Annotated[int, operator.add]
+    hedged_input_tokens: Annotated[int, operator.add]
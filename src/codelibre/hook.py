@@ -0,0 +1,178 @@
+# File: src/codelibre/hook.py
+import io
+import os
+import shlex
+import sys
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import List, Optional
+from codelibre.config import DIFF_READ_BUDGET_FACTOR, HOOK_TIME_BUDGET, load_settings
+from codelibre.exceptions import SanitizationError
+from codelibre.utils.compact_diff import compact_diff
+from codelibre.utils.fallback_message import fallback_commit_message
+from codelibre.utils.git_helpers import run_git_command, sanitize_commit_message
+from codelibre.utils.file_ranking import load_rules, select_files
+from codelibre.utils.git_session import GitSession, find_worktree_root
+from codelibre.utils.heuristics import trivial_commit_message
+
+
+HOOK_NAME = "prepare-commit-msg"
+HOOK_MARKER = "# Installed by codelibre install-hook"
+
+# Commit message sources for which the user already provided a message
+SKIP_SOURCES = {"message", "merge", "squash", "commit"}
+
+
+def hook_time_budget() -> float:
+    """Wall-clock budget for the hook: CODELIBRE_HOOK_BUDGET seconds, or HOOK_TIME_BUDGET."""
+    try:
+        return float(os.getenv("CODELIBRE_HOOK_BUDGET", HOOK_TIME_BUDGET))
+    except ValueError:
+        return HOOK_TIME_BUDGET
+
+
+def log(message: str) -> None:
+    print(f"codelibre: {message}", file=sys.stderr)
+
+
+def has_message(content: str) -> bool:
+    """True if a commit message file already holds text other than comments."""
+    return any(line.strip() and not line.startswith("#") for line in content.splitlines())
+
+
+def ask_llm(diff: str, timeout: float, use_cache: bool = True) -> str:
+    """
+    Non-interactive generation bounded by `timeout` seconds, through the daemon
+    if one is running. Nothing is printed to the terminal.
+
+    Raises:
+        TimeoutError or LLMRequestError: If no answer arrives in time
+    """
+    import asyncio
+    from codelibre.cli import stream_commit_message
+    from codelibre.daemon import generate_via_daemon
+
+    deadline = time.monotonic() + timeout
+    with redirect_stdout(io.StringIO()):
+        response = generate_via_daemon(diff, use_cache=use_cache, interactive=False, timeout=timeout)
+        if response is not None:
+            return response
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError
+        return asyncio.run(asyncio.wait_for(
+            stream_commit_message(diff, use_cache=use_cache, interactive=False),
+            remaining,
+        ))
+
+
+def hook_message(
+    use_cache: bool = True,
+    allow_fallback: bool = True,
+    budget: Optional[float] = None,
+    heuristics: bool = True,
+) -> Optional[str]:
+    """
+    Commit message for the staged changes within `budget` seconds: a local one for
+    trivial changes (see utils/heuristics.py), else the LLM's if it answers in time,
+    otherwise one built locally from the file list (unless allow_fallback is off).
+    The budget covers reading the staged diff too: git is stopped when it runs out.
+    None if nothing is staged or no message is available.
+    """
+    deadline = time.monotonic() + (hook_time_budget() if budget is None else budget)
+    session = GitSession()
+    try:
+        token_limit = load_settings().token_limit
+    except Exception as e:
+        log(f"{e}, not asking the AI")
+        token_limit = None
+
+    staged = session.staged_diff(
+        None if token_limit is None else token_limit * DIFF_READ_BUDGET_FACTOR,
+        timeout=deadline - time.monotonic(),
+    )
+    if staged.timed_out:
+        log("staged changes not read in time, not asking the AI")
+        token_limit = None
+    if not staged.changes:
+        return None
+
+    trivial = trivial_commit_message(staged) if heuristics and not staged.timed_out else None
+    if trivial:
+        return trivial.message
+
+    if token_limit is not None:
+        try:
+            diff = compact_diff(staged.text).strip()
+            diff, _ = select_files(diff, token_limit, load_rules(find_worktree_root(session.cwd)))
+            return sanitize_commit_message(ask_llm(diff, deadline - time.monotonic(), use_cache))
+        except (TimeoutError, SanitizationError) as e:
+            log(f"no usable AI answer in time{': ' + str(e) if str(e) else ''}")
+        except Exception as e:
+            log(f"AI request failed: {e}")
+
+    if not allow_fallback:
+        return None
+    try:
+        # File names keep their case and punctuation; the message must not
+        return sanitize_commit_message(fallback_commit_message(staged.changes))
+    except SanitizationError:
+        return None
+
+
+def run_hook(args: List[str], use_cache: bool = True, heuristics: bool = True) -> int:
+    """
+    prepare-commit-msg entry point: `codelibre hook <message file> [source] [sha]`.
+    Writes the generated message above git's template comments. Never prompts
+    and never fails the commit; returns the hook's exit status (always 0).
+    """
+    args = list(args)
+    allow_fallback = "--no-fallback" not in args
+    args = [arg for arg in args if arg != "--no-fallback"]
+    if not args:
+        log("usage: codelibre hook <message file> [source] [sha]")
+        return 0
+
+    message_file = Path(args[0])
+    source = args[1] if len(args) > 1 else ""
+    if source in SKIP_SOURCES:
+        return 0
+
+    try:
+        content = message_file.read_text(encoding="utf-8") if message_file.exists() else ""
+        if has_message(content):
+            return 0
+        message = hook_message(use_cache=use_cache, allow_fallback=allow_fallback, heuristics=heuristics)
+        if message:
+            message_file.write_text(f"{message}\n{content}", encoding="utf-8")
+    except Exception as e:
+        log(f"left the commit message untouched: {e}")
+    return 0
+
+
+def install_hook(force: bool = False, cwd: Optional[str] = None) -> Path:
+    """
+    Installs the prepare-commit-msg hook for the current repository
+    (honoring core.hooksPath). A hook not written by CodeLibre is only
+    replaced with force.
+
+    Raises:
+        FileExistsError: If another hook is installed and force is off
+        GitCommandError: If this is not a git repository
+    """
+    hooks_dir = run_git_command(["rev-parse", "--git-path", "hooks"], cwd=cwd).stdout.strip()
+    path = Path(cwd or os.getcwd()) / hooks_dir / HOOK_NAME
+    if path.exists() and HOOK_MARKER not in path.read_text(encoding="utf-8", errors="replace") and not force:
+        raise FileExistsError(f"{path} already exists; use --force to replace it")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        "#!/bin/sh\n"
+        f"{HOOK_MARKER}\n"
+        f"{shlex.quote(sys.executable)} -m codelibre hook \"$@\" < /dev/null\n"
+        "exit 0\n",
+        encoding="utf-8",
+    )
+    path.chmod(0o755)
+    return path
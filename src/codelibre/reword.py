@@ -0,0 +1,339 @@
+# File: src/codelibre/reword.py
+import io
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional
+from codelibre.config import BASE_TEMPLATE, DIFF_READ_BUDGET_FACTOR, DIFF_READ_CHUNK_SIZE, SYSTEM_PROMPT, Colors, load_settings
+from codelibre.exceptions import CodeLibreEnvironmentError, GitCommandError
+from codelibre.utils.compact_diff import compact_diff
+from codelibre.utils.diff_utils import FILE_HEADER_PREFIX
+from codelibre.utils.estimate_tokens import CHARS_PER_TOKEN, estimate_text_tokens
+from codelibre.utils.file_ranking import load_rules, select_files
+from codelibre.utils.git_helpers import (
+    StagedDiff,
+    iter_file_diffs,
+    parse_raw_status,
+    run_git_command,
+    sanitize_commit_message,
+)
+from codelibre.utils.git_session import find_worktree_root
+from codelibre.utils.heuristics import trivial_commit_message
+from codelibre.utils.model_routing import route_model
+from codelibre.utils.retry import RateLimiter
+
+
+# One record per commit: fields separated by US, the message ended by GS, then the raw status and patch
+RECORD_START = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+MESSAGE_END = "\x1d"
+LOG_FORMAT = "--format=%x1e%H%x1f%T%x1f%P%x1f%an%x1f%ae%x1f%ad%x1f%B%x1d"
+LOG_COMMAND = ["git", "log", "--reverse", "--topo-order", "--no-color", "--no-ext-diff", "-M", "--patch-with-raw", "--date=raw"]
+
+
+@dataclass
+class RangeCommit:
+    """One commit of the range being reworded, with its changes as a StagedDiff."""
+    sha: str
+    tree: str
+    parents: List[str]
+    author_name: str
+    author_email: str
+    author_date: str  # "<seconds> <offset>", as git's --date=raw
+    message: str
+    changes: StagedDiff
+
+    @property
+    def subject(self) -> str:
+        return self.message.strip().split("\n", 1)[0]
+
+
+@dataclass
+class Reworded:
+    """The new message of a commit, and where it came from: "ai", "cached", "heuristic", "kept" or "failed"."""
+    commit: RangeCommit
+    message: str
+    source: str
+    error: str = ""
+
+
+class _RecordStream:
+    """
+    Binary stream over one commit of a streamed `git log`, starting at its
+    first line: readline() returns b"" once the next record starts, and keeps
+    that record's first line in `next`.
+    """
+
+    def __init__(self, stream: BinaryIO, first: bytes):
+        self._stream = stream
+        self._pending = first  # returned before reading on, never taken for the next record
+        self._at_line_start = False
+        self.next = b""
+
+    def unread(self, piece: bytes) -> None:
+        self._pending = piece
+
+    def readline(self, size: int = -1) -> bytes:
+        if self.next:
+            return b""
+        if self._pending:
+            piece, self._pending = self._pending, b""
+        else:
+            piece = self._stream.readline(size)
+            if self._at_line_start and piece.startswith(RECORD_START.encode()):
+                self.next = piece
+                return b""
+        if piece:
+            self._at_line_start = piece.endswith(b"\n")
+        return piece
+
+
+def _read_record(record: _RecordStream, token_budget: Optional[int]) -> RangeCommit:
+    """
+    Parses one commit: its header fields up to MESSAGE_END, then its raw status
+    and patch, file by file. Files past `token_budget` estimated tokens are not
+    kept (listed at the end of the diff instead), so memory stays bounded
+    however large the commit; invalid UTF-8 is replaced.
+    """
+    header = b""
+    while MESSAGE_END.encode() not in header:
+        piece = record.readline(DIFF_READ_CHUNK_SIZE)
+        if not piece:
+            break
+        header += piece
+    header, _, rest = header.partition(MESSAGE_END.encode())
+    sha, tree, parents, name, email, date, message = (
+        header.decode("utf-8", errors="replace")[len(RECORD_START):].split(FIELD_SEPARATOR, 6)
+    )
+
+    max_file_bytes = None if token_budget is None else token_budget * CHARS_PER_TOKEN * 4
+    changes = StagedDiff()
+    parts = []
+    used = 0
+    record.unread(rest)
+    for path, text, complete in iter_file_diffs(record, max_file_bytes):
+        if not path and not text.startswith(FILE_HEADER_PREFIX):
+            changes.changes = parse_raw_status(text)
+            continue
+        tokens = estimate_text_tokens(text)
+        if token_budget is not None and (changes.omitted or not complete or used + tokens > token_budget):
+            changes.omitted.append(path)
+            continue
+        parts.append(text)
+        changes.files.append(path)
+        used += tokens
+    if changes.omitted:
+        parts.append(f"[{len(changes.omitted)} file(s) omitted: {', '.join(sorted(changes.omitted))}]\n")
+    changes.text = "".join(parts)
+    return RangeCommit(sha, tree, parents.split(), name, email, date, message, changes)
+
+
+def iter_log(stream: BinaryIO, token_budget: Optional[int] = None) -> Iterator[RangeCommit]:
+    """Commits of a binary `git log` stream run with LOG_COMMAND and LOG_FORMAT, parsed one at a time."""
+    line = stream.readline(DIFF_READ_CHUNK_SIZE)
+    while line and not line.startswith(RECORD_START.encode()):
+        line = stream.readline(DIFF_READ_CHUNK_SIZE)
+    while line:
+        record = _RecordStream(stream, line)
+        commit = _read_record(record, token_budget)
+        while record.readline(DIFF_READ_CHUNK_SIZE):
+            pass  # whatever the parser left of this record
+        yield commit
+        line = record.next
+
+
+def read_range(revision_range: str, cwd: Optional[str] = None, token_budget: Optional[int] = None) -> List[RangeCommit]:
+    """
+    The commits of `revision_range` with their diffs, streamed from one git
+    process without a time limit; each diff is kept within `token_budget`.
+
+    Raises:
+        GitCommandError: If git fails, or the range is empty, does not end at HEAD, holds merges or is not linear
+    """
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            process = subprocess.Popen(
+                LOG_COMMAND + [LOG_FORMAT, revision_range, "--"], stdout=subprocess.PIPE, stderr=stderr, cwd=cwd
+            )
+        except FileNotFoundError:
+            raise GitCommandError("Git command not found - is git installed?")
+        try:
+            commits = list(iter_log(process.stdout, token_budget))
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            error_msg = stderr.read().decode("utf-8", errors="replace").strip() or "Unknown git error"
+            raise GitCommandError(f"Git command failed: {error_msg}")
+
+    if not commits:
+        raise GitCommandError(f"No commits in {revision_range}")
+    if any(len(commit.parents) > 1 for commit in commits):
+        raise GitCommandError("Cannot reword merge commits")
+    if any(commit.parents != [previous.sha] for previous, commit in zip(commits, commits[1:])):
+        raise GitCommandError(f"{revision_range} is not a linear run of commits")
+    head = run_git_command(["rev-parse", "HEAD"], cwd=cwd).stdout.strip()
+    if commits[-1].sha != head:
+        raise GitCommandError(f"{revision_range} must end at HEAD")
+    return commits
+
+
+def prepare_diff(commit: RangeCommit, token_limit: int, rules) -> str:
+    """The commit's diff as sent to the AI: compact encoding, low-value files as a stat line."""
+    diff, _ = select_files(compact_diff(commit.changes.text).strip(), token_limit, rules)
+    return diff
+
+
+async def reword_commits(
+    commits: List[RangeCommit],
+    use_cache: bool = True,
+    heuristics: bool = True,
+    cwd: Optional[str] = None,
+    on_done=None,
+) -> List[Reworded]:
+    """
+    New messages for `commits`, generated concurrently through the non-interactive
+    chat graph: at most REWORD_CONCURRENCY at a time and REWORD_REQUESTS_PER_MINUTE
+    requests across all of them. Trivial changes get a local message (see
+    utils/heuristics.py), and diffs already in the message cache are answered
+    from it without entering the graph. A commit whose generation fails keeps its
+    message. `on_done(reworded)` is called as each commit finishes.
+    """
+    import asyncio
+    from langchain_core.messages import HumanMessage
+    from codelibre.graph.graph import get_chat_app
+    from codelibre.graph.nodes import conversation_cache_key, get_message_cache
+    from codelibre.graph.state import ChatState
+
+    settings = load_settings()
+    rules = load_rules(find_worktree_root(cwd))
+    chat_app = get_chat_app(interactive=False)
+    slots = asyncio.Semaphore(settings.reword_concurrency)
+    limiter = RateLimiter(settings.reword_requests_per_minute, burst=settings.reword_concurrency)
+
+    async def reword(commit: RangeCommit) -> Reworded:
+        if not commit.changes.text.strip():
+            return Reworded(commit, commit.message, "kept")
+        trivial = trivial_commit_message(commit.changes) if heuristics else None
+        if trivial:
+            return Reworded(commit, trivial.message, "heuristic")
+
+        diff = prepare_diff(commit, settings.token_limit, rules)
+        route = route_model(diff, settings)
+        state = ChatState(
+            messages=[HumanMessage(content=BASE_TEMPLATE.format(diff=diff))],
+            system_prompt=SYSTEM_PROMPT,
+            use_cache=use_cache,
+            model=route.model,
+            model_tier=route.tier,
+        )
+        cached = get_message_cache().get(conversation_cache_key(state, route.model)) if use_cache else None
+        if cached:
+            return Reworded(commit, sanitize_commit_message(cached), "cached")
+
+        async with slots:
+            await limiter.acquire()
+            final_state = await chat_app.ainvoke(state)
+        return Reworded(commit, sanitize_commit_message(final_state.get("response", "")), "ai")
+
+    async def run(commit: RangeCommit) -> Reworded:
+        try:
+            result = await reword(commit)
+        except Exception as e:
+            result = Reworded(commit, commit.message, "failed", str(e) or type(e).__name__)
+        if on_done:
+            on_done(result)
+        return result
+
+    return list(await asyncio.gather(*(run(commit) for commit in commits)))
+
+
+def rewrite_history(results: List[Reworded], cwd: Optional[str] = None) -> str:
+    """
+    Recreates the range with the new messages in one pass, without touching the
+    index or working tree: `git commit-tree` per commit (same tree, author and
+    author date), then a single `git update-ref` of HEAD, which fails if HEAD
+    moved meanwhile. Commits before the first changed message are left as they are.
+    Returns the new HEAD.
+    """
+    parent = results[0].commit.parents[0] if results[0].commit.parents else None
+    for result in results:
+        commit = result.commit
+        if parent == (commit.parents[0] if commit.parents else None) and result.message == commit.message:
+            parent = commit.sha
+            continue
+        args = ["commit-tree", commit.tree] + (["-p", parent] if parent else []) + ["-F", "-"]
+        env = {
+            "GIT_AUTHOR_NAME": commit.author_name,
+            "GIT_AUTHOR_EMAIL": commit.author_email,
+            "GIT_AUTHOR_DATE": commit.author_date,
+        }
+        parent = run_git_command(args, cwd=cwd, input=result.message, env=env).stdout.strip()
+
+    old_head = results[-1].commit.sha
+    if parent != old_head:
+        run_git_command(["update-ref", "-m", "codelibre reword", "HEAD", parent, old_head], cwd=cwd)
+    return parent
+
+
+def run_reword(args: List[str], use_cache: bool = True, heuristics: bool = True) -> int:
+    """
+    `codelibre reword <range> [--dry-run]`: writes a new message for every commit
+    of `range` (which must end at HEAD, e.g. `main..HEAD`) and rewrites them in
+    one go. With --dry-run the messages are only printed. Returns the exit status.
+    """
+    import asyncio
+
+    dry_run = "--dry-run" in args
+    args = [arg for arg in args if arg != "--dry-run"]
+    if len(args) != 1:
+        print(f"{Colors.RED}✗ Usage: codelibre reword <range> [--dry-run]{Colors.RESET}")
+        return 1
+
+    try:
+        commits = read_range(args[0], token_budget=load_settings().token_limit * DIFF_READ_BUDGET_FACTOR)
+    except CodeLibreEnvironmentError as e:
+        print(f"{Colors.RED}✗ Missing configuration: {e}{Colors.RESET}")
+        return 1
+    except GitCommandError as e:
+        print(f"{Colors.RED}✗ {e}{Colors.RESET}")
+        return 1
+
+    out = sys.stdout
+    finished = []
+
+    def report(result: Reworded) -> None:
+        finished.append(result)
+        short = result.commit.sha[:7]
+        if result.source == "failed":
+            line = f"{Colors.YELLOW}kept ({result.error}){Colors.RESET}"
+        else:
+            line = f"{Colors.CYAN}{result.message.strip()}{Colors.RESET} {Colors.DIM}({result.source}){Colors.RESET}"
+        print(f"  [{len(finished)}/{len(commits)}] {short} {result.commit.subject} → {line}", file=out)
+
+    print(f"{Colors.BLUE}⚙ Rewording {len(commits)} commit(s)...{Colors.RESET}")
+    try:
+        # The graph's own output would interleave across concurrent commits
+        with redirect_stdout(io.StringIO()):
+            results = asyncio.run(reword_commits(commits, use_cache=use_cache, heuristics=heuristics, on_done=report))
+    except CodeLibreEnvironmentError as e:
+        print(f"{Colors.RED}✗ Missing configuration: {e}{Colors.RESET}")
+        return 1
+    except KeyboardInterrupt:
+        print(f"{Colors.YELLOW}⚡ Interrupted, history left unchanged{Colors.RESET}")
+        return 1
+
+    if dry_run:
+        print(f"{Colors.DIM}Dry run, history left unchanged{Colors.RESET}")
+        return 0
+    try:
+        head = rewrite_history(results)
+    except GitCommandError as e:
+        print(f"{Colors.RED}✗ Could not rewrite history: {e}{Colors.RESET}")
+        return 1
+    failed = sum(result.source == "failed" for result in results)
+    print(f"{Colors.GREEN}✓ Reworded {len(results) - failed} commit(s), HEAD is now {head[:7]}{Colors.RESET}")
+    return 0
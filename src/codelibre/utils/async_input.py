@@ -0,0 +1,47 @@
+# File: src/codelibre/utils/async_input.py
+import asyncio
+import threading
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+
+# Replaces the terminal for the current context, e.g. to ask a daemon client (see daemon.py)
+input_handler: ContextVar[Optional[Callable[[str], Awaitable[str]]]] = ContextVar("input_handler", default=None)
+
+
+async def ainput(prompt: str = "") -> str:
+    """
+    Awaitable input().
+
+    The blocking read happens on a daemon thread so the event loop stays
+    responsive and Ctrl+C can cancel the awaiting task right away; an
+    abandoned read never keeps the process alive.
+    If an input_handler is set for the current context, it answers instead.
+    """
+    handler = input_handler.get()
+    if handler is not None:
+        return await handler(prompt)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(result=None, error=None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def read():
+        try:
+            result = (input(prompt), None)
+        except BaseException as e:  # EOFError, or anything raised by a patched input()
+            result = (None, e)
+        # The loop may already be closed if the read was abandoned
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(deliver, *result)
+
+    threading.Thread(target=read, name="codelibre-input", daemon=True).start()
+    return await future
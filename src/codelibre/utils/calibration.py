@@ -0,0 +1,160 @@
+# File: src/codelibre/utils/calibration.py
+import json
+import math
+import os
+import time
+from collections import Counter
+from contextlib import suppress
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from codelibre.config import (
+    CALIBRATION_HISTORY,
+    CALIBRATION_LEARNING_RATE,
+    CALIBRATION_MAX_RATIO,
+    CALIBRATION_MIN_RATIO,
+    DIFF_PREFIX,
+    get_cache_dir,
+)
+from codelibre.utils.diff_model import parse_diff
+from codelibre.utils.estimate_tokens import (
+    CHARS_PER_TOKEN,
+    IMAGE_BLOCK_TOKENS,
+    MESSAGE_OVERHEAD_TOKENS,
+    TokenEstimator,
+    count_image_blocks,
+    count_normalized_chars,
+    iter_content_text,
+)
+
+
+# Ratio learned over all content, used for kinds that have no ratio of their own yet
+ALL_KINDS = "*"
+
+
+def content_breakdown(content) -> Counter:
+    """
+    Normalized character counts of message content, per kind of content.
+    Diff text is split per file and attributed to the file's type;
+    everything else counts as "text".
+    """
+    breakdown = Counter()
+    for text in iter_content_text(content):
+        if text.startswith(DIFF_PREFIX):
+            breakdown["text"] += count_normalized_chars(DIFF_PREFIX)
+            parsed = parse_diff(text[len(DIFF_PREFIX):])
+            if parsed.preamble:
+                breakdown["other"] += count_normalized_chars(parsed.preamble)
+            for file in parsed.files:
+                breakdown[file.kind] += count_normalized_chars(file.text)
+        else:
+            breakdown["text"] += count_normalized_chars(text)
+    return breakdown
+
+
+class TokenCalibration(TokenEstimator):
+    """
+    Token estimator that learns chars-per-token ratios per model and file type
+    from the input token usage reported by the API. Everything is stored in a
+    small local JSON file; no extra network calls are made.
+
+    Each observation compares the estimate with the real input token count and
+    nudges the ratio of every kind in the prompt towards the observed value,
+    weighted by that kind's share of the estimate.
+    """
+
+    def __init__(self, model: str, path: Optional[Path] = None, learning_rate: float = CALIBRATION_LEARNING_RATE):
+        self.model = model
+        self.path = Path(path) if path else get_cache_dir() / "calibration.json"
+        self.learning_rate = learning_rate
+        self._store = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                store = json.load(f)
+        except (OSError, ValueError):
+            store = {}
+        store.setdefault("models", {})
+        store.setdefault("observations", [])
+        return store
+
+    def save(self) -> None:
+        """Writes the store atomically; failures are ignored (calibration is best-effort)."""
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._store, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            with suppress(OSError):
+                tmp_path.unlink(missing_ok=True)
+
+    @property
+    def _ratios(self) -> Dict[str, dict]:
+        return self._store["models"].setdefault(self.model, {})
+
+    def ratio(self, kind: str = "text") -> float:
+        """Learned characters per token for `kind`, falling back to the model-wide ratio."""
+        entry = self._ratios.get(kind) or self._ratios.get(ALL_KINDS)
+        return entry["ratio"] if entry else CHARS_PER_TOKEN
+
+    def samples(self, kind: str = ALL_KINDS) -> int:
+        """Number of observations that have contributed to a kind's ratio."""
+        entry = self._ratios.get(kind)
+        return entry["samples"] if entry else 0
+
+    def text_tokens(self, text: str, kind: str = "text") -> float:
+        return count_normalized_chars(text) / self.ratio(kind)
+
+    def message_tokens(self, message) -> float:
+        content = message if isinstance(message, str) else message.content
+        breakdown = content_breakdown(content)
+        tokens = sum(chars / self.ratio(kind) for kind, chars in breakdown.items())
+        return tokens + count_image_blocks(content) * IMAGE_BLOCK_TOKENS + MESSAGE_OVERHEAD_TOKENS
+
+    def record(self, messages: Iterable, actual_tokens: int) -> Optional[float]:
+        """
+        Learns from one request: `messages` as sent (system prompt included)
+        and the input token count the API reported for them.
+        Returns the estimate made before learning, or None if nothing was learned.
+        """
+        messages = list(messages)
+        breakdown = Counter()
+        fixed_tokens = 0.0
+        for message in messages:
+            content = message if isinstance(message, str) else message.content
+            breakdown.update(content_breakdown(content))
+            fixed_tokens += count_image_blocks(content) * IMAGE_BLOCK_TOKENS + MESSAGE_OVERHEAD_TOKENS
+
+        predicted = {kind: chars / self.ratio(kind) for kind, chars in breakdown.items() if chars}
+        predicted_total = sum(predicted.values())
+        estimate = predicted_total + fixed_tokens
+        actual_text_tokens = actual_tokens - fixed_tokens
+        if predicted_total <= 0 or actual_text_tokens <= 0:
+            return None
+
+        # Multiplicative update in log space, so ratios stay positive and converge
+        log_error = math.log(actual_text_tokens / predicted_total)
+        ratios = self._ratios
+        updates = dict(predicted)
+        updates[ALL_KINDS] = predicted_total
+        for kind, kind_tokens in updates.items():
+            share = kind_tokens / predicted_total
+            current = self.ratio(kind)
+            learned = current * math.exp(-self.learning_rate * share * log_error)
+            learned = min(max(learned, CALIBRATION_MIN_RATIO), CALIBRATION_MAX_RATIO)
+            entry = ratios.setdefault(kind, {"ratio": current, "samples": 0})
+            entry["ratio"] = learned
+            entry["samples"] += 1
+        self.forget_message_counts()
+
+        observations = self._store["observations"]
+        observations.append({
+            "model": self.model,
+            "estimated": round(estimate, 1),
+            "actual": actual_tokens,
+            "time": time.time(),
+        })
+        del observations[:-CALIBRATION_HISTORY]
+        return estimate
@@ -0,0 +1,101 @@
+# File: src/codelibre/utils/compact_diff.py
+from collections import Counter
+from typing import List
+from codelibre.utils.diff_model import FILE_HEADER_PREFIX, HUNK_HEADER_PREFIX, FileDiff, parse_diff
+
+
+# Extended header lines kept (shortened) in a compact file header; the rest
+# (index, ---/+++, similarity) only repeat what the first line says
+HEADER_NOTES = {
+    "new file mode": "new file",
+    "rename from ": "renamed from {}",
+    "copy from ": "copied from {}",
+    "new mode ": "mode {}",
+    "Binary files ": "binary file",
+}
+
+
+def _squash(line: str) -> str:
+    return "".join(line[1:].split())
+
+
+def _drop_whitespace_changes(removed: List[str], added: List[str]) -> List[str]:
+    """
+    One block of consecutive -/+ lines without the edits that only change
+    whitespace: removed/added pairs equal once whitespace is ignored, and blank lines.
+    """
+    common = Counter(map(_squash, removed)) & Counter(map(_squash, added))
+    kept = []
+    for lines in (removed, added):
+        pending = common.copy()
+        for line in lines:
+            squashed = _squash(line)
+            if not squashed:
+                continue
+            if pending[squashed]:
+                pending[squashed] -= 1
+                continue
+            kept.append(line)
+    return kept
+
+
+def compact_hunk(hunk: str) -> str:
+    """
+    A hunk with no context lines and no whitespace-only edits, headed by its
+    enclosing function (when git found one) instead of line numbers.
+    Empty if nothing but whitespace changed.
+    """
+    lines = hunk.splitlines()
+    _, _, section = lines[0][len(HUNK_HEADER_PREFIX):].partition(HUNK_HEADER_PREFIX)
+    kept, removed, added = [], [], []
+    for line in lines[1:]:
+        if line.startswith("-"):
+            removed.append(line)
+        elif line.startswith("+"):
+            added.append(line)
+        else:
+            kept += _drop_whitespace_changes(removed, added)
+            removed, added = [], []
+            # Not a context line: text after the diff, such as the omitted files note
+            if line and not line.startswith((" ", "\\")):
+                kept.append(line)
+    kept += _drop_whitespace_changes(removed, added)
+    if not kept:
+        return ""
+    header = f"{HUNK_HEADER_PREFIX} {section.strip()}".rstrip()
+    return "\n".join([header, *kept]) + "\n"
+
+
+def compact_file_diff(file: FileDiff) -> str:
+    """
+    One file of a unified diff in compact form: a single `diff --git <path>` line,
+    short notes for new, renamed, copied, binary and mode-changed files, then its
+    compact hunks. Deleted files are reduced to their line count.
+    """
+    header_lines = file.header.splitlines()[1:]
+
+    if any(line.startswith("deleted file mode") for line in header_lines):
+        return f"{FILE_HEADER_PREFIX}{file.path}\ndeleted file ({file.removed} lines)\n"
+
+    parts = [f"{FILE_HEADER_PREFIX}{file.path}\n"]
+    for line in header_lines:
+        for prefix, note in HEADER_NOTES.items():
+            if line.startswith(prefix):
+                parts.append(note.format(line[len(prefix):].strip()) + "\n")
+                break
+
+    body = [compacted for compacted in (compact_hunk(hunk.text) for hunk in file.hunks) if compacted]
+    if file.hunks and not body:
+        body = ["(whitespace-only changes)\n"]
+    return "".join(parts + body)
+
+
+def compact_diff(diff: str) -> str:
+    """
+    Re-encodes a unified `git diff` with fewer tokens for the prompt: no context
+    lines, one header line per file, no whitespace-only edits, renames and
+    deletions as one-line notes. Text outside file diffs is kept as is.
+    The result still splits per file like a diff (split_file_diffs, truncation).
+    """
+    parsed = parse_diff(diff)
+    return parsed.preamble + "".join(compact_file_diff(file) for file in parsed.files)
@@ -0,0 +1,172 @@
+# File: src/codelibre/utils/diff_model.py
+import re
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+
+FILE_HEADER_PREFIX = "diff --git "
+HUNK_HEADER_PREFIX = "@@"
+
+# "@@ -old_start,old_count +new_start,new_count @@"; counts default to 1 when left out
+HUNK_RANGES = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def file_kind(path: str) -> str:
+    """
+    Kind of content for a path, used to learn per-file-type token ratios.
+    The lowercase extension, or "other" for files without one.
+    """
+    name = path.rsplit("/", 1)[-1]
+    stem, dot, extension = name.rpartition(".")
+    if dot and stem and extension:
+        return extension.lower()
+    return "other"
+
+
+def header_path(first_line: str) -> str:
+    """Post-image path named by a `diff --git` line, falling back to the whole header."""
+    _, sep, b_path = first_line.partition(" b/")
+    if sep:
+        return b_path.strip()
+    return first_line[len(FILE_HEADER_PREFIX):].strip()
+
+
+class Hunk:
+    """
+    One hunk of a file diff, as offsets into the diff text: its `@@` line starts
+    at `start`, and `end` is just past its last line. Added and removed line
+    counts are taken while parsing.
+    """
+    __slots__ = ("source", "start", "end", "added", "removed")
+
+    def __init__(self, source: str, start: int, end: int):
+        self.source = source
+        self.start = start
+        self.end = end
+        # Every +/- line follows a newline inside the hunk (its first line is the @@ header)
+        self.added = source.count("\n+", start, end)
+        self.removed = source.count("\n-", start, end)
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
+    @property
+    def header(self) -> str:
+        """The `@@` line, without its newline."""
+        newline = self.source.find("\n", self.start, self.end)
+        return self.source[self.start:self.end if newline < 0 else newline]
+
+    @property
+    def ranges(self) -> Optional[Tuple[int, int, int, int]]:
+        """(old start, old count, new start, new count), None for hunks without line numbers (compact diffs)."""
+        match = HUNK_RANGES.match(self.header)
+        if not match:
+            return None
+        old_start, old_count, new_start, new_count = match.groups()
+        return int(old_start), int(old_count or 1), int(new_start), int(new_count or 1)
+
+    def lines(self) -> Iterator[str]:
+        """The lines after the `@@` line, without newlines."""
+        return iter(self.text.splitlines()[1:])
+
+
+class FileDiff:
+    """One file of a diff, from its `diff --git` line to the next file, as offsets into the diff text."""
+    __slots__ = ("source", "start", "end", "hunks", "_path")
+
+    def __init__(self, source: str, start: int, end: int, hunks: List[Hunk]):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.hunks = hunks
+        self._path = None
+
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
+    @property
+    def header(self) -> str:
+        """Everything before the first hunk."""
+        return self.source[self.start:self.hunks[0].start if self.hunks else self.end]
+
+    @property
+    def first_line(self) -> str:
+        newline = self.source.find("\n", self.start, self.end)
+        return self.source[self.start:self.end if newline < 0 else newline]
+
+    @property
+    def path(self) -> str:
+        """Post-image path, as file_diff_path."""
+        if self._path is None:
+            self._path = header_path(self.first_line)
+        return self._path
+
+    @property
+    def kind(self) -> str:
+        return file_kind(self.path)
+
+    @property
+    def added(self) -> int:
+        return sum(hunk.added for hunk in self.hunks)
+
+    @property
+    def removed(self) -> int:
+        return sum(hunk.removed for hunk in self.hunks)
+
+
+class ParsedDiff:
+    """
+    A unified diff split into files and hunks without copying it: every part
+    is a pair of offsets into `text`. Text before the first file header is
+    the preamble.
+    """
+    __slots__ = ("text", "files")
+
+    def __init__(self, text: str, files: List[FileDiff]):
+        self.text = text
+        self.files = files
+
+    @property
+    def preamble(self) -> str:
+        return self.text[:self.files[0].start] if self.files else self.text
+
+    def chunks(self) -> List[str]:
+        """The preamble (if any) and each file's text, as split_file_diffs."""
+        preamble = self.preamble
+        return ([preamble] if preamble else []) + [file.text for file in self.files]
+
+
+def _line_starts(text: str, marker: str, start: int, end: int) -> List[int]:
+    """Offsets in [start, end) of the lines beginning with `marker`."""
+    found = [start] if text.startswith(marker, start, end) else []
+    breaker = "\n" + marker
+    position = text.find(breaker, start, end)
+    while position >= 0:
+        found.append(position + 1)
+        position = text.find(breaker, position + 1, end)
+    return found
+
+
+def parse_hunks(text: str, start: int = 0, end: Optional[int] = None) -> List[Hunk]:
+    """The hunks of text[start:end], each running from one `@@` line to the next."""
+    end = len(text) if end is None else end
+    starts = _line_starts(text, HUNK_HEADER_PREFIX, start, end)
+    return [Hunk(text, hunk_start, hunk_end) for hunk_start, hunk_end in zip(starts, starts[1:] + [end])]
+
+
+@lru_cache(maxsize=4)
+def parse_diff(text: str) -> ParsedDiff:
+    """
+    Parses a unified `git diff` in one pass over its file and hunk headers
+    (searched for, not read line by line). Cached for the last few diffs, so the
+    stages that read the same diff (ranking, compaction, truncation, heuristics)
+    share one parse.
+    """
+    starts = _line_starts(text, FILE_HEADER_PREFIX, 0, len(text))
+    ends = starts[1:] + [len(text)]
+    return ParsedDiff(text, [
+        FileDiff(text, start, end, parse_hunks(text, start, end))
+        for start, end in zip(starts, ends)
+    ])
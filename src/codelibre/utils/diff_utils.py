@@ -0,0 +1,46 @@
+# File: src/codelibre/utils/diff_utils.py
+from typing import List, Tuple
+from codelibre.utils.diff_model import FILE_HEADER_PREFIX, Hunk, file_kind, header_path, parse_diff, parse_hunks
+
+
+# String helpers over the parsed diff model (see utils/diff_model.py), for callers
+# that only have one chunk of text at hand.
+
+
+def split_file_diffs(diff: str) -> List[str]:
+    """
+    Splits a unified `git diff` into one chunk per file.
+    Any text before the first file header is kept as its own chunk.
+    """
+    return parse_diff(diff).chunks()
+
+
+def split_hunks(file_diff: str) -> Tuple[str, List[str]]:
+    """
+    Splits a single file diff into its header and its hunks.
+    The header holds everything before the first `@@` line.
+    """
+    hunks = parse_hunks(file_diff)
+    header_end = hunks[0].start if hunks else len(file_diff)
+    return file_diff[:header_end], [hunk.text for hunk in hunks]
+
+
+def file_diff_path(file_diff: str) -> str:
+    """Returns the post-image path of a file diff, falling back to the header."""
+    first_line = file_diff.split("\n", 1)[0]
+    if first_line.startswith(FILE_HEADER_PREFIX):
+        return header_path(first_line)
+    return ""
+
+
+def count_changes(hunk: str) -> Tuple[int, int]:
+    """Counts added and removed lines in a hunk."""
+    counted = Hunk(hunk, 0, len(hunk))
+    return counted.added, counted.removed
+
+
+def strip_context(hunk: str) -> str:
+    """Drops unchanged context lines from a hunk, keeping its header and edits."""
+    lines = hunk.splitlines(keepends=True)
+    kept = [line for line in lines[1:] if not line.startswith(" ")]
+    return "".join(lines[:1] + kept)
@@ -1,23 +1,192 @@
 # File: src/codelibre/utils/estimate_tokens.py
-import re
+import json
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+
+# Approx 1 token = 4 chars (safe high estimate for average English)
+CHARS_PER_TOKEN = 4
+
+# Fixed overhead added for every message (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Anthropic bills images by pixel count; this is roughly the cost of a large one
+IMAGE_BLOCK_TOKENS = 1600
+
+# Message estimates an estimator remembers before starting over (see TokenEstimator.message_counts)
+MESSAGE_COUNTS_MAX = 1024
+
+# Text is measured in slices of this size so memory stays flat on huge diffs
+_SLICE_SIZE = 1 << 20
+
+
+def _collapsed_length(text: str) -> int:
+    """Length of `text` once every whitespace run is collapsed to a single space."""
+    words = text.split()
+    if not words:
+        return 1 if text else 0
+    length = sum(map(len, words)) + len(words) - 1
+    if text[0].isspace():
+        length += 1
+    if text[-1].isspace():
+        length += 1
+    return length
+
+
+def count_normalized_chars(text: str) -> int:
+    """
+    Counts characters as if whitespace runs were collapsed to one space,
+    in a single linear pass and without building the collapsed string.
+    """
+    if len(text) <= _SLICE_SIZE:
+        return _collapsed_length(text)
+
+    total = 0
+    previous_ends_with_space = False
+    for start in range(0, len(text), _SLICE_SIZE):
+        piece = text[start:start + _SLICE_SIZE]
+        total += _collapsed_length(piece)
+        # A whitespace run crossing the slice boundary was counted twice
+        if previous_ends_with_space and piece[0].isspace():
+            total -= 1
+        previous_ends_with_space = piece[-1].isspace()
+    return total
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Rough estimate of Anthropic-style tokens for a single piece of text.
+    Whitespace runs are collapsed before applying the 4 chars per token rule.
+    """
+    return int(count_normalized_chars(text) / CHARS_PER_TOKEN)
+
+
+def iter_content_text(content) -> Iterator[str]:
+    """Yields the text parts of message content (a string or a list of content blocks)."""
+    if isinstance(content, str):
+        yield content
+        return
+    for block in content or ():
+        if isinstance(block, str):
+            yield block
+        elif isinstance(block, dict):
+            block_type = block.get("type")
+            if block_type == "text":
+                yield block.get("text", "")
+            elif block_type not in ("image", "image_url"):
+                # tool calls, documents, ...: count their serialized form
+                yield json.dumps(block, default=str)
+
+
+def count_image_blocks(content) -> int:
+    """Number of image blocks in list-form message content."""
+    if isinstance(content, str):
+        return 0
+    return sum(
+        1 for block in content or ()
+        if isinstance(block, dict) and block.get("type") in ("image", "image_url")
+    )
+
+
+def content_cost(content, chars_per_token: float = CHARS_PER_TOKEN) -> float:
+    """
+    Estimated tokens for message content, either a plain string or a list of
+    content blocks (strings, text blocks, images or other structured blocks).
+    """
+    chars = sum(count_normalized_chars(text) for text in iter_content_text(content))
+    return chars / chars_per_token + count_image_blocks(content) * IMAGE_BLOCK_TOKENS
+
+
+def estimate_message_tokens(message) -> float:
+    """Estimated tokens for one message (or raw string), overhead included."""
+    content = message if isinstance(message, str) else message.content
+    return content_cost(content) + MESSAGE_OVERHEAD_TOKENS
 
 
 def estimate_anthropic_tokens(messages):
     """
     Rough estimator for Anthropic-style tokens in a list of messages.
-    Each message should be a SystemMessage, HumanMessage, etc.
+    Each message should be a SystemMessage, HumanMessage, etc. (or a plain string).
     Counts roughly: 1 token ≈ 4 characters (average English).
     Adds small overhead per message.
     """
-    text = ""
-    for m in messages:
-        if isinstance(m, str):
-            text += m
-        else:
-            text += m.content
+    return int(sum(estimate_message_tokens(m) for m in messages))
+
+
+class TokenEstimator:
+    """
+    Token estimator with a fixed chars-per-token ratio for every kind of content.
+    Subclasses can learn a different ratio per content kind (see utils/calibration.py).
+    """
+
+    def ratio(self, kind: str = "text") -> float:
+        """Characters per token for a kind of content (a file type, or "text")."""
+        return CHARS_PER_TOKEN
+
+    def text_tokens(self, text: str, kind: str = "text") -> float:
+        """Estimated tokens for a piece of text of the given kind."""
+        return count_normalized_chars(text) / self.ratio(kind)
+
+    def message_tokens(self, message) -> float:
+        """Estimated tokens for one message (or raw string), overhead included."""
+        content = message if isinstance(message, str) else message.content
+        return content_cost(content, self.ratio("text")) + MESSAGE_OVERHEAD_TOKENS
+
+    def message_counts(self) -> Dict[int, Tuple[object, float]]:
+        """
+        Estimates of the messages measured so far, shared by the TokenCounters
+        built on this estimator: a conversation checked every round only measures
+        its new messages. Emptied when full, or when the ratios change.
+        """
+        counts = self.__dict__.setdefault("_message_counts", {})
+        if len(counts) > MESSAGE_COUNTS_MAX:
+            counts.clear()
+        return counts
+
+    def forget_message_counts(self) -> None:
+        """Drops the remembered estimates, which were made with outdated ratios."""
+        self.__dict__.pop("_message_counts", None)
+
+
+class TokenCounter:
+    """
+    Running token estimate over a changing set of messages.
+
+    Each message is measured once and its count cached, so adding or removing
+    a message updates the total in O(1) regardless of its size.
+    """
+
+    def __init__(
+        self,
+        messages: Iterable = (),
+        estimator: Callable[[object], float] = estimate_message_tokens,
+        cache: Optional[Dict[int, Tuple[object, float]]] = None,
+    ):
+        self._estimator = estimator
+        # id(message) -> (message, tokens); the message is kept so its id stays unique
+        self._cache: Dict[int, Tuple[object, float]] = {} if cache is None else cache
+        self._total = 0.0
+        for message in messages:
+            self.add(message)
+
+    def count(self, message) -> float:
+        """Estimated tokens for `message`, measured only the first time it is seen."""
+        entry = self._cache.get(id(message))
+        if entry is None or entry[0] is not message:
+            entry = (message, self._estimator(message))
+            self._cache[id(message)] = entry
+        return entry[1]
+
+    def add(self, message) -> int:
+        """Adds a message to the running total and returns the new total."""
+        self._total += self.count(message)
+        return self.total
 
-    # Approx 1 token = 4 chars (safe high estimate)
-    approx_tokens = len(re.sub(r"\s+", " ", text)) / 4
-    approx_tokens += len(messages) * 4
+    def remove(self, message) -> int:
+        """Removes a previously added message and returns the new total."""
+        self._total -= self.count(message)
+        return self.total
 
-    return int(approx_tokens)
\ No newline at end of file
+    @property
+    def total(self) -> int:
+        # The epsilon absorbs float drift from many add/remove pairs
+        return int(self._total + 1e-6)
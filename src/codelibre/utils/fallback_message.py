@@ -0,0 +1,52 @@
+# File: src/codelibre/utils/fallback_message.py
+import posixpath
+from typing import List, Optional, Tuple
+from codelibre.config import MAX_CHARACTERS
+
+
+DOC_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+
+VERBS = {"A": "add", "D": "remove", "R": "rename", "C": "copy"}
+
+
+def is_doc_path(path: str) -> bool:
+    return path.startswith("docs/") or posixpath.splitext(path)[1].lower() in DOC_EXTENSIONS
+
+
+def is_test_path(path: str) -> bool:
+    name = posixpath.basename(path)
+    return path.startswith("tests/") or "/tests/" in path or name.startswith("test_") or name.endswith("_test.py")
+
+
+def fallback_commit_message(changes: List[Tuple[str, str]]) -> Optional[str]:
+    """
+    Plain commit message built from staged file statuses alone, without the LLM,
+    for when it cannot answer in time. None if nothing is staged.
+
+    Args:
+        changes: (status letter, path) pairs as in StagedDiff.changes
+    """
+    if not changes:
+        return None
+
+    paths = [path for _, path in changes]
+    if all(is_doc_path(p) for p in paths):
+        prefix = "docs"
+    elif all(is_test_path(p) for p in paths):
+        prefix = "test"
+    else:
+        prefix = "chore"
+
+    statuses = {status for status, _ in changes}
+    verb = VERBS.get(statuses.pop(), "update") if len(statuses) == 1 else "update"
+
+    if len(paths) == 1:
+        subject = posixpath.basename(paths[0])
+    else:
+        subject = f"{len(paths)} files"
+        common = posixpath.commonpath(paths) if all("/" in p for p in paths) else ""
+        if common and len(f"{verb} {subject} in {common}") <= MAX_CHARACTERS:
+            subject = f"{subject} in {common}"
+
+    summary = f"{verb} {subject}"[:MAX_CHARACTERS].strip()
+    return f"{prefix}: {summary}"
@@ -0,0 +1,264 @@
+# File: src/codelibre/utils/file_ranking.py
+import fnmatch
+import posixpath
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from codelibre.config import (
+    RANKING_GENERATED_SCAN_LINES,
+    RANKING_IGNORE_FILE,
+    RANKING_LARGE_FILE_SHARE,
+    RANKING_LOW_VALUE_SCORE,
+    RANKING_MINIFIED_LINE_LENGTH,
+)
+from codelibre.utils.diff_model import FileDiff, parse_diff, parse_hunks
+from codelibre.utils.estimate_tokens import estimate_text_tokens
+
+
+# (reason, score, patterns) for files that say little about a change; the first match wins.
+# Patterns follow .gitignore rules, see path_matches.
+PATH_RULES = (
+    ("lockfile", 0.1, (
+        "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock",
+        "Pipfile.lock", "uv.lock", "Cargo.lock", "Gemfile.lock", "composer.lock", "go.sum", "*.lock",
+    )),
+    ("minified", 0.1, ("*.min.js", "*.min.css", "*.map")),
+    ("generated", 0.15, ("*_pb2.py", "*_pb2.pyi", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h", "*.generated.*", "*.g.dart")),
+    ("build output", 0.15, ("dist/", "build/", "vendor/", "node_modules/")),
+    ("snapshot", 0.2, ("*.snap", "__snapshots__/")),
+    ("data", 0.6, ("*.json", "*.csv", "*.tsv", "*.svg")),
+)
+
+# Markers generators leave near the top of their output
+GENERATED_MARKER = re.compile(r"@generated|do not edit|auto-?generated|generated by", re.I)
+
+PRIORITY_SCORE = 2.0
+IGNORED_SCORE = 0.0
+
+
+@dataclass
+class RankedFile:
+    """One file of a diff and how much it is worth to the commit message (higher is more)."""
+    path: str
+    file: FileDiff
+    score: float
+    reason: str
+    tokens: int
+
+
+def path_matches(path: str, pattern: str) -> bool:
+    """
+    Whether `path` matches one .gitignore-style pattern: a trailing `/` matches
+    everything under a directory, a leading or inner `/` anchors the pattern
+    at the repository root, otherwise it matches a file or directory name at any depth.
+    """
+    directory = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    parts = path.split("/")
+
+    if anchored:
+        candidates = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    else:
+        candidates = parts
+    if directory:
+        candidates = candidates[:-1]  # the last part is the file itself
+    return any(fnmatch.fnmatchcase(candidate, pattern) for candidate in candidates)
+
+
+def parse_rules(text: str) -> List[Tuple[str, bool]]:
+    """
+    (pattern, priority) pairs of a .codelibreignore file: one .gitignore-style
+    pattern per line for files sent only as a stat line, `!pattern` for files
+    always sent in full. Blank lines and `#` comments are skipped.
+    """
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        priority = line.startswith("!")
+        pattern = line[1:].strip() if priority else line
+        if pattern:
+            rules.append((pattern, priority))
+    return rules
+
+
+def load_rules(root: Optional[Path]) -> List[Tuple[str, bool]]:
+    """The rules of `root`'s .codelibreignore, none if it has no readable one."""
+    if root is None:
+        return []
+    try:
+        text = (root / RANKING_IGNORE_FILE).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return []
+    return parse_rules(text)
+
+
+def _added_lines(file: FileDiff) -> List[str]:
+    return [line[1:] for hunk in file.hunks for line in hunk.lines() if line.startswith("+")]
+
+
+def _looks_generated(added: List[str]) -> Optional[str]:
+    """'generated' or 'minified' judging from a file's added lines, None if it looks hand-written."""
+    if any(GENERATED_MARKER.search(line) for line in added[:RANKING_GENERATED_SCAN_LINES]):
+        return "generated"
+    if added and sum(map(len, added)) / len(added) > RANKING_MINIFIED_LINE_LENGTH:
+        return "minified"
+    return None
+
+
+def rank_file(file: FileDiff, token_budget: int, rules: Sequence[Tuple[str, bool]] = ()) -> RankedFile:
+    """
+    Scores one file diff: .codelibreignore rules first (the last matching one wins),
+    then known low-value paths (lockfiles, bundles, generated code, snapshots),
+    then content that looks generated or minified. Ordinary files score 1;
+    any file larger than RANKING_LARGE_FILE_SHARE of `token_budget` scores half.
+    """
+    path = file.path
+    tokens = estimate_text_tokens(file.text)
+
+    priority = None
+    for pattern, is_priority in rules:
+        if path_matches(path, pattern):
+            priority = is_priority
+    if priority is not None:
+        if priority:
+            return RankedFile(path, file, PRIORITY_SCORE, "priority", tokens)
+        return RankedFile(path, file, IGNORED_SCORE, "ignored", tokens)
+
+    reason, score = "", 1.0
+    for rule_reason, rule_score, patterns in PATH_RULES:
+        if any(path_matches(path, pattern) for pattern in patterns):
+            reason, score = rule_reason, rule_score
+            break
+    if not reason:
+        generated = _looks_generated(_added_lines(file))
+        if generated:
+            reason, score = generated, 0.15
+
+    if tokens > token_budget * RANKING_LARGE_FILE_SHARE:
+        score /= 2
+        reason = f"large {reason}" if reason else "large file"
+    return RankedFile(path, file, score, reason, tokens)
+
+
+def stat_line(ranked: RankedFile, complete: bool = True) -> str:
+    """
+    A file diff reduced to its header line and a one-line stat of its changes.
+    The counts of a file not read to the end (`complete` False) are a lower bound.
+    """
+    file = ranked.file
+    # Not diff lines: text after the diff, such as the omitted files note
+    trailing = "".join(
+        line + "\n"
+        for hunk in file.hunks
+        for line in hunk.lines()
+        if line and not line.startswith((" ", "\\", "+", "-"))
+    )
+    counts = f"+{file.added} -{file.removed} lines" if complete else f"at least +{file.added} -{file.removed} lines"
+    return f"{file.first_line}\n({ranked.reason}, {counts}, content omitted)\n{trailing}"
+
+
+def select_files(diff: str, token_budget: int, rules: Sequence[Tuple[str, bool]] = ()) -> Tuple[str, List[RankedFile]]:
+    """
+    The diff with its low-value files reduced to a stat line, and the files reduced.
+
+    Files ignored by `rules` are always reduced. Other files scoring below
+    RANKING_LOW_VALUE_SCORE are reduced, lowest score and largest first, only
+    while the diff is over `token_budget`. Everything else is left for
+    truncation or summarizing. Files without hunks (binary files, renames,
+    files already reduced while reading the diff) have nothing to leave out.
+    Works on raw and compact diffs alike.
+    """
+    parsed = parse_diff(diff)
+    ranked = {i: rank_file(file, token_budget, rules) for i, file in enumerate(parsed.files) if file.hunks}
+    total = estimate_text_tokens(diff)
+
+    reduced = {}
+    for i, file in ranked.items():
+        if file.reason == "ignored":
+            reduced[i] = stat_line(file)
+            total -= file.tokens - estimate_text_tokens(reduced[i])
+
+    low_value = sorted(
+        (i for i, file in ranked.items() if i not in reduced and file.score < RANKING_LOW_VALUE_SCORE),
+        key=lambda i: (ranked[i].score, -ranked[i].tokens),
+    )
+    for i in low_value:
+        if total <= token_budget:
+            break
+        reduced[i] = stat_line(ranked[i])
+        total -= ranked[i].tokens - estimate_text_tokens(reduced[i])
+
+    if not reduced:
+        return diff, []
+    text = parsed.preamble + "".join(reduced.get(i, file.text) for i, file in enumerate(parsed.files))
+    return text, [ranked[i] for i in sorted(reduced)]
+
+
+class StreamSelector:
+    """
+    select_files for a diff read file by file (see git_helpers.read_staged_diff),
+    deciding each file's text as it arrives so nothing past `token_budget` is kept.
+
+    Ignored files and files not read to the end become stat lines right away;
+    so does any other file that no longer fits. Files scoring below
+    RANKING_LOW_VALUE_SCORE wait until every ordinary file is in, then the
+    best of them are sent in full while they fit (lowest score and largest
+    reduced first, as select_files). At most `token_budget` tokens of them wait.
+    """
+
+    def __init__(self, token_budget: int, rules: Sequence[Tuple[str, bool]] = ()):
+        self.token_budget = token_budget
+        self.rules = rules
+        self.parts: List[Optional[str]] = []
+        self.paths: List[str] = []  # path of each part
+        self.reduced: Dict[int, RankedFile] = {}
+        self.used = 0
+        self._waiting: List[Tuple[int, RankedFile]] = []
+        self._waiting_tokens = 0
+
+    def _reduce(self, i: int, ranked: RankedFile, complete: bool = True) -> str:
+        if not ranked.reason:
+            ranked.reason = "over budget"
+        text = stat_line(ranked, complete)
+        # Hold on to the stat line rather than the file's whole diff
+        ranked.file = FileDiff(text, 0, len(text), [])
+        self.reduced[i] = ranked
+        self.used += estimate_text_tokens(text)
+        return text
+
+    def add(self, path: str, text: str, complete: bool = True) -> None:
+        """Adds the next file's diff, `complete` False if it was cut off while reading."""
+        ranked = rank_file(FileDiff(text, 0, len(text), parse_hunks(text)), self.token_budget, self.rules)
+        self.paths.append(path)
+        if ranked.reason == "ignored" or not complete:
+            self.parts.append(self._reduce(len(self.parts), ranked, complete))
+        elif ranked.score < RANKING_LOW_VALUE_SCORE and self._waiting_tokens + ranked.tokens <= self.token_budget:
+            self._waiting.append((len(self.parts), ranked))
+            self._waiting_tokens += ranked.tokens
+            self.parts.append(None)
+        elif ranked.score < RANKING_LOW_VALUE_SCORE or self.used + ranked.tokens > self.token_budget:
+            self.parts.append(self._reduce(len(self.parts), ranked))
+        else:
+            self.parts.append(text)
+            self.used += ranked.tokens
+
+    def finish(self) -> List[Tuple[str, str, Optional[RankedFile]]]:
+        """(path, text, the RankedFile if reduced to a stat line) of every file added, in order."""
+        for i, ranked in sorted(self._waiting, key=lambda item: (-item[1].score, item[1].tokens)):
+            if self.used + ranked.tokens <= self.token_budget:
+                self.parts[i] = ranked.file.text
+                self.used += ranked.tokens
+            else:
+                self.parts[i] = self._reduce(i, ranked)
+        self._waiting, self._waiting_tokens = [], 0
+        return [(path, text, self.reduced.get(i)) for i, (path, text) in enumerate(zip(self.paths, self.parts))]
+
+
+def describe_reduced(files: List[RankedFile]) -> str:
+    """'a.lock (lockfile), b.js (minified)' for a status line."""
+    return ", ".join(f"{posixpath.basename(file.path)} ({file.reason})" for file in files)
@@ -1,15 +1,205 @@
 # File: src/codelibre/utils/git_helpers.py
+import os
 import subprocess
 import re
-from codelibre.config import Colors
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from codelibre.config import Colors, DIFF_READ_CHUNK_SIZE
 from codelibre.exceptions import SanitizationError, GitCommandError
+from codelibre.utils.diff_utils import FILE_HEADER_PREFIX, file_diff_path
+from codelibre.utils.estimate_tokens import CHARS_PER_TOKEN
+from codelibre.utils.file_ranking import RankedFile, StreamSelector
+from codelibre.utils.tracing import span, traced
 import shlex
-from typing import List, Union
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 
-def get_staged_diff() -> str:
-    result = subprocess.run(["git", "diff", "--cached"], capture_output=True, text=True)
-    return result.stdout.strip()
+# --patch-with-raw puts a status line per staged file before the patch,
+# so one git process yields both the file list and the diff; -M reports
+# renamed files as renames (whatever diff.renames says) instead of delete + add
+STAGED_DIFF_COMMAND = ["git", "diff", "--cached", "--no-color", "--no-ext-diff", "-M", "--patch-with-raw"]
+
+
+@dataclass
+class StagedDiff:
+    """Staged changes as read within a token budget."""
+    text: str = ""
+    files: List[str] = field(default_factory=list)  # paths whose diff is in `text`
+    omitted: List[str] = field(default_factory=list)  # paths left out of `text` altogether, listed at its end
+    reduced: List[RankedFile] = field(default_factory=list)  # files sent as a stat line (see utils/file_ranking.py)
+    changes: List[Tuple[str, str]] = field(default_factory=list)  # (status letter, path) of every staged file
+    timed_out: bool = False  # reading stopped at the time limit, the rest is in `omitted`
+
+
+def parse_raw_status(raw: str) -> List[Tuple[str, str]]:
+    """
+    Parses the `--raw` section of a diff into (status letter, path) pairs.
+    Renames and copies report their new path.
+    """
+    changes = []
+    for line in raw.splitlines():
+        if not line.startswith(":"):
+            continue
+        meta, *paths = line.split("\t")
+        if paths:
+            changes.append((meta.split()[-1][:1], paths[-1]))
+    return changes
+
+
+def iter_file_diffs(stream, max_file_bytes: Optional[int] = None, chunk_size: int = DIFF_READ_CHUNK_SIZE) -> Iterator[Tuple[str, str, bool]]:
+    """
+    Splits a binary `git diff` stream into per-file diffs as it is read.
+
+    Reads at most `chunk_size` bytes at a time and keeps at most `max_file_bytes`
+    of any one file, so memory stays flat however large the diff is.
+    Invalid UTF-8 is replaced rather than raising. Text before the first file
+    header (the `--raw` status lines) is yielded whole, with an empty path.
+
+    Yields:
+        (path, diff text, complete) where complete is False if the file was cut off
+    """
+    header = FILE_HEADER_PREFIX.encode()
+    parts = []
+    kept = size = 0
+    at_line_start = True
+    in_preamble = True
+
+    def finish():
+        text = b"".join(parts).decode("utf-8", errors="replace")
+        if in_preamble:
+            return "", text, True
+        return file_diff_path(text), text, max_file_bytes is None or size <= max_file_bytes
+
+    while True:
+        piece = stream.readline(chunk_size)
+        if not piece:
+            break
+        if at_line_start and piece.startswith(header):
+            if size:
+                yield finish()
+                parts, kept, size = [], 0, 0
+            in_preamble = False
+        if in_preamble or max_file_bytes is None or kept < max_file_bytes:
+            room = len(piece) if in_preamble or max_file_bytes is None else max_file_bytes - kept
+            parts.append(piece[:room])
+            kept += min(room, len(piece))
+        size += len(piece)
+        at_line_start = piece.endswith(b"\n")
+    if size:
+        yield finish()
+
+
+@traced("git.staged_diff")
+def read_staged_diff(
+    token_budget: Optional[int] = None,
+    cwd: str = None,
+    timeout: Optional[float] = None,
+    rules: Sequence[Tuple[str, bool]] = (),
+) -> StagedDiff:
+    """
+    Streams `git diff --cached` through a pipe, file by file, keeping at most
+    `token_budget` estimated tokens of it. Files ignored by `rules` (see
+    utils/file_ranking.py), low-value files that do not fit and any other file
+    past the budget are sent as a stat line, recorded in `reduced`, and reading
+    goes on, so one huge lockfile does not hide the files after it.
+    The status of every staged file comes from the same git process.
+    If `timeout` seconds pass first, git is stopped and the files not read yet
+    are recorded in `omitted` (and listed at the end of `text`), with `timed_out` set.
+
+    Raises:
+        GitCommandError: If git cannot be run or exits with an error
+    """
+    # Generous byte cap per file: whitespace collapsing means bytes/4 overestimates tokens
+    max_file_bytes = None if token_budget is None else token_budget * CHARS_PER_TOKEN * 4
+    selector = None if token_budget is None else StreamSelector(token_budget, rules)
+    staged = StagedDiff()
+    parts = []
+    stopped_early = False
+    expired = threading.Event()
+
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            process = subprocess.Popen(STAGED_DIFF_COMMAND, stdout=subprocess.PIPE, stderr=stderr, cwd=cwd)
+        except FileNotFoundError:
+            raise GitCommandError("Git command not found - is git installed?")
+
+        def expire():
+            expired.set()
+            process.kill()  # the blocked read below then sees the end of the pipe
+
+        timer = None if timeout is None else threading.Timer(max(timeout, 0), expire)
+        if timer:
+            timer.start()
+        try:
+            for path, text, complete in iter_file_diffs(process.stdout, max_file_bytes):
+                if expired.is_set():
+                    # Cut off by the kill: the last piece may be incomplete
+                    staged.timed_out = stopped_early = True
+                    break
+                if not path and not text.startswith(FILE_HEADER_PREFIX):
+                    staged.changes = parse_raw_status(text)
+                    continue
+                if selector is None:
+                    parts.append(text)
+                    staged.files.append(path)
+                else:
+                    selector.add(path, text, complete)
+            else:
+                if expired.is_set():
+                    staged.timed_out = stopped_early = True
+        finally:
+            if timer:
+                timer.cancel()
+            if stopped_early:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+
+        # A kill racing the end of a complete read is not a git error
+        if not stopped_early and not expired.is_set() and returncode != 0:
+            stderr.seek(0)
+            error_msg = stderr.read().decode("utf-8", errors="replace").strip() or "Unknown git error"
+            raise GitCommandError(f"Git command failed: {error_msg}")
+
+    if selector is not None:
+        for path, text, reduced in selector.finish():
+            parts.append(text)
+            if reduced is None:
+                staged.files.append(path)
+            else:
+                staged.reduced.append(reduced)
+
+    if stopped_early:
+        included = set(staged.files) | {file.path for file in staged.reduced}
+        staged.omitted = [p for _, p in staged.changes if p not in included]
+        if staged.omitted:
+            parts.append(f"[{len(staged.omitted)} file(s) omitted: {', '.join(sorted(staged.omitted))}]\n")
+
+    staged.text = "".join(parts)
+    return staged
+
+
+def get_staged_diff(token_budget: Optional[int] = None, cwd: str = None) -> str:
+    """Returns the staged diff as text, streamed within `token_budget` tokens if given."""
+    return read_staged_diff(token_budget, cwd=cwd).text.strip()
+
+# "<prefix>: <summary>", optionally with a scope and breaking-change mark: "feat(cli)!: ..."
+COMMIT_LINE = re.compile(r"[a-z]+(?:\([\w./-]+\))?!?: \S.*")
+
+
+def complete_commit_line(text: str) -> Optional[str]:
+    """
+    The commit message in a streamed answer as soon as it is complete: the first
+    non-blank line, once ended by a newline, if it reads `<prefix>: <summary>`.
+    None while that line may still grow, or if it is not a commit message line.
+    """
+    line, newline, _ = text.lstrip().partition("\n")
+    if not newline:
+        return None
+    line = line.strip()
+    return line if COMMIT_LINE.fullmatch(line) else None
+
 
 def sanitize_commit_message(msg: str) -> str:
     """
@@ -43,13 +233,17 @@ def sanitize_commit_message(msg: str) -> str:
     return sanitized_msg
 
 
-def run_git_command(args: Union[List[str], str], cwd: str = None) -> subprocess.CompletedProcess:
+def run_git_command(
+    args: Union[List[str], str], cwd: str = None, input: str = None, env: Optional[Dict[str, str]] = None
+) -> subprocess.CompletedProcess:
     """
     Execute git command with comprehensive error handling and security measures.
     
     Args:
         args: Git command arguments (list or string)
         cwd: Working directory for the command
+        input: Text passed to the command on stdin (e.g. for --pathspec-from-file=-)
+        env: Variables set for the command on top of the current environment (e.g. GIT_AUTHOR_DATE)
         
     Returns:
         CompletedProcess object with stdout, stderr, and returncode
@@ -83,19 +277,27 @@ def run_git_command(args: Union[List[str], str], cwd: str = None) -> subprocess.
     
     # Construct full command
     full_command = ["git"] + safe_args
+    options = {} if env is None else {"env": {**os.environ, **env}}
     
     try:
         # Execute with timeout to prevent hanging
-        result = subprocess.run(
-            full_command,
-            capture_output=True,
-            text=True,
-            timeout=30,  # 30 second timeout
-        )
+        with span(f"git.{safe_args[0]}"):
+            result = subprocess.run(
+                full_command,
+                capture_output=True,
+                text=True,
+                timeout=30,  # 30 second timeout
+                cwd=cwd,
+                input=input,
+                **options,
+            )
         
-        # Handle git command failure
+        # Handle git command failure (some commands, like commit, explain on stdout)
         if result.returncode != 0:
-            error_msg = result.stderr.strip() if result.stderr else "Unknown git error"
+            error_msg = result.stderr.strip() if result.stderr else ""
+            if not error_msg and isinstance(result.stdout, str):
+                error_msg = result.stdout.strip()
+            error_msg = error_msg or "Unknown git error"
             print(f"\n{Colors.RED}✗ Git Error{Colors.RESET}")
             print(f"  Command: {' '.join(full_command)}")
             print(f"  {error_msg}")
@@ -128,6 +330,25 @@ def unstage_all_changes(cwd: str = None) -> bool:
         return False
 
 
+# Printed by `git commit` when the index matches HEAD
+NOTHING_TO_COMMIT_MARKERS = ("nothing to commit", "no changes added to commit", "nothing added to commit")
+
+
+def commit_git(args: List[str], cwd: str = None) -> subprocess.CompletedProcess:
+    """
+    Runs a `git commit` command, reporting an empty index as "No changes to commit".
+
+    Raises:
+        GitCommandError: If nothing is staged or the commit fails
+    """
+    try:
+        return run_git_command(args, cwd=cwd)
+    except GitCommandError as e:
+        if any(marker in str(e) for marker in NOTHING_TO_COMMIT_MARKERS):
+            raise GitCommandError("No changes to commit") from e
+        raise
+
+
 def safe_git_commit(message: str, cwd: str = None) -> bool:
     """
     Safely create a git commit with sanitized message.
@@ -147,13 +368,9 @@ def safe_git_commit(message: str, cwd: str = None) -> bool:
         # Sanitize the commit message
         clean_message = sanitize_commit_message(message)
         
-        # Check if there are changes to commit
-        status_result = run_git_command(["status", "--porcelain"], cwd=cwd)
-        if not status_result.stdout.strip():
-            raise GitCommandError("No changes to commit")
-        
-        # Create the commit
-        run_git_command(["commit", "-m", clean_message], cwd=cwd)
+        # Create the commit; git itself reports when nothing is staged,
+        # which saves a separate status call (and index read)
+        commit_git(["commit", "-m", clean_message], cwd=cwd)
         
         print(f"✓ Successfully committed: {clean_message}")
         return True
@@ -0,0 +1,150 @@
+# File: src/codelibre/utils/git_session.py
+import hashlib
+import os
+import subprocess
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+from codelibre.exceptions import GitCommandError
+from codelibre.utils.file_ranking import load_rules
+from codelibre.utils.git_helpers import StagedDiff, commit_git, read_staged_diff, run_git_command
+
+
+# Stage or unstage any number of paths in one process: NUL-separated pathspecs on stdin
+PATHSPEC_FROM_STDIN = ["--pathspec-from-file=-", "--pathspec-file-nul"]
+
+
+def find_index_file(cwd: Optional[str] = None) -> Optional[Path]:
+    """
+    Locates the repository's index file without starting git: GIT_INDEX_FILE if set,
+    otherwise the `index` of the nearest .git directory (or of the directory
+    a worktree's .git file points to). None if it cannot be found.
+    """
+    override = os.getenv("GIT_INDEX_FILE")
+    start = Path(cwd or os.getcwd()).resolve()
+    if override:
+        return start / override
+
+    for directory in (start, *start.parents):
+        dot_git = directory / ".git"
+        if dot_git.is_dir():
+            return dot_git / "index"
+        if dot_git.is_file():
+            try:
+                content = dot_git.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            if content.startswith("gitdir:"):
+                git_dir = Path(content[len("gitdir:"):].strip())
+                return (directory / git_dir).resolve() / "index"
+            return None
+    return None
+
+
+def find_worktree_root(cwd: Optional[str] = None) -> Optional[Path]:
+    """The top directory of the working tree (the one holding `.git`), found without starting git."""
+    start = Path(cwd or os.getcwd()).resolve()
+    for directory in (start, *start.parents):
+        if (directory / ".git").exists():
+            return directory
+    return None
+
+
+def session_id(diff: str, cwd: Optional[str] = None) -> str:
+    """Identifier of the chat session about `diff` in this repository, for resuming it."""
+    hasher = hashlib.sha256()
+    for part in (str(find_index_file(cwd) or Path(cwd or os.getcwd()).resolve()), diff):
+        data = part.encode("utf-8", errors="surrogatepass")
+        hasher.update(len(data).to_bytes(8, "little"))
+        hasher.update(data)
+    return hasher.hexdigest()[:32]
+
+
+class GitSession:
+    """
+    Runs git for one working tree with as few processes as possible.
+
+    Paths are staged in a single `git add` fed through stdin, status and diff
+    come from one `git diff --cached --patch-with-raw`, and a commit does not
+    check status first. The staged diff is reused until the index changes,
+    detected from the index file's size and modification time, so repeated
+    reads in one run do not make git re-read the index.
+    """
+
+    def __init__(self, cwd: Optional[str] = None):
+        self.cwd = cwd
+        self._index_file = find_index_file(cwd)
+        self._staged: Optional[Tuple[Tuple, Tuple, StagedDiff]] = None
+
+    def _index_signature(self) -> Optional[Tuple]:
+        if self._index_file is None:
+            return None
+        try:
+            stat = self._index_file.stat()
+        except FileNotFoundError:
+            return ("missing",)  # fresh repository: git writes the index on first staging
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _invalidate(self) -> None:
+        self._staged = None
+
+    def run(self, args, input: Optional[str] = None) -> subprocess.CompletedProcess:
+        """Runs any git command in this session's working tree."""
+        return run_git_command(args, cwd=self.cwd, input=input)
+
+    def stage(self, paths: Iterable[str]) -> None:
+        """Stages `paths` (added, modified or deleted) with one git process."""
+        paths = list(paths)
+        if not paths:
+            return
+        self._invalidate()
+        self.run(["add"] + PATHSPEC_FROM_STDIN, input="\0".join(paths))
+
+    def stage_all(self) -> None:
+        """Stages every change in the working tree."""
+        self._invalidate()
+        self.run(["add", "."])
+
+    def unstage(self, paths: Optional[Iterable[str]] = None) -> None:
+        """Unstages `paths`, or everything if none are given."""
+        self._invalidate()
+        if paths is None:
+            self.run(["reset", "-q", "HEAD"])
+            return
+        paths = list(paths)
+        if paths:
+            self.run(["reset", "-q", "HEAD"] + PATHSPEC_FROM_STDIN, input="\0".join(paths))
+
+    def staged_diff(self, token_budget: Optional[int] = None, timeout: Optional[float] = None) -> StagedDiff:
+        """
+        Status and diff of the staged changes (see read_staged_diff), with the
+        working tree's .codelibreignore rules, reused while the index is unchanged.
+        A read cut short by `timeout` is not reused.
+        """
+        rules = load_rules(find_worktree_root(self.cwd)) if token_budget is not None else []
+        key = (token_budget, tuple(rules))
+        signature = self._index_signature()
+        if self._staged is not None and signature is not None:
+            cached_key, cached_signature, staged = self._staged
+            if cached_key == key and cached_signature == signature:
+                return staged
+
+        staged = read_staged_diff(token_budget, cwd=self.cwd, timeout=timeout, rules=rules)
+        self._staged = None if staged.timed_out else (key, signature, staged)
+        return staged
+
+    def commit(self, message: str) -> subprocess.CompletedProcess:
+        """
+        Commits the staged changes with `message` as given.
+
+        Raises:
+            GitCommandError: "No changes to commit" if nothing is staged, or if the commit fails
+        """
+        signature = self._index_signature()
+        if self._staged is not None and signature is not None and self._staged[1] == signature:
+            # Known empty index: no need to start git to find out
+            if not self._staged[2].changes:
+                raise GitCommandError("No changes to commit")
+        self._invalidate()
+        return commit_git(["commit", "-m", message], cwd=self.cwd)
@@ -0,0 +1,238 @@
+# File: src/codelibre/utils/hedging.py
+import asyncio
+import json
+import math
+import os
+import time
+from contextlib import aclosing, suppress
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Tuple
+from codelibre.config import (
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_HISTORY,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    get_cache_dir,
+)
+
+
+# Queued after the last item of a stream
+_END = object()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank `q`th percentile (0-100) of non-empty `values`."""
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class LatencyHistory:
+    """
+    Times to first token of recent LLM requests per model, and whether each
+    was hedged, kept in a small local JSON file. Decides how long a request
+    may wait for its first token before it is hedged.
+    """
+
+    def __init__(self, model: str, path: Optional[Path] = None):
+        self.model = model
+        self.path = Path(path) if path else get_cache_dir() / "latency.json"
+        self._store = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                store = json.load(f)
+        except (OSError, ValueError):
+            store = {}
+        store.setdefault("models", {})
+        return store
+
+    def save(self) -> None:
+        """Writes the history atomically; failures are ignored (hedging is best-effort)."""
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._store, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            with suppress(OSError):
+                tmp_path.unlink(missing_ok=True)
+
+    @property
+    def requests(self) -> List[dict]:
+        return self._store["models"].setdefault(self.model, [])
+
+    def record(self, first_token: float, hedged: bool) -> None:
+        """Remembers one request: seconds to its first token, and whether it was hedged."""
+        requests = self.requests
+        requests.append({"first_token": round(first_token, 3), "hedged": hedged, "time": time.time()})
+        del requests[:-HEDGE_HISTORY]
+
+    def hedge_delay(self, q: float, max_percent: float) -> Optional[float]:
+        """
+        Seconds to wait for a first token before hedging: the `q`th percentile of
+        recent times to first token (HEDGE_DEFAULT_DELAY until HEDGE_MIN_SAMPLES
+        are known). None once `max_percent` of the last HEDGE_HISTORY requests
+        were hedged, which caps the extra cost.
+        """
+        requests = self.requests
+        if sum(request["hedged"] for request in requests) >= max_percent / 100 * HEDGE_HISTORY:
+            return None
+        if len(requests) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(percentile([request["first_token"] for request in requests], q), HEDGE_MIN_DELAY)
+
+
+class _Failure:
+    """An error raised by a stream, queued in place of its next item."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def _pump(stream: AsyncIterator, queue: asyncio.Queue) -> None:
+    """
+    Moves the items of `stream` into `queue`, then _END or the error. The stream
+    is iterated and closed within this one task, as HTTP clients expect.
+    """
+    try:
+        async with aclosing(stream):
+            async for item in stream:
+                queue.put_nowait(item)
+    except Exception as e:
+        queue.put_nowait(_Failure(e))
+    else:
+        queue.put_nowait(_END)
+
+
+async def _stop(task: asyncio.Task) -> None:
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+
+async def _resume(first, queue: asyncio.Queue, pump: asyncio.Task) -> AsyncIterator:
+    """`first`, then the rest of a pumped stream; closing this iterator stops the stream."""
+    try:
+        item = first
+        while item is not _END:
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+            item = await queue.get()
+    finally:
+        await _stop(pump)
+
+
+async def first_to_stream(
+    open_stream: Callable[[], AsyncIterator],
+    hedge_after: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+    clock: Callable[[], float] = time.monotonic,
+) -> Tuple[AsyncIterator, bool, float]:
+    """
+    Opens `open_stream()` and waits for its first item. If none has arrived
+    after `hedge_after` seconds (None: never), an identical second stream is
+    opened; the first of the two to yield wins and the other is cancelled.
+    A stream failing before its first item leaves the race to the other one;
+    if both fail, the first error is raised.
+
+    Returns the winning stream (from its first item on), whether a second
+    stream was opened, and the seconds from opening the winner to its first item.
+    """
+    queues, pumps, firsts, started = [], [], [], []
+
+    def launch():
+        queue = asyncio.Queue()
+        queues.append(queue)
+        started.append(clock())
+        pumps.append(asyncio.ensure_future(_pump(open_stream(), queue)))
+        firsts.append(asyncio.ensure_future(queue.get()))
+
+    launch()
+    winner, error = None, None
+    try:
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(firsts, timeout=hedge_after)
+            if not done:
+                if on_hedge:
+                    on_hedge()
+                launch()
+        pending = set(firsts)
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for first in sorted(done, key=firsts.index):
+                if not isinstance(first.result(), _Failure):
+                    winner = firsts.index(first)
+                    break
+                error = error or first.result().error
+        if winner is None:
+            raise error
+        arrived = clock()
+    finally:
+        for index in range(len(pumps)):
+            if index != winner:
+                firsts[index].cancel()
+                await _stop(pumps[index])
+
+    stream = _resume(firsts[winner].result(), queues[winner], pumps[winner])
+    return stream, len(pumps) > 1, arrived - started[winner]
+
+
+class HedgedLLM:
+    """
+    Wraps a chat model so `astream` hedges slow requests (see first_to_stream),
+    waiting as long as `history` allows and recording every time to first token
+    in it. `hedged` counts the second requests sent.
+
+    The second request is sent with `hedge_tags` added to its config (e.g.
+    LangGraph's nostream tag), so only the first request's tokens reach a live
+    display; `hedge_won` tells whether the last answer came from the hidden one.
+    """
+
+    def __init__(self, llm, history: LatencyHistory, q: float, max_percent: float,
+                 on_hedge: Optional[Callable[[], None]] = None, hedge_tags: Sequence[str] = ()):
+        self.llm = llm
+        self.history = history
+        self.q = q
+        self.max_percent = max_percent
+        self.on_hedge = on_hedge
+        self.hedge_tags = list(hedge_tags)
+        self.hedged = 0
+        self.hedge_won = False
+
+    def _open(self, messages, kwargs: dict, hedge: bool) -> AsyncIterator:
+        if hedge and self.hedge_tags:
+            config = dict(kwargs.get("config") or {})
+            config["tags"] = [*config.get("tags", []), *self.hedge_tags]
+            kwargs = {**kwargs, "config": config}
+        return _labelled(hedge, self.llm.astream(messages, **kwargs))
+
+    async def astream(self, messages, **kwargs) -> AsyncIterator:
+        opened = []
+
+        def open_stream():
+            opened.append(True)
+            return self._open(messages, kwargs, hedge=len(opened) > 1)
+
+        stream, hedged, first_token = await first_to_stream(
+            open_stream,
+            self.history.hedge_delay(self.q, self.max_percent),
+            self.on_hedge,
+        )
+        self.hedged += hedged
+        self.history.record(first_token, hedged)
+        self.history.save()
+        async with aclosing(stream):
+            async for from_hedge, chunk in stream:
+                self.hedge_won = from_hedge
+                yield chunk
+
+
+async def _labelled(label, stream: AsyncIterator) -> AsyncIterator:
+    """The items of `stream` as (label, item) pairs."""
+    async with aclosing(stream):
+        async for item in stream:
+            yield label, item
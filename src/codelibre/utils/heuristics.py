@@ -0,0 +1,192 @@
+# File: src/codelibre/utils/heuristics.py
+import posixpath
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from codelibre.config import HEURISTIC_MAX_CHANGED_LINES, HEURISTIC_MIN_CONFIDENCE, MAX_CHARACTERS
+from codelibre.utils.diff_model import parse_diff
+from codelibre.utils.fallback_message import VERBS, is_doc_path, is_test_path
+from codelibre.utils.git_helpers import StagedDiff
+
+
+# Files whose only change may be a version number
+VERSION_FILES = {
+    "pyproject.toml", "setup.py", "setup.cfg", "package.json", "cargo.toml",
+    "__init__.py", "version.py", "_version.py", "version", "version.txt",
+}
+VERSION_ASSIGNMENT = re.compile(r"""^\s*["']?(?:__version__|version)["']?\s*[=:]\s*["']v?(\d+(?:\.\d+)+[0-9a-z.]*)["'],?\s*$""", re.I)
+BARE_VERSION = re.compile(r"^\s*v?(\d+(?:\.\d+)+[0-9a-z.]*)\s*$", re.I)
+
+# Leading whitespace is meaningful in these, so re-indenting is not a formatting fix
+INDENT_SENSITIVE = {".py", ".yaml", ".yml", ".mk", ".haml", ".pug"}
+
+
+@dataclass
+class FileChange:
+    """Added and removed lines of one staged file, and each hunk's text before and after (context included)."""
+    path: str
+    status: str
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    hunks: List[Tuple[List[str], List[str]]] = field(default_factory=list)
+
+
+@dataclass
+class Classification:
+    """A commit message found without the LLM, and how sure the rule that wrote it is (0-1)."""
+    message: str
+    confidence: float
+    rule: str
+
+
+def file_changes(staged: StagedDiff) -> List[FileChange]:
+    """Per-file added/removed lines of a staged diff (its numstat, with the lines themselves)."""
+    statuses = {path: status for status, path in staged.changes}
+    changes = []
+    for file in parse_diff(staged.text).files:
+        change = FileChange(path=file.path, status=statuses.get(file.path, "M"))
+        for hunk in file.hunks:
+            before, after = [], []
+            for line in hunk.lines():
+                if line.startswith("+"):
+                    change.added.append(line[1:])
+                    after.append(line[1:])
+                elif line.startswith("-"):
+                    change.removed.append(line[1:])
+                    before.append(line[1:])
+                elif line.startswith(" "):
+                    before.append(line[1:])
+                    after.append(line[1:])
+            change.hunks.append((before, after))
+        changes.append(change)
+    return changes
+
+
+def describe_path(path: str) -> str:
+    """A file's name as summary words: 'README.md' -> 'readme', 'test_git_helpers.py' -> 'git helpers'."""
+    stem = posixpath.splitext(posixpath.basename(path))[0].lower()
+    if is_test_path(path):
+        stem = re.sub(r"^test_|_test$|\.test$|\.spec$", "", stem)
+    return re.sub(r"[^a-z0-9.]+", " ", stem).strip(" .") or "file"
+
+
+def _message(prefix: str, summary: str) -> str:
+    if len(summary) > MAX_CHARACTERS:
+        summary = summary[:MAX_CHARACTERS].rsplit(" ", 1)[0]
+    return f"{prefix}: {summary}"
+
+
+def _verb(changes: List[FileChange]) -> str:
+    statuses = {change.status for change in changes}
+    return VERBS.get(statuses.pop(), "update") if len(statuses) == 1 else "update"
+
+
+def _subject(changes: List[FileChange], plural: str) -> str:
+    names = [describe_path(change.path) for change in changes]
+    if len(names) == 1:
+        return names[0]
+    if len(names) == 2 and len(" and ".join(names)) <= MAX_CHARACTERS // 2:
+        return " and ".join(names)
+    return plural
+
+
+def _changed_lines(changes: List[FileChange]) -> int:
+    return sum(len(change.added) + len(change.removed) for change in changes)
+
+
+def version_bump(changes: List[FileChange]) -> Optional[Classification]:
+    """Only version numbers changed, to a single new version."""
+    versions = set()
+    for change in changes:
+        name = posixpath.basename(change.path).lower()
+        if name not in VERSION_FILES or not change.added or len(change.added) != len(change.removed):
+            return None
+        pattern = BARE_VERSION if name in ("version", "version.txt") else VERSION_ASSIGNMENT
+        for line in change.removed:
+            if not pattern.match(line):
+                return None
+        for line in change.added:
+            match = pattern.match(line)
+            if not match:
+                return None
+            versions.add(match.group(1).lower())
+    if len(versions) != 1:
+        return None
+    return Classification(_message("chore", f"bump version to {versions.pop()}"), 0.95, "version bump")
+
+
+def whitespace_only(changes: List[FileChange]) -> Optional[Classification]:
+    """Edited files whose non-whitespace content is unchanged, in the same order."""
+    if any(change.status != "M" for change in changes) or not _changed_lines(changes):
+        return None
+
+    # Each hunk's text before and after, context included, as ordered tokens: whitespace
+    # may change in amount, but never appear or vanish between tokens ("return a" and
+    # "returna" differ) and lines may not move (swapping two calls is not formatting)
+    same_lines = True
+    for change in changes:
+        indent_sensitive = posixpath.splitext(change.path)[1].lower() in INDENT_SENSITIVE
+        for before, after in change.hunks:
+            if indent_sensitive:
+                def normalize(line):
+                    body = line.lstrip()
+                    return (line[:len(line) - len(body)] if body else ""), body.split()
+                if list(map(normalize, before)) != list(map(normalize, after)):
+                    return None
+                continue
+            before_tokens = [line.split() for line in before]
+            after_tokens = [line.split() for line in after]
+            if sum(before_tokens, []) != sum(after_tokens, []):
+                return None
+            same_lines = same_lines and list(filter(None, before_tokens)) == list(filter(None, after_tokens))
+
+    kind = "whitespace" if same_lines else "formatting"
+    subject = _subject(changes, f"{len(changes)} files")
+    return Classification(_message("style", f"fix {kind} in {subject}"), 0.95 if same_lines else 0.9, kind)
+
+
+def docs_only(changes: List[FileChange]) -> Optional[Classification]:
+    """Only documentation files changed; small changes need no description of their content."""
+    if not all(is_doc_path(change.path) for change in changes):
+        return None
+    confidence = 0.9 if _changed_lines(changes) <= HEURISTIC_MAX_CHANGED_LINES else 0.7
+    return Classification(_message("docs", f"{_verb(changes)} {_subject(changes, 'docs')}"), confidence, "docs")
+
+
+def tests_only(changes: List[FileChange]) -> Optional[Classification]:
+    """Only test files changed."""
+    if not all(is_test_path(change.path) for change in changes):
+        return None
+    confidence = 0.85 if _changed_lines(changes) <= HEURISTIC_MAX_CHANGED_LINES else 0.6
+    subject = _subject(changes, "")
+    summary = f"{_verb(changes)} {subject} tests" if subject else f"{_verb(changes)} tests"
+    return Classification(_message("test", summary), confidence, "tests")
+
+
+RULES = (version_bump, whitespace_only, docs_only, tests_only)
+
+
+def classify_diff(staged: StagedDiff) -> Optional[Classification]:
+    """
+    Commit message for a trivial change (version bump, whitespace or formatting,
+    docs or tests only) from the staged diff alone, with the rule's confidence.
+    None if no rule applies or part of the diff was left out or sent as a stat line.
+    """
+    if not staged.changes or staged.omitted or staged.reduced:
+        return None
+    changes = file_changes(staged)
+    if not changes:
+        return None
+    for rule in RULES:
+        classification = rule(changes)
+        if classification is not None:
+            return classification
+    return None
+
+
+def trivial_commit_message(staged: StagedDiff, min_confidence: float = HEURISTIC_MIN_CONFIDENCE) -> Optional[Classification]:
+    """The classify_diff result if it is at least `min_confidence`, else None (ask the LLM)."""
+    classification = classify_diff(staged)
+    if classification is None or classification.confidence < min_confidence:
+        return None
+    return classification
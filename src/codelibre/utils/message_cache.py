@@ -0,0 +1,127 @@
+# File: src/codelibre/utils/message_cache.py
+import json
+import os
+import time
+from contextlib import suppress
+from pathlib import Path
+from typing import Iterable, Optional
+import xxhash
+from codelibre.config import (
+    MESSAGE_CACHE_MAX_AGE,
+    MESSAGE_CACHE_MAX_BYTES,
+    MESSAGE_CACHE_MAX_ENTRIES,
+    get_cache_dir,
+)
+
+
+def message_cache_key(diff: str, system_prompt: str, model: str, feedback: Iterable[str] = ()) -> str:
+    """
+    Content-addressed key for a generated commit message.
+    Every part is length-prefixed so that different splits can never collide.
+    """
+    hasher = xxhash.xxh3_128()
+    for part in (diff, system_prompt, model, *feedback):
+        data = part.encode("utf-8", errors="surrogatepass")
+        hasher.update(len(data).to_bytes(8, "little"))
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+class MessageCache:
+    """
+    On-disk cache of commit messages, one small JSON file per key.
+    Recency is the file's mtime, refreshed on every read: entries expire once
+    unused for `max_age` seconds, and the least recently used ones are evicted
+    once the cache holds more than `max_entries` or `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        max_entries: int = MESSAGE_CACHE_MAX_ENTRIES,
+        max_bytes: int = MESSAGE_CACHE_MAX_BYTES,
+        max_age: float = MESSAGE_CACHE_MAX_AGE,
+    ):
+        self.directory = Path(directory) if directory else get_cache_dir() / "messages"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached message for `key`, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        with suppress(OSError):
+            os.utime(path)
+        return entry.get("message")
+
+    def put(self, key: str, message: str) -> None:
+        """
+        Stores `message` under `key` atomically, then enforces the size limits.
+        The cache is best-effort: filesystem errors are ignored.
+        """
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"message": message, "created": time.time()}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            with suppress(OSError):
+                tmp_path.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """Removes expired entries, then the least recently used ones over the limits."""
+        now = time.time()
+        entries = []
+        removed = 0
+        try:
+            paths = list(self.directory.glob("*.json"))
+        except OSError:
+            return 0
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()  # oldest first
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """Deletes every cached message and returns how many were removed."""
+        removed = 0
+        try:
+            paths = list(self.directory.glob("*.json"))
+        except OSError:
+            return 0
+        for path in paths:
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
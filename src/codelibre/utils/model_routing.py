@@ -0,0 +1,46 @@
+# File: src/codelibre/utils/model_routing.py
+from dataclasses import dataclass
+from codelibre.config import (
+    ROUTING_FAST_MAX_FILES,
+    ROUTING_STRONG_MIN_FILES,
+    ROUTING_STRONG_MIN_KINDS,
+    Settings,
+)
+from codelibre.utils.diff_model import parse_diff
+from codelibre.utils.estimate_tokens import estimate_text_tokens
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """The model tier picked for a run, the model configured for it and why it was picked."""
+    tier: str
+    model: str
+    reason: str
+
+
+def route_model(diff: str, settings: Settings, summarized: bool = False) -> ModelRoute:
+    """
+    Picks the model tier for a commit message from the diff's estimated input
+    tokens and how spread out it is. Summarized diffs, diffs of at least
+    routing_strong_min_tokens, and changes spanning many files or file types go
+    to the strong tier; small changes to a few files go to the fast tier;
+    everything else to DEFAULT_MODEL. Tiers without a model of their own use
+    DEFAULT_MODEL, so routing changes nothing until FAST_MODEL or STRONG_MODEL is set.
+    """
+    tokens = estimate_text_tokens(diff)
+    files = parse_diff(diff).files
+    kinds = {file.kind for file in files}
+
+    if summarized:
+        tier, reason = "strong", "summarized diff"
+    elif tokens >= settings.routing_strong_min_tokens:
+        tier, reason = "strong", f"~{tokens} tokens"
+    elif len(files) >= ROUTING_STRONG_MIN_FILES:
+        tier, reason = "strong", f"{len(files)} files"
+    elif len(kinds) >= ROUTING_STRONG_MIN_KINDS:
+        tier, reason = "strong", f"{len(kinds)} file types"
+    elif tokens <= settings.routing_fast_max_tokens and len(files) <= ROUTING_FAST_MAX_FILES:
+        tier, reason = "fast", f"~{tokens} tokens, {len(files)} file(s)"
+    else:
+        tier, reason = "default", f"~{tokens} tokens, {len(files)} file(s)"
+    return ModelRoute(tier, settings.tier_model(tier), reason)
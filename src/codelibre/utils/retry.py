@@ -0,0 +1,164 @@
+# File: src/codelibre/utils/retry.py
+import asyncio
+import email.utils
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+from codelibre.config import LLM_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+from codelibre.exceptions import LLMRequestError
+
+
+T = TypeVar("T")
+
+# Status codes worth retrying: timeouts, conflicts, rate limits, server errors, overload
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Delay requested by the server through `retry-after-ms` or `retry-after`
+    (seconds or an HTTP date), or None if the response did not ask for one.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        return max(float(headers.get("retry-after-ms")) / 1000, 0.0)
+    except (TypeError, ValueError):
+        pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_tz(retry_after)
+    if parsed is None:
+        return None
+    return max(email.utils.mktime_tz(parsed) - time.time(), 0.0)
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True for rate limits, overload, transient server errors and connection failures."""
+    from anthropic import APIConnectionError, APIStatusError
+
+    if isinstance(exc, APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(exc, APIStatusError):
+        headers = getattr(exc.response, "headers", None) or {}
+        should_retry = headers.get("x-should-retry")
+        if should_retry in ("true", "false"):
+            return should_retry == "true"
+        if exc.status_code in RETRYABLE_STATUS_CODES:
+            return True
+        body = getattr(exc, "body", None) or {}
+        error = body.get("error", {}) if isinstance(body, dict) else {}
+        return isinstance(error, dict) and error.get("type") == "overloaded_error"
+    return False
+
+
+def describe_error(exc: BaseException) -> str:
+    """Short human-readable reason for a retry."""
+    from anthropic import APIConnectionError
+
+    if isinstance(exc, APIConnectionError):
+        return "Connection problem"
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "Rate limited"
+    if status == 529:
+        return "API is overloaded"
+    return f"API error {status}" if status else type(exc).__name__
+
+
+def backoff_delay(
+    attempt: int,
+    base_delay: float = LLM_RETRY_BASE_DELAY,
+    max_delay: float = LLM_RETRY_MAX_DELAY,
+    rng: Callable[[], float] = random.random,
+) -> float:
+    """
+    Exponential backoff with full jitter: a random delay between 0 and
+    base_delay * 2**attempt (capped), so concurrent clients do not retry in lockstep.
+    """
+    return rng() * min(max_delay, base_delay * (2 ** attempt))
+
+
+async def retry_async(
+    call: Callable[[], Awaitable[T]],
+    deadline: float,
+    max_attempts: int = LLM_MAX_ATTEMPTS,
+    on_retry: Optional[Callable[[int, float, BaseException], None]] = None,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> T:
+    """
+    Awaits `call()` until it succeeds, retrying retryable errors.
+
+    Waits honor Retry-After when the server sends it and use jittered
+    exponential backoff otherwise. Every attempt and wait happens before
+    `deadline` (a `clock()` timestamp); cancellation propagates immediately.
+
+    Raises:
+        LLMRequestError: If the deadline passes before a successful call
+        Exception: The last error if it is not retryable or attempts run out
+    """
+    for attempt in range(max_attempts):
+        remaining = deadline - clock()
+        if remaining <= 0:
+            raise LLMRequestError("LLM request deadline exceeded")
+        try:
+            async with asyncio.timeout(remaining):
+                return await call()
+        except TimeoutError:
+            raise LLMRequestError("LLM request deadline exceeded") from None
+        except Exception as e:
+            if not is_retryable_error(e) or attempt == max_attempts - 1:
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if clock() + delay >= deadline:
+                raise
+            if on_retry:
+                on_retry(attempt, delay, e)
+            await sleep(delay)
+
+    # Only reachable with max_attempts < 1
+    raise LLMRequestError("No LLM request attempts allowed")
+
+
+class RateLimiter:
+    """
+    Request rate shared by concurrent tasks: a token bucket refilled at
+    `per_minute` requests a minute, holding at most `burst`. Each acquire
+    reserves a token, waiting for it if the bucket is empty.
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    async def acquire(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        # Reserved before waiting, so tasks queue up in order without a lock
+        self._tokens -= 1
+        if self._tokens < 0:
+            await self.sleep(-self._tokens / self.rate)
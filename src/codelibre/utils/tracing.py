@@ -0,0 +1,163 @@
+# File: src/codelibre/utils/tracing.py
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class TraceRecorder:
+    """Timed spans of one run, in perf_counter seconds."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: List[Tuple[str, float, float, int]] = []  # (name, start, end, track)
+        self.last_start: Dict[str, float] = {}  # most recent start of each span name
+        self.marked: Dict[str, float] = {}  # start each mark_first() name was last recorded from
+
+    def record(self, name: str, start: float, end: Optional[float] = None, track: Optional[int] = None) -> None:
+        end = time.perf_counter() if end is None else end
+        self.events.append((name, start, end, current_track() if track is None else track))
+
+    def summary(self) -> List[Tuple[str, int, float]]:
+        """(name, calls, total seconds) per span name, in order of first start."""
+        totals: Dict[str, List] = {}
+        for name, start, end, _ in sorted(self.events, key=lambda event: event[1]):
+            entry = totals.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += end - start
+        return [(name, calls, total) for name, (calls, total) in totals.items()]
+
+    def chrome_trace(self) -> dict:
+        """The spans in Chrome's trace event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": round((start - self.origin) * 1e6, 3),
+                    "dur": round((end - start) * 1e6, 3),
+                    "pid": pid,
+                    "tid": track,
+                }
+                for name, start, end, track in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+_recorder: Optional[TraceRecorder] = None
+
+
+def enable_tracing() -> TraceRecorder:
+    """Starts recording spans for this process and returns the recorder."""
+    global _recorder
+    _recorder = TraceRecorder()
+    return _recorder
+
+
+def disable_tracing() -> Optional[TraceRecorder]:
+    """Stops recording; returns what was recorded, if anything."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def get_recorder() -> Optional[TraceRecorder]:
+    return _recorder
+
+
+def current_track() -> int:
+    """Row of a span in the trace: the running asyncio task, or the thread."""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task)
+    return threading.get_ident()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: TraceRecorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.recorder.last_start[self.name] = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """
+    Context manager timing a stage under `name`. With tracing off this returns
+    a shared no-op object, so instrumented code costs one global lookup.
+    """
+    recorder = _recorder
+    return NO_SPAN if recorder is None else _Span(recorder, name)
+
+
+def mark_first(name: str, since: str) -> None:
+    """
+    Records `name` from the latest start of span `since` until now, once per such
+    start: e.g. time to first token, called on every streamed token.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return
+    start = recorder.last_start.get(since)
+    if start is None or recorder.marked.get(name) == start:
+        return
+    recorder.marked[name] = start
+    recorder.record(name, start)
+
+
+def traced(name: str):
+    """Decorator timing every call of a function (sync or async) as a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _recorder is None:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+# File: src/codelibre/utils/truncation.py
+from typing import List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from codelibre.config import BASE_TEMPLATE, DIFF_PREFIX
+from codelibre.exceptions import TruncationException
+from codelibre.utils.diff_model import parse_diff
+from codelibre.utils.diff_utils import strip_context
+from codelibre.utils.estimate_tokens import TokenCounter, TokenEstimator
+
+
+def _piece_tokens(estimator: TokenEstimator, text: str, kind: str = "text") -> int:
+    # Rounded up so that the sum over pieces never undershoots the joined text
+    return int(estimator.text_tokens(text, kind)) + 1
+
+
+def _diff_tokens(estimator: TokenEstimator, diff: str) -> float:
+    parsed = parse_diff(diff)
+    return estimator.text_tokens(parsed.preamble, "other") + sum(
+        estimator.text_tokens(file.text, file.kind) for file in parsed.files
+    )
+
+
+def _omitted_hunks_marker(count: int, added: int, removed: int) -> str:
+    plural = "s" if count != 1 else ""
+    return f"@@ {count} hunk{plural} omitted (+{added} -{removed}) @@\n"
+
+
+def truncate_diff(diff: str, token_budget: int, estimator: Optional[TokenEstimator] = None) -> str:
+    """
+    Shrinks a unified diff until its estimated size fits `token_budget`.
+    Sizes come from `estimator` (per file type), 4 chars per token by default.
+
+    Applied in order, stopping as soon as the diff fits:
+    1. Drop unchanged context lines from every hunk.
+    2. Replace hunks with a one-line marker, largest hunks first.
+    3. Drop whole files (header included), largest first, listing their paths.
+
+    Raises:
+        TruncationException: If even the list of omitted paths does not fit
+    """
+    estimator = estimator or TokenEstimator()
+    if _diff_tokens(estimator, diff) <= token_budget:
+        return diff
+
+    # Step 1: compress hunks by removing context lines
+    parsed = parse_diff(diff)
+    files = []
+    if parsed.preamble:
+        files.append({"path": "", "kind": "other", "header": parsed.preamble, "hunks": [], "counts": [], "kept": None})
+    for file in parsed.files:
+        files.append({
+            "path": file.path,
+            "kind": file.kind,
+            "header": file.header,
+            "hunks": [strip_context(hunk.text) for hunk in file.hunks],
+            "counts": [(hunk.added, hunk.removed) for hunk in file.hunks],
+            "kept": None,
+        })
+
+    header_tokens = [_piece_tokens(estimator, f["header"], f["kind"]) for f in files]
+    hunk_tokens = [[_piece_tokens(estimator, h, f["kind"]) for h in f["hunks"]] for f in files]
+    total = sum(header_tokens) + sum(sum(tokens) for tokens in hunk_tokens)
+
+    # Step 2: replace the largest hunks with markers until the diff fits
+    for f in files:
+        f["kept"] = [True] * len(f["hunks"])
+    candidates = sorted(
+        ((tokens, i, j) for i, file_tokens in enumerate(hunk_tokens) for j, tokens in enumerate(file_tokens)),
+        reverse=True,
+    )
+    marker_tokens = _piece_tokens(estimator, _omitted_hunks_marker(999, 99999, 99999))
+    for tokens, i, j in candidates:
+        if total <= token_budget:
+            break
+        files[i]["kept"][j] = False
+        total -= tokens
+        # Each file gets at most one marker summarizing its dropped hunks
+        if files[i]["kept"].count(False) == 1:
+            total += marker_tokens
+
+    # Step 3: drop whole files, largest remaining first
+    file_sizes = [
+        header_tokens[i] + sum(t for t, kept in zip(hunk_tokens[i], f["kept"]) if kept)
+        + (marker_tokens if not all(f["kept"]) else 0)
+        for i, f in enumerate(files)
+    ]
+    dropped_paths = []
+    omitted_files_line_tokens = _piece_tokens(estimator, "[999 file(s) omitted: ]\n")
+    for size, i in sorted(((size, i) for i, size in enumerate(file_sizes)), reverse=True):
+        if total <= token_budget:
+            break
+        if not dropped_paths:
+            total += omitted_files_line_tokens
+        files[i]["dropped"] = True
+        dropped_paths.append(files[i]["path"] or "unknown")
+        total -= size
+        total += _piece_tokens(estimator, files[i]["path"] + ", ")
+
+    parts = []
+    for f in files:
+        if f.get("dropped"):
+            continue
+        parts.append(f["header"])
+        omitted, added, removed = 0, 0, 0
+        for hunk, (hunk_added, hunk_removed), kept in zip(f["hunks"], f["counts"], f["kept"]):
+            if kept:
+                parts.append(hunk)
+            else:
+                omitted += 1
+                added += hunk_added
+                removed += hunk_removed
+        if omitted:
+            parts.append(_omitted_hunks_marker(omitted, added, removed))
+    if dropped_paths:
+        parts.append(f"[{len(dropped_paths)} file(s) omitted: {', '.join(sorted(dropped_paths))}]\n")
+
+    truncated = "".join(parts).strip()
+    if _diff_tokens(estimator, truncated) > token_budget:
+        raise TruncationException(
+            f"Diff cannot be reduced below {token_budget} tokens"
+        )
+    return truncated
+
+
+def fit_messages_to_budget(
+    messages: List[BaseMessage],
+    system_prompt: str,
+    token_limit: int,
+    estimator: Optional[TokenEstimator] = None,
+) -> List[BaseMessage]:
+    """
+    Fits a conversation into `token_limit` estimated input tokens,
+    as measured by `estimator` (4 chars per token by default).
+
+    The first message is expected to hold the diff (see BASE_TEMPLATE).
+    The system prompt, the latest AI proposal and the latest feedback are never touched.
+    Older rounds are dropped first (stale proposals before the feedback given on them),
+    then the diff is truncated.
+
+    Raises:
+        TruncationException: If the protected messages alone exceed the limit
+    """
+    estimator = estimator or TokenEstimator()
+    counter = TokenCounter(messages, estimator=estimator.message_tokens, cache=estimator.message_counts())
+    fixed_tokens = estimator.message_tokens(system_prompt) if system_prompt else 0
+    if not messages or fixed_tokens + counter.total <= token_limit:
+        return list(messages)
+
+    diff_message, rest = messages[0], list(messages[1:])
+
+    # Keep the most recent proposal and the feedback on it, drop older rounds first
+    tail = rest[-2:]
+    middle = rest[:-2]
+    dropped = set()
+    for droppable in (AIMessage, HumanMessage):
+        for message in middle:
+            if fixed_tokens + counter.total <= token_limit:
+                break
+            if isinstance(message, droppable):
+                dropped.add(id(message))
+                counter.remove(message)
+    rest = [m for m in middle if id(m) not in dropped] + tail
+
+    if fixed_tokens + counter.total <= token_limit:
+        return [diff_message] + rest
+
+    content = diff_message.content
+    if not isinstance(content, str) or not content.startswith(DIFF_PREFIX):
+        raise TruncationException("Chat context exceeds maximum allowed length and has no diff to truncate")
+
+    # Budget left for the diff body once everything protected is accounted for
+    rest_tokens = counter.remove(diff_message)
+    diff_budget = int(token_limit - fixed_tokens - rest_tokens - estimator.message_tokens(DIFF_PREFIX))
+    if diff_budget <= 0:
+        raise TruncationException(
+            f"System prompt and latest feedback exceed the {token_limit} token limit"
+        )
+
+    diff = truncate_diff(content[len(DIFF_PREFIX):], diff_budget, estimator)
+    return [HumanMessage(content=BASE_TEMPLATE.format(diff=diff))] + rest
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+import pytest
+from unittest.mock import patch
+from codelibre import cli, daemon
+from codelibre.config import current_settings
+from codelibre.exceptions import TruncationException
+from codelibre.utils.async_input import ainput
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return tmp_path / "d.sock"
+
+
+@contextmanager
+def running_server(socket_path):
+    """Daemon serving from a background thread, stopped on exit."""
+    server = daemon.DaemonServer(socket_path, idle_timeout=60)
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=lambda: loop.run_until_complete(server.serve(ready.set)), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    try:
+        yield server
+    finally:
+        loop.call_soon_threadsafe(server.stop)
+        thread.join(5)
+        loop.close()
+
+
+@pytest.fixture
+def server(socket_path):
+    with running_server(socket_path) as server:
+        yield server
+
+
+class TestDaemon:
+    """Test the daemon server and its thin client."""
+
+    def test_no_daemon_falls_back(self, socket_path):
+        """Test that the client reports no daemon so the CLI runs in-process."""
+        assert daemon.generate_via_daemon("diff", path=socket_path) is None
+        assert daemon.daemon_status(socket_path) is None
+
+    @patch("builtins.input", return_value="shorter")
+    def test_output_and_input_relayed(self, mock_input, server, socket_path, capsys):
+        """Test that the run's output reaches the client and its prompts are answered there."""
+        async def fake_stream(diff, **options):
+            print(f"thinking about {diff}")
+            answer = await ainput("feedback? ")
+            return f"feat: {answer}"
+
+        with patch.object(cli, "stream_commit_message", fake_stream):
+            response = daemon.generate_via_daemon("+line", path=socket_path)
+
+        assert response == "feat: shorter"
+        assert "thinking about +line" in capsys.readouterr().out
+        mock_input.assert_called_once_with("feedback? ")
+
+    def test_settings_resolved_per_client(self, server, socket_path, tmp_path, monkeypatch):
+        """Test that each run uses its client's environment and .env, not the daemon's."""
+        async def fake_stream(diff, **options):
+            settings = current_settings()
+            return f"{settings.default_model} {settings.token_limit}"
+
+        other_repo = tmp_path / "other"
+        other_repo.mkdir()
+        (other_repo / ".env").write_text("DEFAULT_TOKEN_LIMIT=2048\nDEFAULT_MODEL=dotenv-model\n")
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "client-key")
+        monkeypatch.setenv("DEFAULT_MODEL", "client-model")
+        monkeypatch.delenv("DEFAULT_TOKEN_LIMIT", raising=False)
+        monkeypatch.chdir(other_repo)
+
+        with patch.object(cli, "stream_commit_message", fake_stream):
+            response = daemon.generate_via_daemon("+line", path=socket_path)
+
+        assert response == "client-model 2048"  # environment variables win over .env, as with load_dotenv
+
+    def test_errors_keep_their_type(self, server, socket_path):
+        """Test that errors the CLI handles specially are re-raised as the same type."""
+        async def fake_stream(diff, **options):
+            raise TruncationException("too big")
+
+        with patch.object(cli, "stream_commit_message", fake_stream):
+            with pytest.raises(TruncationException, match="too big"):
+                daemon.generate_via_daemon("+line", path=socket_path)
+
+    def test_disconnect_cancels_run(self, server, socket_path):
+        """Test that a client going away (Ctrl+C) cancels its run in the daemon."""
+        cancelled = threading.Event()
+
+        async def fake_stream(diff, **options):
+            try:
+                await ainput("waiting? ")
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with patch.object(cli, "stream_commit_message", fake_stream):
+            sock = daemon.connect_daemon(socket_path)
+            with sock, sock.makefile("rb") as replies:
+                sock.sendall(daemon._encode({"type": "generate", "diff": "+line"}))
+                assert json.loads(replies.readline())["type"] == "input"
+            assert cancelled.wait(5)
+
+    def test_socket_private_when_bound(self, socket_path):
+        """Test that the socket is created owner-only, without relying on a later chmod."""
+        with patch.object(daemon.os, "chmod"), running_server(socket_path):
+            mode = socket_path.stat().st_mode & 0o777
+
+        assert mode == 0o600
+
+    def test_status_and_stop(self, server, socket_path):
+        """Test ping and shutdown requests."""
+        assert daemon.daemon_status(socket_path) is not None
+        assert daemon.stop_daemon(socket_path) is True
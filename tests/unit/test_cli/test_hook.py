@@ -0,0 +1,118 @@
+import asyncio
+import os
+import subprocess
+import pytest
+from unittest.mock import patch
+from codelibre import cli, hook
+from codelibre.config import load_settings
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """Git repository with one staged file, used as the working directory."""
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", "/dev/null")
+    monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+    monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+    monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("CODELIBRE_DAEMON_SOCKET", str(tmp_path / "no-daemon.sock"))
+    load_settings.cache_clear()
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    (tmp_path / "app.py").write_text("print('hi')\n")
+    subprocess.run(["git", "add", "app.py"], cwd=tmp_path, check=True)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    load_settings.cache_clear()
+
+
+@pytest.fixture
+def message_file(repo):
+    path = repo / ".git" / "COMMIT_EDITMSG"
+    path.write_text("\n# Please enter the commit message for your changes.\n")
+    return path
+
+
+def answering(response, delay=0.0):
+    """Stand-in for stream_commit_message that answers after `delay` seconds."""
+    async def fake_stream(diff, **options):
+        assert options["interactive"] is False
+        await asyncio.sleep(delay)
+        return response
+    return fake_stream
+
+
+class TestRunHook:
+    """Test the prepare-commit-msg hook."""
+
+    def test_writes_llm_message(self, message_file):
+        """Test that the sanitized AI message is written above the template comments."""
+        with patch.object(cli, "stream_commit_message", answering("Feat: Add Greeting")):
+            assert hook.run_hook([str(message_file)]) == 0
+
+        lines = message_file.read_text().splitlines()
+        assert lines[0] == "feat: add greeting"
+        assert lines[-1].startswith("# Please enter")
+
+    def test_budget_exceeded_uses_fallback(self, message_file, monkeypatch):
+        """Test that a slow AI is abandoned at the budget and a local message is used."""
+        monkeypatch.setenv("CODELIBRE_HOOK_BUDGET", "0.2")
+        with patch.object(cli, "stream_commit_message", answering("feat: too late", delay=30)):
+            assert hook.run_hook([str(message_file)]) == 0
+
+        assert message_file.read_text().splitlines()[0] == "chore: add app.py"
+
+    def test_fallback_message_sanitized(self, repo, message_file, monkeypatch):
+        """Test that file names in the local message follow the commit message format."""
+        monkeypatch.setenv("CODELIBRE_HOOK_BUDGET", "0.2")
+        subprocess.run(["git", "rm", "-q", "--cached", "app.py"], cwd=repo, check=True)
+        (repo / "My-Widget.TSX").write_text("export {}\n")
+        subprocess.run(["git", "add", "My-Widget.TSX"], cwd=repo, check=True)
+        with patch.object(cli, "stream_commit_message", answering("feat: too late", delay=30)):
+            hook.run_hook([str(message_file)])
+
+        assert message_file.read_text().splitlines()[0] == "chore: add mywidget.tsx"
+
+    def test_no_fallback_leaves_file(self, message_file, monkeypatch):
+        """Test that with --no-fallback a timeout leaves the message file untouched."""
+        monkeypatch.setenv("CODELIBRE_HOOK_BUDGET", "0.2")
+        original = message_file.read_text()
+        with patch.object(cli, "stream_commit_message", answering("feat: too late", delay=30)):
+            hook.run_hook([str(message_file), "--no-fallback"])
+
+        assert message_file.read_text() == original
+
+    def test_user_message_respected(self, message_file):
+        """Test that -m messages, merges and existing text are left alone."""
+        with patch.object(cli, "stream_commit_message", answering("feat: x")):
+            hook.run_hook([str(message_file), "message"])
+            message_file.write_text("my own message\n")
+            hook.run_hook([str(message_file)])
+
+        assert message_file.read_text() == "my own message\n"
+
+    def test_errors_never_fail_the_commit(self, message_file):
+        """Test that an unexpected failure still exits 0."""
+        with patch.object(hook, "hook_message", side_effect=RuntimeError("boom")):
+            assert hook.run_hook([str(message_file)]) == 0
+
+
+class TestInstallHook:
+    """Test install_hook function."""
+
+    def test_installs_executable_hook(self, repo):
+        path = hook.install_hook()
+
+        assert path == repo / ".git" / "hooks" / "prepare-commit-msg"
+        assert os.access(path, os.X_OK)
+        assert "-m codelibre hook" in path.read_text()
+
+    def test_foreign_hook_needs_force(self, repo):
+        path = repo / ".git" / "hooks" / "prepare-commit-msg"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("#!/bin/sh\necho mine\n")
+
+        with pytest.raises(FileExistsError):
+            hook.install_hook()
+        assert hook.install_hook(force=True) == path
+        hook.install_hook()  # reinstalling over our own hook is fine
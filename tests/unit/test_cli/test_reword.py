@@ -0,0 +1,162 @@
+import subprocess
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_core.messages import AIMessageChunk
+from codelibre import reword
+from codelibre.config import load_settings
+from codelibre.exceptions import GitCommandError
+from codelibre.graph import nodes
+
+
+def git(repo, *args):
+    return subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit_file(repo, name, content, message):
+    (repo / name).write_text(content)
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """Repository with a base commit and three "wip" commits on top, used as the working directory."""
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", "/dev/null")
+    monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "Author")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "author@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "Committer")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "committer@example.com")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+    monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+    monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path / "cache"))
+    load_settings.cache_clear()
+    nodes.get_message_cache.cache_clear()
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    commit_file(repo, "base.py", "BASE = 1\n", "initial")
+    git(repo, "tag", "base")
+    for i in range(3):
+        commit_file(repo, f"module_{i}.py", f"def handler_{i}(request):\n    return respond({i})\n", "wip")
+    monkeypatch.chdir(repo)
+    yield repo
+    load_settings.cache_clear()
+    nodes.get_message_cache.cache_clear()
+
+
+@pytest.fixture
+def llm():
+    """Stub LLM naming the module it was shown; counts requests."""
+    stub = MagicMock()
+    stub.requests = 0
+
+    async def astream(messages, **kwargs):
+        stub.requests += 1
+        diff = str(messages[-1].content)
+        module = diff.split("module_")[1][0]
+        yield AIMessageChunk(content=f"Feat: Add Handler {module}\n")
+
+    stub.astream = astream
+    with patch.object(nodes, "get_llm", return_value=stub):
+        yield stub
+
+
+class TestReadRange:
+    """Test reading a commit range from one git log."""
+
+    def test_commits_oldest_first(self, repo):
+        commits = reword.read_range("base..HEAD")
+
+        assert [commit.subject for commit in commits] == ["wip"] * 3
+        assert commits[0].changes.files == ["module_0.py"]
+        assert commits[0].changes.changes == [("A", "module_0.py")]
+        assert commits[1].parents == [commits[0].sha]
+        assert commits[0].author_name == "Author"
+
+    def test_invalid_utf8_replaced(self, repo):
+        """Test that a commit with non-UTF-8 content or message does not abort the read."""
+        (repo / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+        (repo / "message.txt").write_bytes("caf\xe9 fix\n".encode("latin-1"))
+        git(repo, "add", "latin1.txt")
+        git(repo, "commit", "-q", "-F", str(repo / "message.txt"))
+
+        commits = reword.read_range("base..HEAD")
+
+        assert len(commits) == 4
+        assert "caf\ufffd" in commits[-1].changes.text
+        assert commits[-1].subject.startswith("caf") and commits[-1].subject.endswith(" fix")
+
+    def test_diffs_kept_within_budget(self, repo):
+        """Test that files past the token budget are listed instead of kept."""
+        commit_file(repo, "big.txt", "generated line of text\n" * 20000, "wip")
+        commit_file(repo, "small.py", "SMALL = 1\n", "wip")
+
+        commits = reword.read_range("base..HEAD", token_budget=200)
+
+        assert commits[-2].changes.omitted == ["big.txt"]
+        assert "generated line" not in commits[-2].changes.text
+        assert commits[-1].changes.files == ["small.py"]
+        assert [commit.subject for commit in commits] == ["wip"] * 5
+
+    def test_range_must_end_at_head(self, repo):
+        with pytest.raises(GitCommandError, match="must end at HEAD"):
+            reword.read_range("base..HEAD~1")
+
+    def test_empty_range(self, repo):
+        with pytest.raises(GitCommandError, match="No commits"):
+            reword.read_range("HEAD..HEAD")
+
+
+class TestRunReword:
+    """Test rewording a range end to end against a stub LLM."""
+
+    def test_messages_rewritten(self, repo, llm):
+        assert reword.run_reword(["base..HEAD"]) == 0
+
+        subjects = git(repo, "log", "--format=%s", "base..HEAD").splitlines()
+        assert subjects == ["feat: add handler 2", "feat: add handler 1", "feat: add handler 0"]
+        assert llm.requests == 3
+        assert git(repo, "log", "-1", "--format=%an", "HEAD") == "Author"
+        assert git(repo, "status", "--porcelain") == ""
+
+    def test_cached_diffs_skipped(self, repo, llm):
+        reword.run_reword(["base..HEAD", "--dry-run"])
+        reword.run_reword(["base..HEAD"])
+
+        assert llm.requests == 3  # the second run answered every commit from the cache
+
+    def test_dry_run_leaves_history(self, repo, llm):
+        head = git(repo, "rev-parse", "HEAD")
+        assert reword.run_reword(["base..HEAD", "--dry-run"]) == 0
+        assert git(repo, "rev-parse", "HEAD") == head
+
+    def test_failed_commit_keeps_message(self, repo, llm):
+        """Test that a commit the AI cannot answer keeps its message while the others are reworded."""
+        answer = llm.astream
+
+        async def astream(messages, **kwargs):
+            if "module_1" in str(messages[-1].content):
+                raise ValueError("no answer")
+            async for chunk in answer(messages, **kwargs):
+                yield chunk
+
+        llm.astream = astream
+        assert reword.run_reword(["base..HEAD"]) == 0
+
+        subjects = git(repo, "log", "--format=%s", "base..HEAD").splitlines()
+        assert subjects == ["feat: add handler 2", "wip", "feat: add handler 0"]
+
+    def test_unchanged_prefix_keeps_hashes(self, repo):
+        """Test that commits before the first new message are not recreated."""
+        commits = reword.read_range("base..HEAD")
+        results = [reword.Reworded(commits[0], commits[0].message, "kept")]
+        results += [reword.Reworded(commit, "docs: rename", "ai") for commit in commits[1:]]
+
+        head = reword.rewrite_history(results)
+
+        assert git(repo, "rev-parse", "HEAD~2") == commits[0].sha
+        assert head == git(repo, "rev-parse", "HEAD") != commits[-1].sha
+
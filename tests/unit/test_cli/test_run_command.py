@@ -0,0 +1,56 @@
+import subprocess
+import pytest
+from unittest.mock import patch
+from codelibre import cli
+from codelibre.config import load_settings
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """Git repository with one committed file and an unstaged change to it, used as the working directory."""
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", "/dev/null")
+    monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "Author")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "author@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "Author")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "author@example.com")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+    monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+    monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path / "cache"))
+    load_settings.cache_clear()
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    (tmp_path / "app.py").write_text("print('hi')\n")
+    subprocess.run(["git", "add", "app.py"], cwd=tmp_path, check=True)
+    subprocess.run(["git", "commit", "-q", "-m", "initial"], cwd=tmp_path, check=True)
+    (tmp_path / "app.py").write_text("print('hello')\n")
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    load_settings.cache_clear()
+
+
+def staged_files(repo):
+    return subprocess.run(
+        ["git", "diff", "--cached", "--name-only"], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout.split()
+
+
+class TestInterrupt:
+    """Test Ctrl+C during generation or at the feedback prompt."""
+
+    def test_all_unstages_on_interrupt(self, repo):
+        """Test that --all leaves the index as it found it when interrupted."""
+        with patch.object(cli, "generate_commit_message", side_effect=KeyboardInterrupt):
+            with pytest.raises(SystemExit):
+                cli.run_command(["--all"], heuristics=False)
+
+        assert staged_files(repo) == []
+
+    def test_staged_kept_on_interrupt(self, repo):
+        """Test that --staged never unstages the user's own staging."""
+        subprocess.run(["git", "add", "app.py"], cwd=repo, check=True)
+        with patch.object(cli, "generate_commit_message", side_effect=KeyboardInterrupt):
+            with pytest.raises(SystemExit):
+                cli.run_command(["--staged"], heuristics=False)
+
+        assert staged_files(repo) == ["app.py"]
@@ -0,0 +1,86 @@
+import json
+import subprocess
+import sys
+
+
+# Cold import of the CLI entry point must cost at most this fraction of importing
+# the LLM stack it defers (relative, so it scales with the machine) ...
+STARTUP_BUDGET_RATIO = 0.25
+
+# ... and stay under this many seconds whatever the machine, with headroom for CI
+STARTUP_BUDGET = 0.2
+
+# Modules that must only be loaded once the LLM is actually needed
+HEAVY_MODULES = [
+    "anthropic",
+    "dotenv",
+    "langchain_anthropic",
+    "langchain_core",
+    "langgraph",
+    "pydantic",
+]
+
+
+def run_fresh_interpreter(code):
+    """Run code in a new interpreter so nothing is already imported."""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        timeout=60,
+        env={"PATH": ""},
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestStartup:
+    """Import-time regression tests for the CLI."""
+
+    def test_cli_import_skips_heavy_modules(self):
+        """Test that importing the CLI does not load LLM dependencies."""
+        loaded = run_fresh_interpreter(
+            "import json, sys\n"
+            "import codelibre.cli\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+        )
+        assert loaded == []
+
+    def test_usage_skips_heavy_modules(self):
+        """Test that printing usage does not load LLM dependencies."""
+        loaded = run_fresh_interpreter(
+            "import json, sys\n"
+            "import codelibre.cli\n"
+            "sys.argv = ['codelibre']\n"
+            "codelibre.cli.cli()\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+        )
+        assert loaded == []
+
+    def test_graph_import_skips_anthropic(self):
+        """Test that building the graph modules does not load the Anthropic SDK before a request."""
+        loaded = run_fresh_interpreter(
+            "import json, sys\n"
+            "import codelibre.graph.graph, codelibre.graph.map_reduce\n"
+            "print(json.dumps([m for m in ['anthropic', 'langchain_anthropic'] if m in sys.modules]))\n"
+        )
+        assert loaded == []
+
+    def test_cold_import_within_budget(self):
+        """Test that a cold import of the CLI is fast, and cheap next to importing the LLM stack."""
+
+        def cold_import(module):
+            # Best of three runs, to keep a busy machine from causing flakes
+            return min(
+                run_fresh_interpreter(
+                    "import json, time\n"
+                    "start = time.perf_counter()\n"
+                    f"import {module}\n"
+                    "print(json.dumps(time.perf_counter() - start))\n"
+                )
+                for _ in range(3)
+            )
+
+        cli_import = cold_import("codelibre.cli")
+        assert cli_import < STARTUP_BUDGET
+        assert cli_import < STARTUP_BUDGET_RATIO * cold_import("langgraph.graph")
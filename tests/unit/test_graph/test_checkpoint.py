@@ -0,0 +1,177 @@
+import asyncio
+import pytest
+from typing import TypedDict
+from unittest.mock import patch, AsyncMock, MagicMock
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langgraph.graph import StateGraph, END
+from codelibre.cli import stream_commit_message
+from codelibre.config import load_settings
+from codelibre.exceptions import ExitRequestedException
+from codelibre.graph import checkpoint, graph, nodes
+from codelibre.graph.checkpoint import SqliteCheckpointer
+from codelibre.utils.git_session import session_id
+
+
+def streaming(stub):
+    """Makes `stub.astream` stream whatever `stub.ainvoke` answers, as one chunk."""
+    async def astream(messages, **kwargs):
+        message = await stub.ainvoke(messages)
+        yield AIMessageChunk(content=message.content)
+
+    stub.astream = MagicMock(side_effect=astream)
+    return stub
+
+
+class CounterState(TypedDict):
+    count: int
+
+
+def build_counter_graph(calls, fail_once):
+    """first -> second -> END, where `second` fails the first time if fail_once."""
+    def first(state):
+        calls.append("first")
+        return {"count": state["count"] + 1}
+
+    def second(state):
+        calls.append("second")
+        if fail_once and calls.count("second") == 1:
+            raise RuntimeError("crash")
+        return {"count": state["count"] + 10}
+
+    builder = StateGraph(CounterState)
+    builder.add_node("first", first)
+    builder.add_node("second", second)
+    builder.set_entry_point("first")
+    builder.add_edge("first", "second")
+    builder.add_edge("second", END)
+    return builder
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = SqliteCheckpointer(tmp_path / "sessions.sqlite")
+    yield saver
+    saver.close()
+
+
+class TestSqliteCheckpointer:
+    """Test SqliteCheckpointer with real graphs."""
+
+    def test_resumes_after_failure(self, saver):
+        calls = []
+        app = build_counter_graph(calls, fail_once=True).compile(checkpointer=saver)
+        config = {"configurable": {"thread_id": "t"}}
+
+        with pytest.raises(RuntimeError):
+            app.invoke({"count": 0}, config)
+        assert app.get_state(config).next == ("second",)
+
+        assert app.invoke(None, config) == {"count": 11}
+        assert calls == ["first", "second", "second"]  # `first` was not run again
+
+    def test_async_api(self, saver):
+        app = build_counter_graph([], fail_once=False).compile(checkpointer=saver)
+        config = {"configurable": {"thread_id": "t"}}
+        assert asyncio.run(app.ainvoke({"count": 1}, config)) == {"count": 12}
+        assert asyncio.run(app.aget_state(config)).values == {"count": 12}
+
+    def test_persists_across_connections(self, tmp_path, saver):
+        app = build_counter_graph([], fail_once=False).compile(checkpointer=saver)
+        app.invoke({"count": 0}, {"configurable": {"thread_id": "t"}})
+
+        reopened = SqliteCheckpointer(tmp_path / "sessions.sqlite")
+        state = build_counter_graph([], fail_once=False).compile(checkpointer=reopened).get_state(
+            {"configurable": {"thread_id": "t"}}
+        )
+        assert state.values == {"count": 11}
+        reopened.close()
+
+    def test_keeps_only_latest_checkpoints(self, saver):
+        app = build_counter_graph([], fail_once=False).compile(checkpointer=saver)
+        app.invoke({"count": 0}, {"configurable": {"thread_id": "t"}})
+        count = saver.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        assert count == 2  # latest and its parent
+
+    def test_delete_thread(self, saver):
+        app = build_counter_graph([], fail_once=False).compile(checkpointer=saver)
+        config = {"configurable": {"thread_id": "t"}}
+        app.invoke({"count": 0}, config)
+        saver.delete_thread("t")
+        assert saver.get_tuple(config) is None
+
+    def test_prunes_old_and_excess_threads(self, saver):
+        app = build_counter_graph([], fail_once=False).compile(checkpointer=saver)
+        for thread in ("a", "b", "c"):
+            app.invoke({"count": 0}, {"configurable": {"thread_id": thread}})
+        saver.conn.execute("UPDATE checkpoints SET created = created - 1000 WHERE thread_id = 'a'")
+
+        assert saver.prune(max_age=500, max_threads=10) == 1
+        assert saver.prune(max_age=500, max_threads=1) == 1
+        threads = {row[0] for row in saver.conn.execute("SELECT thread_id FROM checkpoints")}
+        assert len(threads) == 1
+
+
+class TestSessionId:
+    """Test session_id."""
+
+    def test_stable_per_repo_and_diff(self, tmp_path):
+        (tmp_path / "one" / ".git").mkdir(parents=True)
+        (tmp_path / "two" / ".git").mkdir(parents=True)
+        one, two = str(tmp_path / "one"), str(tmp_path / "two")
+        assert session_id("+a", one) == session_id("+a", one)
+        assert session_id("+a", one) != session_id("+b", one)
+        assert session_id("+a", one) != session_id("+a", two)
+
+
+class TestResumeSession:
+    """Test resuming an interrupted chat session through stream_commit_message."""
+
+    @pytest.fixture(autouse=True)
+    def env(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+        monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+        monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+        monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path))
+        caches = (load_settings, nodes.get_token_estimator, nodes.get_message_cache, checkpoint.get_checkpointer, graph.get_chat_app)
+        for cached in caches:
+            cached.cache_clear()
+        yield
+        for cached in caches:
+            cached.cache_clear()
+
+    @pytest.fixture
+    def llm(self):
+        stub = streaming(MagicMock())
+        stub.ainvoke = AsyncMock(side_effect=[AIMessage(content="feat: first"), AIMessage(content="feat: second")])
+        with patch.object(nodes, "get_llm", return_value=stub):
+            yield stub
+
+    def run(self, answers, **options):
+        with patch("builtins.input", side_effect=answers):
+            return asyncio.run(stream_commit_message("+line", use_cache=False, session="s", **options))
+
+    def test_resume_continues_feedback_loop(self, llm):
+        with pytest.raises(ExitRequestedException):
+            self.run(["shorter", KeyboardInterrupt])
+        assert llm.ainvoke.await_count == 2
+
+        assert self.run(["y"], resume=True) == "feat: second"
+        assert llm.ainvoke.await_count == 2  # nothing asked again
+
+    def test_resume_finished_session(self, llm):
+        assert self.run(["y"]) == "feat: first"
+        assert self.run([], resume=True) == "feat: first"
+        assert llm.ainvoke.await_count == 1
+
+    def test_without_resume_starts_over(self, llm):
+        with pytest.raises(ExitRequestedException):
+            self.run([KeyboardInterrupt])
+        assert self.run(["y"]) == "feat: second"
+        assert llm.ainvoke.await_count == 2
+
+    def test_resume_without_session_starts_over(self, llm):
+        assert self.run(["y"], resume=True) == "feat: first"
+
+    def test_database_unavailable(self, llm):
+        with patch.object(checkpoint, "get_checkpointer", return_value=None):
+            assert self.run(["y"]) == "feat: first"
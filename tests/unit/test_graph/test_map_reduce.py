@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock
+from langchain_core.messages import AIMessage
+from codelibre.config import load_settings
+from codelibre.graph import map_reduce, nodes
+from codelibre.graph.map_reduce import group_file_diffs, summarize_diff
+from codelibre.utils.estimate_tokens import TokenEstimator
+from codelibre.utils.message_cache import MessageCache
+
+
+def file_diff(path, lines=20):
+    body = "".join(f"+    value_{i} = compute(x, y)\n" for i in range(lines))
+    return f"diff --git a/{path} b/{path}\n@@ -0,0 +1,{lines} @@\n{body}"
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch, tmp_path):
+    """Provide the required environment and reset cached settings."""
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+    monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+    monkeypatch.setenv("MAP_REDUCE_CONCURRENCY", "3")
+    monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path))
+    load_settings.cache_clear()
+    nodes.get_token_estimator.cache_clear()
+    cache = MessageCache(directory=tmp_path / "messages")
+    with patch.object(map_reduce, "get_message_cache", return_value=cache):
+        yield
+    load_settings.cache_clear()
+    nodes.get_token_estimator.cache_clear()
+
+
+@pytest.fixture
+def llm():
+    """Stub LLM that summarizes a group as the paths it contains, tracking concurrency."""
+    stub = MagicMock()
+    stub.active = stub.peak = 0
+
+    async def ainvoke(messages):
+        stub.active += 1
+        stub.peak = max(stub.peak, stub.active)
+        await asyncio.sleep(0.01)
+        stub.active -= 1
+        text = messages[-1].content
+        paths = [line.split(" b/")[-1] for line in text.splitlines() if line.startswith("diff --git ")]
+        return AIMessage(content="changed " + ", ".join(paths) if paths else "summary of summaries")
+
+    stub.ainvoke = MagicMock(side_effect=ainvoke)
+    with patch.object(map_reduce, "get_llm", return_value=stub):
+        yield stub
+
+
+class TestGroupFileDiffs:
+    """Test group_file_diffs function."""
+
+    def test_files_packed_in_order(self):
+        """Test that whole files are packed into groups within the budget."""
+        diff = "".join(file_diff(f"mod_{i}.py") for i in range(6))
+        groups = group_file_diffs(diff, 500)
+
+        assert len(groups) > 1
+        assert "".join(groups) == diff
+        assert all(TokenEstimator().text_tokens(g) <= 500 for g in groups)
+
+    def test_oversized_file_truncated(self):
+        """Test that a single file over the budget is truncated to fit."""
+        groups = group_file_diffs(file_diff("big.py", lines=500), 300)
+
+        assert len(groups) == 1
+        assert TokenEstimator().text_tokens(groups[0]) <= 300
+
+    def test_plain_text_grouped_by_paragraph(self):
+        """Test that summaries (no file headers) are packed by paragraph."""
+        text = "\n\n".join("summary " * 50 for _ in range(4))
+        groups = group_file_diffs(text, 250)
+
+        assert len(groups) == 2
+
+
+class TestSummarizeDiff:
+    """Test the map-reduce graph."""
+
+    def test_summaries_in_diff_order(self, llm):
+        """Test that every group is summarized and the digest keeps diff order."""
+        diff = "".join(file_diff(f"mod_{i}.py", lines=60) for i in range(8))
+        digest = asyncio.run(summarize_diff(diff))
+
+        paths = [p for line in digest.split("\n\n") for p in line[len("changed "):].split(", ")]
+        assert paths == [f"mod_{i}.py" for i in range(8)]
+
+    def test_concurrency_bounded(self, llm):
+        """Test that groups run in parallel, but never more than MAP_REDUCE_CONCURRENCY at once."""
+        diff = "".join(file_diff(f"mod_{i}.py", lines=120) for i in range(10))
+        asyncio.run(summarize_diff(diff))
+
+        assert llm.ainvoke.call_count == 10
+        assert llm.peak == 3
+
+    def test_long_digest_summarized_again(self, llm, monkeypatch):
+        """Test that summaries over the digest budget go through another round."""
+        monkeypatch.setattr(map_reduce, "_budgets", lambda: (300, 10))
+        diff = "".join(file_diff(f"mod_{i}.py", lines=40) for i in range(4))
+
+        assert asyncio.run(summarize_diff(diff)) == "summary of summaries"
+
+    def test_summaries_cached(self, llm):
+        """Test that a re-run only summarizes groups it has not seen."""
+        diff = "".join(file_diff(f"mod_{i}.py", lines=120) for i in range(4))
+        asyncio.run(summarize_diff(diff))
+        asyncio.run(summarize_diff(diff + file_diff("new.py", lines=120)))
+
+        assert llm.ainvoke.call_count == 5
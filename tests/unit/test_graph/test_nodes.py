@@ -1,2 +1,436 @@
 # File: tests/unit/test_nodes.py
-# TODO
\ No newline at end of file
+import asyncio
+import httpx
+import pytest
+from anthropic import BadRequestError, RateLimitError
+from unittest.mock import patch, AsyncMock, MagicMock
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from codelibre.config import HEDGE_MIN_SAMPLES, MAX_CHARACTERS, load_settings
+from codelibre.exceptions import ExitRequestedException
+from codelibre.graph import nodes
+from codelibre.graph.state import ChatState, append_messages
+from codelibre.utils.message_cache import MessageCache
+
+
+@pytest.fixture(autouse=True)
+def env(monkeypatch, tmp_path):
+    """Provide the required environment and reset cached settings."""
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("DEFAULT_MODEL", "test-model")
+    monkeypatch.setenv("DEFAULT_TOKEN_LIMIT", "1024")
+    monkeypatch.setenv("CODELIBRE_CACHE_DIR", str(tmp_path))
+    load_settings.cache_clear()
+    nodes.get_token_estimator.cache_clear()
+    yield
+    load_settings.cache_clear()
+    nodes.get_token_estimator.cache_clear()
+
+
+@pytest.fixture
+def message_cache(tmp_path):
+    """Route the node's message cache to a temporary directory."""
+    cache = MessageCache(directory=tmp_path / "messages")
+    with patch.object(nodes, "get_message_cache", return_value=cache):
+        yield cache
+
+
+def streaming(stub):
+    """Makes `stub.astream` stream whatever `stub.ainvoke` answers, as one chunk."""
+    async def astream(messages, **kwargs):
+        message = await stub.ainvoke(messages)
+        yield AIMessageChunk(content=message.content, usage_metadata=message.usage_metadata)
+
+    stub.astream = MagicMock(side_effect=astream)
+    return stub
+
+
+@pytest.fixture
+def llm():
+    """Stub LLM returning a fixed commit message."""
+    stub = streaming(MagicMock())
+    stub.ainvoke = AsyncMock(return_value=AIMessage(content="feat: add cache"))
+    with patch.object(nodes, "get_llm", return_value=stub):
+        yield stub
+
+
+def run_ask(state):
+    return asyncio.run(nodes.ask(state))
+
+
+def make_state(**kwargs):
+    return ChatState(
+        messages=[HumanMessage(content="\nDiff:\n+new line")],
+        system_prompt="system",
+        **kwargs
+    )
+
+
+class TestAskCache:
+    """Test the message cache in the ask node."""
+
+    def test_response_is_cached(self, llm, message_cache):
+        """Test that a fresh response is stored and replayed on the next call."""
+        first = run_ask(make_state())
+        second = run_ask(make_state())
+
+        assert first["response"] == "feat: add cache"
+        assert second["response"] == "feat: add cache"
+        assert llm.ainvoke.call_count == 1
+
+    def test_use_cache_false_bypasses_lookup(self, llm, message_cache):
+        """Test that use_cache=False always calls the LLM."""
+        run_ask(make_state())
+        run_ask(make_state(use_cache=False))
+
+        assert llm.ainvoke.call_count == 2
+
+    def test_feedback_changes_cache_key(self, llm, message_cache):
+        """Test that new feedback is not answered from the cache."""
+        run_ask(make_state())
+        state = make_state()
+        state["messages"] += [AIMessage(content="feat: add cache"), HumanMessage(content="Feedback: shorter")]
+        run_ask(state)
+
+        assert llm.ainvoke.call_count == 2
+
+
+class TestGenerateCommitLine:
+    """Test streaming generation of the commit message line."""
+
+    @staticmethod
+    def llm(*answers):
+        """Stub streaming each answer chunk by chunk; records request options and chunks consumed."""
+        stub = MagicMock()
+        stub.requests, stub.consumed = [], []
+        answers = iter(answers)
+
+        async def astream(messages, **kwargs):
+            stub.requests.append(kwargs)
+            for chunk in next(answers):
+                stub.consumed.append(chunk)
+                yield AIMessageChunk(content=chunk)
+
+        stub.astream = astream
+        return stub
+
+    def test_output_budget_and_stop_sequence(self):
+        llm = self.llm(["feat: add cache"])
+        asyncio.run(nodes.generate_commit_line(llm, []))
+        assert llm.requests == [{"stop": ["\n"], "max_tokens": nodes.COMMIT_MAX_TOKENS}]
+        assert 2 * nodes.COMMIT_MAX_TOKENS >= len("refactor: ") + MAX_CHARACTERS
+
+    def test_stops_once_line_is_complete(self):
+        """Test that the stream is closed as soon as a valid line has arrived."""
+        llm = self.llm(["feat: add", " cache\nThis change adds", " a cache because..."])
+        _, text = asyncio.run(nodes.generate_commit_line(llm, []))
+        assert text == "feat: add cache"
+        assert llm.consumed == ["feat: add", " cache\nThis change adds"]
+
+    def test_blank_answer_retried_without_stop_sequence(self):
+        llm = self.llm([""], ["\nfeat: add cache"])
+        _, text = asyncio.run(nodes.generate_commit_line(llm, []))
+        assert text == "feat: add cache"
+        assert [request["stop"] for request in llm.requests] == [["\n"], None]
+
+
+class TestTruncateMessages:
+    """Test the truncate_messages node."""
+
+    def test_fitting_conversation_unchanged(self):
+        """Test that nothing is returned when the conversation fits the limit."""
+        assert nodes.truncate_messages(make_state()) == {}
+
+    def test_oversized_conversation_replaced(self):
+        """Test that a truncated conversation replaces the old one in the state."""
+        diff = "".join(f"diff --git a/f{i}.py b/f{i}.py\n@@ -1 +1 @@\n+{'x' * 400}\n" for i in range(20))
+        state = make_state()
+        state["messages"] = [HumanMessage(content="\nDiff:\n" + diff)]
+
+        update = nodes.truncate_messages(state)
+        merged = append_messages(state["messages"], update["messages"])
+
+        assert len(merged) == 1
+        assert len(merged[0].content) < len(state["messages"][0].content)
+
+
+class TestChooseModel:
+    """Test the choose_model routing node."""
+
+    def test_small_diff_routed_to_fast_model(self, monkeypatch):
+        """Test that a small diff is routed to FAST_MODEL and the tier recorded."""
+        monkeypatch.setenv("FAST_MODEL", "fast-model")
+        load_settings.cache_clear()
+
+        assert nodes.choose_model(make_state()) == {"model": "fast-model", "model_tier": "fast"}
+
+    def test_summarized_diff_routed_to_strong_tier(self):
+        """Test that a digest of summaries goes to the strong tier (DEFAULT_MODEL when unset)."""
+        state = make_state()
+        state["messages"] = [HumanMessage(content="\nDiff:\n(The diff was too large to send; these are summaries of its parts.)\n\n...")]
+
+        assert nodes.choose_model(state) == {"model": "test-model", "model_tier": "strong"}
+
+    def test_routed_model_kept(self):
+        """Test that a session keeps the model it was routed to."""
+        assert nodes.choose_model(make_state(model="strong-model")) == {}
+
+    def test_ask_uses_routed_model(self, llm, message_cache):
+        """Test that ask requests the routed model's client."""
+        with patch.object(nodes, "get_llm", return_value=llm) as get_llm:
+            run_ask(make_state(model="fast-model"))
+        get_llm.assert_called_with("fast-model")
+
+
+class TestAddInput:
+    """Test the async add_input node."""
+
+    @patch("builtins.input", return_value="make it shorter")
+    def test_feedback_appended(self, mock_input):
+        """Test that only the feedback is returned and another round is requested."""
+        update = asyncio.run(nodes.add_input(make_state(response="feat: add cache")))
+
+        assert update["reiterate"] is True
+        assert [m.content for m in update["messages"]] == ["Feedback: make it shorter"]
+
+    @patch("builtins.input", return_value="y")
+    def test_accept_keeps_response(self, mock_input):
+        """Test that accepting ends the loop with the current response."""
+        update = asyncio.run(nodes.add_input(make_state(response="feat: add cache")))
+
+        assert update == {"reiterate": False}  # response and messages left as they are
+
+    @patch("builtins.input", side_effect=EOFError)
+    def test_eof_requests_exit(self, mock_input):
+        """Test that end of input raises ExitRequestedException."""
+        with pytest.raises(ExitRequestedException):
+            asyncio.run(nodes.add_input(make_state()))
+
+
+class TestCandidates:
+    """Test N-best candidates generated on the first call."""
+
+    @pytest.fixture
+    def llm(self):
+        """Stub answering each request with the next message; records request configs."""
+        stub = MagicMock()
+        stub.configs = []
+        answers = iter(["feat: add cache", "feat: cache responses", "feat: add cache", "perf: cache answers"])
+
+        async def astream(messages, config=None, **kwargs):
+            stub.configs.append(config)
+            yield AIMessageChunk(content=next(answers) + "\n")
+
+        stub.astream = astream
+        with patch.object(nodes, "get_llm", return_value=stub):
+            yield stub
+
+    def test_candidates_generated_and_deduplicated(self, llm, message_cache):
+        """Test that the first call asks for every candidate without streaming them."""
+        update = run_ask(make_state(candidate_count=3))
+
+        assert update["candidates"] == ["feat: add cache", "feat: cache responses"]
+        assert update["response"] == "feat: add cache"
+        assert update["prompt_cache_misses"] == 3
+        assert llm.configs == [nodes.CANDIDATE_CONFIG] * 3
+
+    def test_identical_candidates_shown_unnumbered(self, message_cache, capsys):
+        """Test that candidates merged into one are reported and not offered by number."""
+        async def astream(messages, config=None, **kwargs):
+            yield AIMessageChunk(content="feat: add cache\n")
+
+        stub = MagicMock()
+        stub.astream = astream
+        with patch.object(nodes, "get_llm", return_value=stub):
+            update = run_ask(make_state(candidate_count=3))
+
+        out = capsys.readouterr().out
+        assert update["candidates"] == ["feat: add cache"]
+        assert "All 3 candidates were identical" in out
+        assert "[1]" not in out
+
+    def test_candidates_replayed_from_cache(self, llm, message_cache):
+        first = run_ask(make_state(candidate_count=3))
+        second = run_ask(make_state(candidate_count=3))
+
+        assert second["candidates"] == first["candidates"]
+        assert len(llm.configs) == 3
+
+    def test_feedback_rounds_ask_once(self, llm, message_cache):
+        """Test that a refinement round generates a single streamed message."""
+        state = make_state(candidate_count=3)
+        state["messages"] += [AIMessage(content="feat: add cache"), HumanMessage(content="Feedback: shorter")]
+
+        update = run_ask(state)
+
+        assert "candidates" not in update
+        assert llm.configs == [None]
+
+    @patch("builtins.input", return_value="2")
+    def test_number_picks_candidate(self, mock_input):
+        """Test that typing a candidate's number accepts it."""
+        state = make_state(response="feat: a", candidates=["feat: a", "feat: b"])
+
+        update = asyncio.run(nodes.add_input(state))
+
+        assert update == {"response": "feat: b", "reiterate": False}
+
+    @patch("builtins.input", return_value="2")
+    def test_number_is_feedback_without_candidates(self, mock_input):
+        update = asyncio.run(nodes.add_input(make_state(response="feat: a")))
+        assert update["reiterate"] is True
+
+
+class TestAskHedging:
+    """Test hedged requests in the ask node."""
+
+    def test_late_first_token_hedged_and_counted(self, monkeypatch, message_cache, tmp_path):
+        """Test that a slow request is hedged, the fast one wins and the extra cost is counted."""
+        monkeypatch.setenv("LLM_HEDGE", "1")
+        load_settings.cache_clear()
+        history = nodes.LatencyHistory("test-model", tmp_path / "latency.json")
+        for _ in range(HEDGE_MIN_SAMPLES):
+            history.record(0.01, hedged=False)
+        delays = iter([5.0, 0.0])
+
+        async def astream(messages, **kwargs):
+            await asyncio.sleep(next(delays))
+            yield AIMessageChunk(content="feat: add cache\n", usage_metadata={
+                "input_tokens": 120, "output_tokens": 5, "total_tokens": 125
+            })
+
+        stub = MagicMock()
+        stub.astream = astream
+        with patch.object(nodes, "get_llm", return_value=stub), \
+                patch.object(nodes, "get_latency_history", return_value=history):
+            update = run_ask(make_state())
+
+        assert update["response"] == "feat: add cache"
+        assert (update["hedged_requests"], update["hedged_input_tokens"]) == (1, 120)
+
+    def test_off_by_default(self, llm, message_cache):
+        """Test that requests are not hedged unless LLM_HEDGE is set."""
+        assert "hedged_requests" not in run_ask(make_state())
+
+
+class TestAskRetries:
+    """Test retry behaviour of the ask node."""
+
+    def test_rate_limit_retried(self, llm, message_cache):
+        """Test that a 429 with Retry-After is retried and then succeeds."""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(429, headers={"retry-after": "0"}, request=request)
+        llm.ainvoke.side_effect = [
+            RateLimitError("rate limited", response=response, body=None),
+            AIMessage(content="feat: add cache"),
+        ]
+
+        assert run_ask(make_state())["response"] == "feat: add cache"
+        assert llm.ainvoke.call_count == 2
+
+    def test_client_error_not_retried(self, llm, message_cache):
+        """Test that a non-retryable API error propagates at once."""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(400, request=request)
+        llm.ainvoke.side_effect = BadRequestError("bad request", response=response, body=None)
+
+        with pytest.raises(BadRequestError):
+            run_ask(make_state())
+        assert llm.ainvoke.call_count == 1
+
+
+class TestTokenCalibration:
+    """Test that API usage feeds the token estimator."""
+
+    def test_usage_recorded(self, llm, message_cache, tmp_path):
+        """Test that reported input tokens update the calibration store."""
+        llm.ainvoke.return_value = AIMessage(
+            content="feat: add cache",
+            usage_metadata={"input_tokens": 40, "output_tokens": 5, "total_tokens": 45},
+        )
+        run_ask(make_state())
+
+        estimator = nodes.get_token_estimator("test-model")
+        assert estimator.samples() == 1
+        assert (tmp_path / "calibration.json").exists()
+
+    def test_missing_usage_ignored(self, llm, message_cache, tmp_path):
+        """Test that responses without usage metadata are skipped."""
+        run_ask(make_state())
+
+        assert nodes.get_token_estimator("test-model").samples() == 0
+        assert not (tmp_path / "calibration.json").exists()
+
+
+class PromptCachingAPI:
+    """Local stand-in for the Messages API's prompt cache: prefixes up to a breakpoint are remembered."""
+
+    def __init__(self):
+        self.seen = set()
+        self.requests = []
+
+    async def astream(self, messages, **kwargs):
+        message = await self.ainvoke(messages)
+        yield AIMessageChunk(content=message.content, usage_metadata=message.usage_metadata)
+
+    async def ainvoke(self, messages):
+        self.requests.append(messages)
+        prefix, cached_prefix = [], None
+        for message in messages:
+            blocks = message.content if isinstance(message.content, list) else [{"text": message.content}]
+            for block in blocks:
+                prefix.append(block["text"])
+                if "cache_control" in block:
+                    cached_prefix = tuple(prefix)
+        cache_read = 100 if cached_prefix in self.seen else 0
+        if cached_prefix:
+            self.seen.add(cached_prefix)
+        return AIMessage(
+            content="feat: add cache",
+            usage_metadata={
+                "input_tokens": 120, "output_tokens": 5, "total_tokens": 125,
+                "input_token_details": {"cache_read": cache_read, "cache_creation": 100 - cache_read},
+            },
+        )
+
+
+class TestPromptCaching:
+    """Test Anthropic prompt cache breakpoints in the ask node."""
+
+    @pytest.fixture
+    def api(self):
+        api = PromptCachingAPI()
+        with patch.object(nodes, "get_llm", return_value=api):
+            yield api
+
+    def test_breakpoints_on_system_prompt_and_diff(self, api, message_cache):
+        """Test that only the system prompt and the diff message carry cache_control."""
+        state = make_state()
+        state["messages"] += [AIMessage(content="feat: add cache"), HumanMessage(content="Feedback: shorter")]
+        run_ask(state)
+
+        system, diff, proposal, feedback = api.requests[0]
+        assert system.content[-1]["cache_control"] == {"type": "ephemeral"}
+        assert diff.content[-1]["cache_control"] == {"type": "ephemeral"}
+        assert isinstance(proposal.content, str) and isinstance(feedback.content, str)
+        assert isinstance(state["messages"][0].content, str)  # conversation itself is untouched
+
+    def test_hits_and_misses_counted(self, api, message_cache):
+        """Test that the first call misses and feedback rounds hit the prompt cache (returned as increments)."""
+        first = run_ask(make_state())
+        state = make_state()
+        state["messages"] += [AIMessage(content="feat: add cache"), HumanMessage(content="Feedback: shorter")]
+        second = run_ask(state)
+
+        assert (first["prompt_cache_hits"], first["prompt_cache_misses"]) == (0, 1)
+        assert (second["prompt_cache_hits"], second["prompt_cache_misses"]) == (1, 0)
+
+    @patch("builtins.input", side_effect=["make it shorter", "y"])
+    def test_counts_reach_final_state(self, mock_input, api, message_cache):
+        """Test that the counters survive a full feedback loop through the graph."""
+        from codelibre.graph.graph import build_chat_graph
+
+        final = asyncio.run(build_chat_graph().compile().ainvoke(make_state()))
+
+        assert final["prompt_cache_misses"] == 1
+        assert final["prompt_cache_hits"] == 1
+        assert final["response"] == "feat: add cache"
@@ -1,2 +1,55 @@
 # File: tests/unit/test_state.py
-# TODO
\ No newline at end of file
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, StateGraph
+from codelibre.graph.state import ChatState, append_messages, replace_messages
+
+
+class TestMessagesReducer:
+    """Test append_messages and replace_messages."""
+
+    def test_appends(self):
+        current = [HumanMessage(content="diff")]
+        merged = append_messages(current, [AIMessage(content="feat: x")])
+        assert [m.content for m in merged] == ["diff", "feat: x"]
+        assert len(current) == 1  # the caller's list is not mutated
+
+    def test_extends_own_list_in_place(self):
+        """Test that after the first update the conversation is extended, not copied."""
+        merged = append_messages([HumanMessage(content="diff")], [AIMessage(content="feat: x")])
+        again = append_messages(merged, [HumanMessage(content="shorter")])
+        assert again is merged
+        assert [m.content for m in again] == ["diff", "feat: x", "shorter"]
+
+    def test_replaced_conversation_owned(self):
+        replacement = replace_messages([HumanMessage(content="short")])
+        merged = append_messages([HumanMessage(content="diff")], replacement)
+        append_messages(merged, [AIMessage(content="feat: x")])
+        assert len(replacement) == 2
+
+    def test_replaces(self):
+        merged = append_messages([HumanMessage(content="diff")], replace_messages([HumanMessage(content="short")]))
+        assert [m.content for m in merged] == ["short"]
+
+    def test_empty_update(self):
+        assert append_messages([HumanMessage(content="diff")], [])[0].content == "diff"
+
+
+class TestPartialUpdates:
+    """Test that nodes returning only changed keys keep the rest of the state."""
+
+    def test_graph_merges_updates(self):
+        graph = StateGraph(ChatState)
+        graph.add_node("answer", lambda state: {"response": "feat: x", "prompt_cache_misses": 1})
+        graph.add_node("record", lambda state: {"messages": [AIMessage(content=state["response"])], "prompt_cache_hits": 1})
+        graph.set_entry_point("answer")
+        graph.add_edge("answer", "record")
+        graph.add_edge("record", END)
+
+        initial = ChatState(messages=[HumanMessage(content="diff")], system_prompt="system", prompt_cache_hits=2)
+        final = asyncio.run(graph.compile().ainvoke(initial))
+
+        assert [m.content for m in final["messages"]] == ["diff", "feat: x"]
+        assert len(initial["messages"]) == 1
+        assert final["system_prompt"] == "system"
+        assert (final["prompt_cache_hits"], final["prompt_cache_misses"]) == (3, 1)
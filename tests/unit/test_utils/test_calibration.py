@@ -0,0 +1,121 @@
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from codelibre.config import BASE_TEMPLATE
+from codelibre.utils.calibration import TokenCalibration, content_breakdown
+from codelibre.utils.estimate_tokens import MESSAGE_OVERHEAD_TOKENS, TokenEstimator, count_normalized_chars
+from codelibre.utils.truncation import truncate_diff
+
+
+def file_diff(path, lines=50):
+    body = "".join(f"+    value_{i} = compute(x, y)\n" for i in range(lines))
+    return f"diff --git a/{path} b/{path}\n@@ -0,0 +1,{lines} @@\n{body}"
+
+
+def true_tokens(messages, ratios):
+    """Token count an API with the given per-kind ratios would report."""
+    tokens = 0
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS
+        for kind, chars in content_breakdown(message.content).items():
+            tokens += chars / ratios[kind]
+    return int(tokens)
+
+
+@pytest.fixture
+def calibration(tmp_path):
+    return TokenCalibration("test-model", path=tmp_path / "calibration.json")
+
+
+class TestContentBreakdown:
+    """Test content_breakdown function."""
+
+    def test_diff_split_by_file_type(self):
+        """Test that diff text is attributed to each file's type."""
+        py, md = file_diff("src/app.py"), file_diff("README.md", lines=5)
+        breakdown = content_breakdown(BASE_TEMPLATE.format(diff=py + md))
+
+        assert breakdown["py"] == count_normalized_chars(py)
+        assert breakdown["md"] == count_normalized_chars(md)
+        assert breakdown["text"] > 0
+
+    def test_plain_text(self):
+        """Test that non-diff content counts as text."""
+        assert content_breakdown([{"type": "text", "text": "hello"}]) == {"text": 5}
+
+
+class TestTokenCalibration:
+    """Test TokenCalibration class."""
+
+    def test_defaults_to_fixed_ratio(self, calibration):
+        """Test that an empty store behaves like the fixed estimator."""
+        message = HumanMessage(content="x" * 400)
+        assert calibration.ratio("py") == 4
+        assert calibration.message_tokens(message) == TokenEstimator().message_tokens(message)
+
+    def test_learns_ratio_for_a_file_type(self, calibration):
+        """Test that repeated observations converge on the real ratio."""
+        messages = [HumanMessage(content=BASE_TEMPLATE.format(diff=file_diff("app.py", lines=400)))]
+        ratios = {"py": 2.5, "text": 4}
+        for _ in range(40):
+            calibration.record(messages, true_tokens(messages, ratios))
+
+        assert calibration.ratio("py") == pytest.approx(2.5, rel=0.05)
+        assert calibration.message_tokens(messages[0]) == pytest.approx(true_tokens(messages, ratios), rel=0.05)
+
+    def test_learns_file_types_separately(self, calibration):
+        """Test that different file types end up with different ratios."""
+        py = [HumanMessage(content=BASE_TEMPLATE.format(diff=file_diff("app.py", lines=400)))]
+        md = [HumanMessage(content=BASE_TEMPLATE.format(diff=file_diff("notes.md", lines=400)))]
+        ratios = {"py": 2.5, "md": 4.5, "text": 4}
+        for _ in range(40):
+            calibration.record(py, true_tokens(py, ratios))
+            calibration.record(md, true_tokens(md, ratios))
+
+        assert calibration.ratio("py") == pytest.approx(2.5, rel=0.1)
+        assert calibration.ratio("md") == pytest.approx(4.5, rel=0.1)
+
+    def test_unknown_type_uses_model_wide_ratio(self, calibration):
+        """Test that unseen file types fall back to the ratio learned over everything."""
+        messages = [HumanMessage(content=BASE_TEMPLATE.format(diff=file_diff("app.py", lines=400)))]
+        for _ in range(20):
+            calibration.record(messages, true_tokens(messages, {"py": 2.0, "text": 2.0}))
+
+        assert calibration.ratio("rs") == calibration.ratio("*")
+        assert calibration.ratio("rs") < 3
+
+    def test_saved_and_reloaded(self, calibration, tmp_path):
+        """Test that learned ratios and observations persist across instances."""
+        messages = [SystemMessage(content="system"), HumanMessage(content="x" * 4000)]
+        estimate = calibration.record(messages, 2000)
+        calibration.save()
+
+        reloaded = TokenCalibration("test-model", path=tmp_path / "calibration.json")
+        assert reloaded.ratio("text") == calibration.ratio("text")
+        assert reloaded.samples("text") == 1
+        assert reloaded._store["observations"][-1]["actual"] == 2000
+        assert reloaded._store["observations"][-1]["estimated"] == pytest.approx(estimate, abs=0.1)
+
+    def test_ratios_are_per_model(self, calibration, tmp_path):
+        """Test that other models are not affected."""
+        calibration.record([HumanMessage(content="x" * 4000)], 2000)
+        calibration.save()
+
+        assert TokenCalibration("other-model", path=tmp_path / "calibration.json").ratio("text") == 4
+
+    def test_ignores_useless_usage(self, calibration):
+        """Test that a reported count below the fixed overhead is ignored."""
+        assert calibration.record([HumanMessage(content="x" * 40)], 1) is None
+        assert calibration.samples() == 0
+
+    def test_drives_truncation(self, calibration):
+        """Test that a learned lower ratio makes truncation cut more."""
+        diff = "".join(file_diff(f"mod_{i}.py", lines=20) for i in range(10))
+        messages = [HumanMessage(content=BASE_TEMPLATE.format(diff=diff))]
+        for _ in range(40):
+            calibration.record(messages, true_tokens(messages, {"py": 2.0, "text": 4}))
+
+        default_result = truncate_diff(diff, 1000)
+        calibrated_result = truncate_diff(diff, 1000, calibration)
+
+        assert len(calibrated_result) < len(default_result)
+        assert calibration.text_tokens(calibrated_result, "py") <= 1000
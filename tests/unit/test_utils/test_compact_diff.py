@@ -0,0 +1,97 @@
+from codelibre.utils.compact_diff import compact_diff, compact_hunk
+from codelibre.utils.diff_utils import file_diff_path, split_file_diffs
+from codelibre.utils.estimate_tokens import estimate_text_tokens
+from codelibre.utils.truncation import truncate_diff
+
+
+MODIFIED = """diff --git a/src/app.py b/src/app.py
+index 83db48f..bf269f4 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -10,7 +10,7 @@ def main():
+     setup()
+     config = load()
+     run(config)
+-    return 0
++    return exit_code
+     # done
+     cleanup()
+     log()
+"""
+
+DELETED = """diff --git a/old.py b/old.py
+deleted file mode 100644
+index 83db48f..0000000
+--- a/old.py
++++ /dev/null
+@@ -1,3 +0,0 @@
+-a = 1
+-b = 2
+-c = 3
+"""
+
+RENAMED = """diff --git a/a.py b/lib/a.py
+similarity index 100%
+rename from a.py
+rename to lib/a.py
+"""
+
+NEW = """diff --git a/new.py b/new.py
+new file mode 100644
+index 0000000..83db48f
+--- /dev/null
++++ b/new.py
+@@ -0,0 +1 @@
++x = 1
+"""
+
+
+class TestCompactHunk:
+    """Test compact_hunk."""
+
+    def test_drops_context_and_line_numbers(self):
+        hunk = "@@ -1,3 +1,3 @@ class A:\n a\n-b\n+c\n d\n"
+        assert compact_hunk(hunk) == "@@ class A:\n-b\n+c\n"
+
+    def test_no_section(self):
+        assert compact_hunk("@@ -1 +1 @@\n-b\n+c\n") == "@@\n-b\n+c\n"
+
+    def test_drops_whitespace_only_edits(self):
+        hunk = "@@ -1,3 +1,4 @@\n-x=1\n-y = 2\n+x = 1\n+\n+y = 3\n"
+        assert compact_hunk(hunk) == "@@\n-y = 2\n+y = 3\n"
+
+    def test_whitespace_only_hunk(self):
+        assert compact_hunk("@@ -1 +1 @@\n-a  =  1\n+a = 1\n") == ""
+
+
+class TestCompactDiff:
+    """Test compact_diff."""
+
+    def test_modified_file(self):
+        assert compact_diff(MODIFIED) == "diff --git src/app.py\n@@ def main():\n-    return 0\n+    return exit_code\n"
+
+    def test_deleted_file(self):
+        assert compact_diff(DELETED) == "diff --git old.py\ndeleted file (3 lines)\n"
+
+    def test_renamed_file(self):
+        assert compact_diff(RENAMED) == "diff --git lib/a.py\nrenamed from a.py\n"
+
+    def test_new_file(self):
+        assert compact_diff(NEW) == "diff --git new.py\nnew file\n@@\n+x = 1\n"
+
+    def test_whitespace_only_file(self):
+        diff = "diff --git a/a.js b/a.js\nindex 1..2 100644\n--- a/a.js\n+++ b/a.js\n@@ -1 +1 @@\n-x=1\n+x = 1\n"
+        assert compact_diff(diff) == "diff --git a.js\n(whitespace-only changes)\n"
+
+    def test_keeps_text_outside_files(self):
+        note = "[2 file(s) omitted: a, b]\n"
+        assert compact_diff(MODIFIED + note).endswith(note)
+
+    def test_still_splits_per_file(self):
+        compacted = compact_diff(MODIFIED + DELETED + RENAMED + NEW)
+        assert [file_diff_path(f) for f in split_file_diffs(compacted)] == ["src/app.py", "old.py", "lib/a.py", "new.py"]
+        assert truncate_diff(compacted, 40).count("diff --git") >= 1
+
+    def test_saves_tokens(self):
+        diff = MODIFIED + DELETED + RENAMED + NEW
+        assert estimate_text_tokens(compact_diff(diff)) < 0.7 * estimate_text_tokens(diff)
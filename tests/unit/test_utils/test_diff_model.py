@@ -0,0 +1,79 @@
+from codelibre.utils.diff_model import parse_diff, parse_hunks
+from codelibre.utils.diff_utils import count_changes, split_file_diffs, split_hunks
+
+
+DIFF = """diff --git a/src/app.py b/src/app.py
+index 83db48f..bf269f4 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -10,4 +10,4 @@ def main():
+     setup()
+-    return 0
++    return exit_code
++    # diff --git a/not b/a header
+@@ -40 +40,2 @@
+-x
++y
++-- not removed
+diff --git a/old.py b/old.py
+deleted file mode 100644
+"""
+
+
+class TestParseDiff:
+    """Test parse_diff."""
+
+    def test_files_and_hunks(self):
+        parsed = parse_diff(DIFF)
+        assert [file.path for file in parsed.files] == ["src/app.py", "old.py"]
+        app, old = parsed.files
+        assert [(hunk.added, hunk.removed) for hunk in app.hunks] == [(2, 1), (2, 1)]
+        assert (app.added, app.removed) == (4, 2)
+        assert old.hunks == []
+
+    def test_offsets_into_source(self):
+        parsed = parse_diff(DIFF)
+        app = parsed.files[0]
+        assert app.source is DIFF
+        assert app.header.startswith("diff --git a/src/app.py") and app.header.endswith("+++ b/src/app.py\n")
+        assert app.hunks[1].text == "@@ -40 +40,2 @@\n-x\n+y\n+-- not removed\n"
+        assert app.hunks[1].header == "@@ -40 +40,2 @@"
+        assert list(app.hunks[1].lines()) == ["-x", "+y", "+-- not removed"]
+
+    def test_hunk_ranges(self):
+        hunks = parse_diff(DIFF).files[0].hunks
+        assert [hunk.ranges for hunk in hunks] == [(10, 4, 10, 4), (40, 1, 40, 2)]
+        assert parse_hunks("@@ def main():\n-a\n")[0].ranges is None
+
+    def test_preamble(self):
+        parsed = parse_diff("note\n" + DIFF)
+        assert parsed.preamble == "note\n"
+        assert parsed.chunks()[0] == "note\n"
+        assert "".join(parsed.chunks()) == "note\n" + DIFF
+
+    def test_no_files(self):
+        parsed = parse_diff("")
+        assert parsed.files == [] and parsed.chunks() == []
+
+    def test_no_trailing_newline(self):
+        parsed = parse_diff("diff --git a/a b/a\n@@ -1 +1 @@\n-a\n+b")
+        assert (parsed.files[0].added, parsed.files[0].removed) == (1, 1)
+
+    def test_cached(self):
+        assert parse_diff(DIFF) is parse_diff(DIFF)
+
+
+class TestStringHelpers:
+    """Test the diff_utils helpers built on the model."""
+
+    def test_split_file_diffs_round_trips(self):
+        assert "".join(split_file_diffs(DIFF)) == DIFF
+        assert len(split_file_diffs(DIFF)) == 2
+
+    def test_split_hunks(self):
+        header, hunks = split_hunks(split_file_diffs(DIFF)[0])
+        assert header.endswith("+++ b/src/app.py\n")
+        assert len(hunks) == 2
+
+    def test_count_changes(self):
+        assert count_changes("@@ -1 +1 @@\n-a\n+b\n+c\n context\n") == (2, 1)
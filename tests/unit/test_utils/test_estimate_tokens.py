@@ -0,0 +1,116 @@
+import re
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from codelibre.utils import estimate_tokens
+from codelibre.utils.estimate_tokens import (
+    IMAGE_BLOCK_TOKENS,
+    TokenCounter,
+    TokenEstimator,
+    count_normalized_chars,
+    estimate_anthropic_tokens,
+    estimate_message_tokens,
+)
+
+
+class TestCountNormalizedChars:
+    """Test count_normalized_chars function."""
+
+    @pytest.mark.parametrize("text", [
+        "",
+        " ",
+        "   \n\t ",
+        "word",
+        "  leading",
+        "trailing \n",
+        "a  b\n\n\tc",
+        "+    indented = 1\n-    indented = 2\n",
+    ])
+    def test_matches_regex_collapse(self, text):
+        """Test that the count equals collapsing whitespace with a regex."""
+        assert count_normalized_chars(text) == len(re.sub(r"\s+", " ", text))
+
+    def test_runs_across_slices(self, monkeypatch):
+        """Test that whitespace runs crossing slice boundaries are counted once."""
+        monkeypatch.setattr(estimate_tokens, "_SLICE_SIZE", 4)
+        text = "ab    \n\n   cd e   f  "
+        assert count_normalized_chars(text) == len(re.sub(r"\s+", " ", text))
+
+
+class TestEstimateMessageTokens:
+    """Test per-message estimation."""
+
+    def test_string_content(self):
+        """Test that plain strings use 4 chars per token plus overhead."""
+        assert estimate_message_tokens(HumanMessage(content="x" * 40)) == 14
+
+    def test_list_content(self):
+        """Test that list-form content counts text blocks, strings and images."""
+        message = HumanMessage(content=[
+            "x" * 40,
+            {"type": "text", "text": "y" * 80},
+            {"type": "image", "source": {"type": "base64", "data": "..."}},
+        ])
+        assert estimate_message_tokens(message) == 10 + 20 + IMAGE_BLOCK_TOKENS + 4
+
+    def test_anthropic_tokens_sums_messages(self):
+        """Test that estimate_anthropic_tokens sums per-message estimates."""
+        messages = [HumanMessage(content="x" * 40), AIMessage(content="y" * 20), "z" * 8]
+        assert estimate_anthropic_tokens(messages) == 14 + 9 + 6
+
+
+class TestTokenCounter:
+    """Test TokenCounter class."""
+
+    def test_add_and_remove(self):
+        """Test that the total follows adds and removes."""
+        first = HumanMessage(content="x" * 400)
+        second = AIMessage(content="y" * 40)
+        counter = TokenCounter([first])
+
+        assert counter.total == 104
+        assert counter.add(second) == 118
+        assert counter.remove(first) == 14
+
+    def test_each_message_measured_once(self):
+        """Test that repeated adds and removes reuse the cached count."""
+        calls = []
+
+        def estimator(message):
+            calls.append(message)
+            return 10.0
+
+        message = HumanMessage(content="x")
+        counter = TokenCounter(estimator=estimator)
+        for _ in range(5):
+            counter.add(message)
+            counter.remove(message)
+
+        assert len(calls) == 1
+        assert counter.total == 0
+
+    def test_shared_cache_across_counters(self):
+        """Test that counters built on one estimator only measure new messages."""
+        calls = []
+        estimator = TokenEstimator()
+
+        def measure(message):
+            calls.append(message)
+            return estimator.message_tokens(message)
+
+        conversation = [HumanMessage(content="diff"), AIMessage(content="feat: x")]
+        TokenCounter(conversation, measure, cache=estimator.message_counts())
+        conversation.append(HumanMessage(content="Feedback: shorter"))
+        counter = TokenCounter(conversation, measure, cache=estimator.message_counts())
+
+        assert len(calls) == 3
+        assert counter.total == estimate_anthropic_tokens(conversation)
+
+        estimator.forget_message_counts()
+        TokenCounter(conversation, measure, cache=estimator.message_counts())
+        assert len(calls) == 6
+
+    def test_matches_batch_estimate(self):
+        """Test that the running total equals the batch estimator."""
+        messages = [HumanMessage(content=f"message {i} " * i) for i in range(50)]
+        counter = TokenCounter(messages)
+        assert counter.total == estimate_anthropic_tokens(messages)
@@ -0,0 +1,27 @@
+from codelibre.utils.fallback_message import fallback_commit_message
+from codelibre.utils.git_helpers import sanitize_commit_message
+
+
+class TestFallbackCommitMessage:
+    """Test fallback_commit_message function."""
+
+    def test_nothing_staged(self):
+        assert fallback_commit_message([]) is None
+
+    def test_single_file(self):
+        assert fallback_commit_message([("A", "src/app.py")]) == "chore: add app.py"
+
+    def test_docs_only(self):
+        assert fallback_commit_message([("M", "README.md"), ("M", "docs/setup.md")]) == "docs: update 2 files"
+
+    def test_tests_only_in_common_directory(self):
+        changes = [("D", "tests/unit/test_a.py"), ("D", "tests/unit/test_b.py")]
+        assert fallback_commit_message(changes) == "test: remove 2 files in tests/unit"
+
+    def test_mixed_statuses(self):
+        assert fallback_commit_message([("A", "a.py"), ("M", "b.py")]) == "chore: update 2 files"
+
+    def test_passes_sanitization(self):
+        """Test that the message is accepted as-is by sanitize_commit_message."""
+        message = fallback_commit_message([("M", "src/codelibre/cli.py"), ("M", "src/codelibre/config.py")])
+        assert sanitize_commit_message(message) == message
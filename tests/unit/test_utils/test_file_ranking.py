@@ -0,0 +1,120 @@
+import pytest
+from codelibre.utils.compact_diff import compact_diff
+from codelibre.utils.diff_model import parse_diff
+from codelibre.utils.diff_utils import file_diff_path, split_file_diffs
+from codelibre.utils.file_ranking import load_rules, parse_rules, path_matches, rank_file, select_files
+
+
+def file_diff(path, added):
+    """A new-file diff of `added` lines."""
+    lines = "".join(f"+{line}\n" for line in added)
+    return (
+        f"diff --git a/{path} b/{path}\nnew file mode 100644\n--- /dev/null\n+++ b/{path}\n"
+        f"@@ -0,0 +1,{len(added)} @@\n" + lines
+    )
+
+
+def rank(diff, token_budget, rules=()):
+    """rank_file for the only file of `diff`."""
+    return rank_file(parse_diff(diff).files[0], token_budget, rules)
+
+
+SOURCE = file_diff("src/app.py", ["def main():", "    return run()"])
+LOCKFILE = file_diff("package-lock.json", [f'    "dep-{i}": "1.0.{i}",' for i in range(200)])
+
+
+class TestPathMatches:
+    """Test path_matches .gitignore-style patterns."""
+
+    @pytest.mark.parametrize("path, pattern, expected", [
+        ("yarn.lock", "*.lock", True),
+        ("web/yarn.lock", "*.lock", True),
+        ("web/dist/app.js", "dist/", True),
+        ("dist", "dist/", False),
+        ("src/gen/api.py", "/src/gen/", True),
+        ("lib/src/gen/api.py", "/src/gen/", False),
+        ("src/gen/api.py", "src/*/api.py", True),
+        ("src/app.py", "*.lock", False),
+    ])
+    def test_patterns(self, path, pattern, expected):
+        assert path_matches(path, pattern) is expected
+
+
+class TestRules:
+    """Test parse_rules and load_rules."""
+
+    def test_parse(self):
+        text = "# generated\n*.snap\n\n!schema/*.proto\n"
+        assert parse_rules(text) == [("*.snap", False), ("schema/*.proto", True)]
+
+    def test_load(self, tmp_path):
+        (tmp_path / ".codelibreignore").write_text("fixtures/\n", encoding="utf-8")
+        assert load_rules(tmp_path) == [("fixtures/", False)]
+        assert load_rules(tmp_path / "missing") == []
+        assert load_rules(None) == []
+
+
+class TestRankFile:
+    """Test rank_file scores."""
+
+    def test_ordinary_file(self):
+        ranked = rank(SOURCE, 1000)
+        assert (ranked.score, ranked.reason) == (1.0, "")
+
+    def test_lockfile(self):
+        assert rank(LOCKFILE, 100_000).reason == "lockfile"
+
+    def test_generated_marker(self):
+        diff = file_diff("api/client.py", ["# Code generated by openapi-generator. DO NOT EDIT.", "x = 1"])
+        assert rank(diff, 1000).reason == "generated"
+
+    def test_minified_content(self):
+        assert rank(file_diff("static/app.js", ["var a=1;" * 100]), 100_000).reason == "minified"
+
+    def test_large_file(self):
+        ranked = rank(LOCKFILE.replace("package-lock.json", "src/table.py"), 100)
+        assert ranked.reason == "large file"
+        assert ranked.score == 0.5
+
+    def test_last_rule_wins(self):
+        rules = parse_rules("*.lock\n!package-lock.json\n")
+        assert rank(LOCKFILE, 1000, rules).reason == "priority"
+        assert rank(file_diff("yarn.lock", ["a"]), 1000, rules).reason == "ignored"
+
+
+class TestSelectFiles:
+    """Test select_files."""
+
+    def test_fits_budget_unchanged(self):
+        diff = SOURCE + LOCKFILE
+        assert select_files(diff, 100_000) == (diff, [])
+
+    def test_reduces_low_value_files_over_budget(self):
+        selected, reduced = select_files(SOURCE + LOCKFILE, 500)
+        assert [file.path for file in reduced] == ["package-lock.json"]
+        assert selected == SOURCE + "diff --git a/package-lock.json b/package-lock.json\n(large lockfile, +200 -0 lines, content omitted)\n"
+
+    def test_ordinary_files_left_to_truncation(self):
+        big = LOCKFILE.replace("package-lock.json", "src/table.py")
+        selected, reduced = select_files(SOURCE + big, 100)
+        assert reduced == []
+        assert selected == SOURCE + big
+
+    def test_ignored_files_always_reduced(self):
+        selected, reduced = select_files(SOURCE, 100_000, parse_rules("src/"))
+        assert [file.reason for file in reduced] == ["ignored"]
+        assert selected.endswith("(ignored, +2 -0 lines, content omitted)\n")
+
+    def test_keeps_omitted_files_note(self):
+        note = "[1 file(s) omitted: big.bin]\n"
+        selected, _ = select_files(SOURCE + LOCKFILE + note, 500)
+        assert selected.endswith(note)
+
+    def test_compact_diff(self):
+        selected, reduced = select_files(compact_diff(SOURCE + LOCKFILE), 300)
+        assert [file_diff_path(f) for f in split_file_diffs(selected)] == ["src/app.py", "package-lock.json"]
+        assert "content omitted" in selected
+
+    def test_stat_lines_left_alone(self):
+        selected, _ = select_files(SOURCE + LOCKFILE, 500)
+        assert select_files(selected, 10, parse_rules("*.json")) == (selected, [])
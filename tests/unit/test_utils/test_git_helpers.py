@@ -1,8 +1,14 @@
+import io
 import pytest
 import subprocess
+import time
 from unittest.mock import patch, MagicMock
 from codelibre.utils.git_helpers import (
+    complete_commit_line,
     get_staged_diff,
+    iter_file_diffs,
+    parse_raw_status,
+    read_staged_diff,
     sanitize_commit_message,
     run_git_command,
     unstage_all_changes,
@@ -11,35 +17,187 @@ from codelibre.utils.git_helpers import (
 from codelibre.exceptions import SanitizationError, GitCommandError
 
 
+def fake_popen(output: bytes, returncode: int = 0, error: bytes = b""):
+    """Popen stand-in streaming `output` through stdout and writing `error` to stderr."""
+    def popen(args, stdout=None, stderr=None, cwd=None):
+        process = MagicMock()
+        process.stdout = io.BytesIO(output)
+        process.wait.return_value = returncode
+        stderr.write(error)
+        return process
+
+    return popen
+
+
+def file_diff(path, lines=10, line=b"+added line\n"):
+    return f"diff --git a/{path} b/{path}\n@@ -0,0 +1,{lines} @@\n".encode() + line * lines
+
+
 class TestGetStagedDiff:
     """Test get_staged_diff function."""
     
-    @patch('subprocess.run')
-    def test_get_staged_diff_success(self, mock_run):
+    def test_get_staged_diff_success(self):
         """Test successful diff retrieval."""
-        mock_result = MagicMock()
-        mock_result.stdout = "diff --git a/file.py b/file.py\n+added line\n"
-        mock_run.return_value = mock_result
-        
-        result = get_staged_diff()
+        with patch('subprocess.Popen', side_effect=fake_popen(b"diff --git a/file.py b/file.py\n+added line\n")) as mock_popen:
+            result = get_staged_diff()
         
-        mock_run.assert_called_once_with(
-            ["git", "diff", "--cached"], 
-            capture_output=True, 
-            text=True
-        )
+        assert mock_popen.call_args.args[0] == ["git", "diff", "--cached", "--no-color", "--no-ext-diff", "-M", "--patch-with-raw"]
+        assert mock_popen.call_args.kwargs["stdout"] == subprocess.PIPE
         assert result == "diff --git a/file.py b/file.py\n+added line"
     
-    @patch('subprocess.run')
-    def test_get_staged_diff_empty(self, mock_run):
+    def test_get_staged_diff_empty(self):
         """Test empty diff (no staged changes)."""
-        mock_result = MagicMock()
-        mock_result.stdout = "   \n  \n"
-        mock_run.return_value = mock_result
-        
-        result = get_staged_diff()
+        with patch('subprocess.Popen', side_effect=fake_popen(b"   \n  \n")):
+            result = get_staged_diff()
         assert result == ""
 
+    def test_get_staged_diff_git_error(self):
+        """Test that a failing git command raises GitCommandError."""
+        with patch('subprocess.Popen', side_effect=fake_popen(b"", returncode=128, error=b"fatal: not a git repository")):
+            with pytest.raises(GitCommandError, match="not a git repository"):
+                get_staged_diff()
+
+    @patch('subprocess.Popen', side_effect=FileNotFoundError())
+    def test_get_staged_diff_git_not_found(self, mock_popen):
+        """Test handling when git is not installed."""
+        with pytest.raises(GitCommandError, match="Git command not found"):
+            get_staged_diff()
+
+
+class TestParseRawStatus:
+    """Test parse_raw_status function."""
+
+    def test_statuses_and_renames(self):
+        raw = (
+            ":000000 100644 0000000 e69de29 A\tnew.py\n"
+            ":100644 100644 bcd1234 0123456 M\tsrc/app.py\n"
+            ":100644 100644 abcd123 1234567 R86\told.py\trenamed.py\n"
+            "\n"
+        )
+        assert parse_raw_status(raw) == [("A", "new.py"), ("M", "src/app.py"), ("R", "renamed.py")]
+
+
+class TestIterFileDiffs:
+    """Test iter_file_diffs function."""
+
+    def test_split_per_file(self):
+        """Test that the stream is split at file headers."""
+        stream = io.BytesIO(file_diff("a.py", 2) + file_diff("b.md", 3))
+        files = list(iter_file_diffs(stream))
+
+        assert [path for path, _, _ in files] == ["a.py", "b.md"]
+        assert all(complete for _, _, complete in files)
+        assert files[1][1].count("+added line") == 3
+
+    def test_header_text_inside_long_line_not_split(self):
+        """Test that a header-like string mid-line (read in several chunks) is not a file boundary."""
+        line = b"+" + b"x" * 20 + b"diff --git a/c b/c\n"
+        files = list(iter_file_diffs(io.BytesIO(file_diff("a.py", 1, line)), chunk_size=21))
+
+        assert len(files) == 1
+
+    def test_file_capped(self):
+        """Test that only max_file_bytes of a file are kept and it is marked incomplete."""
+        stream = io.BytesIO(file_diff("big.py", 1000) + file_diff("small.py", 1))
+        files = list(iter_file_diffs(stream, max_file_bytes=200))
+
+        assert len(files[0][1]) <= 200
+        assert files[0][2] is False
+        assert files[1][0] == "small.py"
+        assert files[1][2] is True
+
+    def test_invalid_utf8_replaced(self):
+        """Test that invalid UTF-8 does not raise."""
+        stream = io.BytesIO(file_diff("bin.dat", 1, b"+\xff\xfe broken\n"))
+        (_, text, _), = iter_file_diffs(stream)
+
+        assert "\ufffd" in text
+
+
+class TestReadStagedDiff:
+    """Test read_staged_diff against a real repository."""
+
+    @pytest.fixture
+    def repo(self, tmp_path):
+        subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+        return tmp_path
+
+    def stage(self, repo, name, content: bytes):
+        (repo / name).write_bytes(content)
+        subprocess.run(["git", "add", name], cwd=repo, check=True)
+
+    def test_all_files_within_budget(self, repo):
+        """Test that everything is read when it fits."""
+        self.stage(repo, "a.py", b"print('a')\n")
+        self.stage(repo, "b.py", b"print('b')\n")
+
+        staged = read_staged_diff(token_budget=1000, cwd=str(repo))
+
+        assert staged.files == ["a.py", "b.py"]
+        assert staged.changes == [("A", "a.py"), ("A", "b.py")]
+        assert staged.omitted == []
+        assert "print('b')" in staged.text
+
+    def test_over_budget_files_sent_as_stat_lines(self, repo):
+        """Test that a file past the budget becomes a stat line and reading goes on."""
+        self.stage(repo, "a.py", b"print('a')\n")
+        self.stage(repo, "b_big.txt", b"generated line of text\n" * 20000)
+        self.stage(repo, "c.py", b"print('c')\n")
+
+        staged = read_staged_diff(token_budget=200, cwd=str(repo))
+
+        assert staged.files == ["a.py", "c.py"]
+        assert [file.path for file in staged.reduced] == ["b_big.txt"]
+        assert staged.omitted == []
+        assert "generated line" not in staged.text
+        assert "diff --git a/b_big.txt b/b_big.txt\n(large file, at least +" in staged.text
+        assert "print('c')" in staged.text
+
+    def test_lockfile_does_not_hide_later_files(self, repo):
+        """Test that low-value files are ranked while reading, ordinary files first."""
+        (repo / "src").mkdir()
+        self.stage(repo, "package-lock.json", b'{"lockfileVersion": 3}\n' * 300)
+        self.stage(repo, "src/app.js", b"console.log('app');\n" * 20)
+
+        staged = read_staged_diff(token_budget=1000, cwd=str(repo))
+
+        assert staged.files == ["src/app.js"]
+        assert [(file.path, file.reason) for file in staged.reduced] == [("package-lock.json", "large lockfile")]
+        assert "(large lockfile, +300 -0 lines, content omitted)" in staged.text
+        assert "file(s) omitted" not in staged.text
+
+    def test_ignore_rules_applied_while_reading(self, repo):
+        """Test that files ignored by the rules are sent as a stat line even within budget."""
+        self.stage(repo, "a.py", b"print('a')\n")
+        self.stage(repo, "notes.txt", b"note\n")
+
+        staged = read_staged_diff(token_budget=1000, cwd=str(repo), rules=[("*.txt", False)])
+
+        assert staged.files == ["a.py"]
+        assert "(ignored, +1 -0 lines, content omitted)" in staged.text
+
+    def test_stops_at_timeout(self, repo):
+        """Test that a diff git is slow to produce is cut off at the timeout."""
+        # A textconv filter that hangs stands in for a large or locked index
+        subprocess.run(["git", "config", "diff.slow.textconv", "sleep 10; cat"], cwd=repo, check=True)
+        (repo / ".gitattributes").write_text("*.slow diff=slow\n")
+        self.stage(repo, "data.slow", b"content\n")
+
+        start = time.monotonic()
+        staged = read_staged_diff(cwd=str(repo), timeout=0.3)
+
+        assert time.monotonic() - start < 5
+        assert staged.timed_out
+        assert staged.files == []
+
+    def test_invalid_utf8_content(self, repo):
+        """Test that non-UTF-8 text diffs are decoded with replacement characters."""
+        self.stage(repo, "latin1.txt", "caf\xe9\n".encode("latin-1"))
+
+        staged = read_staged_diff(cwd=str(repo))
+
+        assert "caf\ufffd" in staged.text
+
 
 class TestSanitizeCommitMessage:
     """Test sanitize_commit_message function."""
@@ -115,6 +273,20 @@ class TestSanitizeCommitMessage:
         assert result == limit_message
 
 
+class TestCompleteCommitLine:
+    """Test complete_commit_line on streamed answers."""
+
+    @pytest.mark.parametrize("text, expected", [
+        ("feat: add cache\n", "feat: add cache"),
+        ("\n  fix(cli)!: handle eof  \nmore", "fix(cli)!: handle eof"),
+        ("feat: add cache", None),  # may still grow
+        ("Here is the message:\nfeat: x\n", None),
+        ("feat:\n", None),
+    ])
+    def test_lines(self, text, expected):
+        assert complete_commit_line(text) == expected
+
+
 class TestRunGitCommand:
     """Test run_git_command function."""
     
@@ -133,7 +305,9 @@ class TestRunGitCommand:
             ["git", "status", "--porcelain"],
             capture_output=True,
             text=True,
-            timeout=30
+            timeout=30,
+            cwd=None,
+            input=None
         )
         assert result == mock_result
     
@@ -150,9 +324,21 @@ class TestRunGitCommand:
             ["git", "status", "--porcelain"],
             capture_output=True,
             text=True,
-            timeout=30
+            timeout=30,
+            cwd=None,
+            input=None
         )
     
+    @patch('subprocess.run')
+    def test_cwd_and_input_passed(self, mock_run):
+        """Test that the working directory and stdin input reach subprocess.run."""
+        mock_run.return_value = MagicMock(returncode=0)
+        
+        run_git_command(["add", "--pathspec-from-file=-"], cwd="/some/path", input="a.py")
+        
+        assert mock_run.call_args.kwargs["cwd"] == "/some/path"
+        assert mock_run.call_args.kwargs["input"] == "a.py"
+    
     def test_empty_args_raises_error(self):
         """Test that empty arguments raise GitCommandError."""
         with pytest.raises(GitCommandError, match="Git command arguments cannot be empty"):
@@ -260,45 +446,28 @@ class TestSafeGitCommit:
     
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_successful_commit(self, mock_run_git):
-        """Test successful git commit."""
-        # Mock status check (has changes)
-        status_result = MagicMock()
-        status_result.stdout = "M  file.py\n"
-        
-        # Mock commit command
+        """Test successful git commit with a single git call."""
         commit_result = MagicMock()
         commit_result.returncode = 0
-        
-        mock_run_git.side_effect = [status_result, commit_result]
+        mock_run_git.return_value = commit_result
         
         result = safe_git_commit("feat: add new feature")
         
         assert result is True
-        assert mock_run_git.call_count == 2
-        mock_run_git.assert_any_call(["status", "--porcelain"], cwd=None)
-        mock_run_git.assert_any_call(["commit", "-m", "feat: add new feature"], cwd=None)
+        mock_run_git.assert_called_once_with(["commit", "-m", "feat: add new feature"], cwd=None)
     
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_commit_with_cwd(self, mock_run_git):
         """Test commit with custom working directory."""
-        status_result = MagicMock()
-        status_result.stdout = "M  file.py\n"
-        commit_result = MagicMock()
-        
-        mock_run_git.side_effect = [status_result, commit_result]
-        
         result = safe_git_commit("fix: bug fix", cwd="/some/path")
         
         assert result is True
-        mock_run_git.assert_any_call(["status", "--porcelain"], cwd="/some/path")
-        mock_run_git.assert_any_call(["commit", "-m", "fix: bug fix"], cwd="/some/path")
+        mock_run_git.assert_called_once_with(["commit", "-m", "fix: bug fix"], cwd="/some/path")
     
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_no_changes_to_commit(self, mock_run_git):
-        """Test error when no changes to commit."""
-        status_result = MagicMock()
-        status_result.stdout = ""  # No changes
-        mock_run_git.return_value = status_result
+        """Test that git's 'nothing to commit' is reported as no changes."""
+        mock_run_git.side_effect = GitCommandError("Git command failed: nothing to commit, working tree clean")
         
         with pytest.raises(GitCommandError, match="No changes to commit"):
             safe_git_commit("feat: add feature")
@@ -311,13 +480,7 @@ class TestSafeGitCommit:
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_git_command_error_propagated(self, mock_run_git):
         """Test that git command errors are propagated."""
-        status_result = MagicMock()
-        status_result.stdout = "M  file.py\n"
-        
-        mock_run_git.side_effect = [
-            status_result,
-            GitCommandError("Commit failed")
-        ]
+        mock_run_git.side_effect = GitCommandError("Commit failed")
         
         with pytest.raises(GitCommandError, match="Commit failed"):
             safe_git_commit("feat: add feature")
@@ -325,38 +488,24 @@ class TestSafeGitCommit:
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_message_sanitization_applied(self, mock_run_git):
         """Test that commit message is properly sanitized."""
-        status_result = MagicMock()
-        status_result.stdout = "M  file.py\n"
-        commit_result = MagicMock()
-        
-        mock_run_git.side_effect = [status_result, commit_result]
-        
         # Message with special characters that should be sanitized
         result = safe_git_commit("FEAT: Add New Feature!!! @#$%")
         
         assert result is True
         # Check that the sanitized message was used
-        mock_run_git.assert_any_call(["commit", "-m", "feat: add new feature"], cwd=None)
+        mock_run_git.assert_called_once_with(["commit", "-m", "feat: add new feature"], cwd=None)
 
 
 class TestIntegration:
     """Integration tests combining multiple functions."""
     
-    @patch('subprocess.run')
+    @patch('subprocess.Popen', side_effect=fake_popen(b"diff --git a/file.py b/file.py\n+new line\n"))
     @patch('codelibre.utils.git_helpers.run_git_command')
     def test_full_workflow_simulation(self, mock_run_git, mock_subprocess):
         """Test a complete workflow simulation."""
-        # Mock get_staged_diff
-        diff_result = MagicMock()
-        diff_result.stdout = "diff --git a/file.py b/file.py\n+new line\n"
-        mock_subprocess.return_value = diff_result
         
         # Mock safe_git_commit internals
-        status_result = MagicMock()
-        status_result.stdout = "M  file.py\n"
-        commit_result = MagicMock()
-        
-        mock_run_git.side_effect = [status_result, commit_result]
+        mock_run_git.return_value = MagicMock()
         
         # Test the workflow
         diff = get_staged_diff()
@@ -0,0 +1,124 @@
+import subprocess
+import pytest
+from unittest.mock import patch
+from codelibre.exceptions import GitCommandError
+from codelibre.utils import git_helpers
+from codelibre.utils.git_session import GitSession, find_index_file, find_worktree_root
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """Empty git repository with a committer identity and no global config."""
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", "/dev/null")
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "Test")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "test@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "Test")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@example.com")
+    monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    return tmp_path
+
+
+def git_calls():
+    """Counts git processes started through run_git_command and the diff reader."""
+    run = patch.object(git_helpers.subprocess, "run", wraps=subprocess.run)
+    popen = patch.object(git_helpers.subprocess, "Popen", wraps=subprocess.Popen)
+    return run, popen
+
+
+class TestFindIndexFile:
+    """Test find_index_file function."""
+
+    def test_from_subdirectory(self, repo):
+        (repo / "src").mkdir()
+        assert find_index_file(str(repo / "src")) == (repo / ".git" / "index").resolve()
+
+    def test_outside_repository(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("GIT_INDEX_FILE", raising=False)
+        assert find_index_file(str(tmp_path)) is None
+
+
+class TestFindWorktreeRoot:
+    """Test find_worktree_root function."""
+
+    def test_from_subdirectory(self, repo):
+        (repo / "src").mkdir()
+        assert find_worktree_root(str(repo / "src")) == repo.resolve()
+
+
+class TestGitSession:
+    """Test GitSession class."""
+
+    def test_cwd_honored(self, repo):
+        """Test that commands run in the session's directory, not the process's."""
+        (repo / "a.py").write_text("a = 1\n")
+        session = GitSession(cwd=str(repo))
+        session.stage(["a.py"])
+
+        assert session.staged_diff().changes == [("A", "a.py")]
+
+    def test_stage_many_paths_in_one_process(self, repo):
+        """Test that any number of paths, including odd names, are staged with one git call."""
+        names = [f"file {i}.txt" for i in range(50)] + ["-dash.txt"]
+        for name in names:
+            (repo / name).write_text(name)
+        session = GitSession(cwd=str(repo))
+
+        run, popen = git_calls()
+        with run as mock_run, popen:
+            session.stage(names)
+
+        assert mock_run.call_count == 1
+        assert sorted(path for _, path in session.staged_diff().changes) == sorted(names)
+
+    def test_staged_diff_reused_until_index_changes(self, repo):
+        """Test that an unchanged index is not read twice, and a changed one is."""
+        (repo / "a.py").write_text("a = 1\n")
+        session = GitSession(cwd=str(repo))
+        session.stage(["a.py"])
+
+        run, popen = git_calls()
+        with run, popen as mock_popen:
+            first = session.staged_diff()
+            second = session.staged_diff()
+        assert second is first
+        assert mock_popen.call_count == 1
+
+        # Changed behind the session's back
+        (repo / "b.py").write_text("b = 2\n")
+        subprocess.run(["git", "add", "b.py"], cwd=repo, check=True)
+        third = session.staged_diff()
+
+        assert third is not first
+        assert [path for _, path in third.changes] == ["a.py", "b.py"]
+
+    def test_commit_and_unstage(self, repo):
+        """Test committing staged files and unstaging specific paths."""
+        (repo / "a.py").write_text("a = 1\n")
+        (repo / "b.py").write_text("b = 2\n")
+        session = GitSession(cwd=str(repo))
+        session.stage(["a.py", "b.py"])
+        session.commit("feat: first")
+
+        (repo / "a.py").write_text("a = 3\n")
+        (repo / "b.py").write_text("b = 4\n")
+        session.stage(["a.py", "b.py"])
+        session.unstage(["b.py"])
+
+        assert session.staged_diff().changes == [("M", "a.py")]
+
+    def test_commit_known_empty_index_skips_git(self, repo):
+        """Test that committing an index just read as empty fails without starting git."""
+        session = GitSession(cwd=str(repo))
+        session.staged_diff()
+
+        run, popen = git_calls()
+        with run as mock_run, popen:
+            with pytest.raises(GitCommandError, match="No changes to commit"):
+                session.commit("feat: nothing")
+        assert mock_run.call_count == 0
+
+    def test_commit_empty_index(self, repo):
+        """Test that git's own 'nothing to commit' is reported the same way."""
+        with pytest.raises(GitCommandError, match="No changes to commit"):
+            GitSession(cwd=str(repo)).commit("feat: nothing")
@@ -0,0 +1,171 @@
+import asyncio
+import pytest
+from codelibre.config import HEDGE_DEFAULT_DELAY, HEDGE_HISTORY, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES
+from codelibre.utils.hedging import HedgedLLM, LatencyHistory, first_to_stream, percentile
+
+
+class Streams:
+    """Opens scripted streams in turn: (seconds before the first item, items or an error)."""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.opened = 0
+        self.closed = []
+
+    def open(self):
+        delay, items = self.scripts[self.opened]
+        index = self.opened
+        self.opened += 1
+
+        async def stream():
+            try:
+                await asyncio.sleep(delay)
+                if isinstance(items, Exception):
+                    raise items
+                for item in items:
+                    yield item
+            finally:
+                self.closed.append(index)
+
+        return stream()
+
+
+async def race(streams, hedge_after):
+    stream, hedged, first_token = await first_to_stream(streams.open, hedge_after)
+    return [item async for item in stream], hedged, first_token
+
+
+class TestPercentile:
+    """Test nearest-rank percentiles."""
+
+    @pytest.mark.parametrize("q, expected", [(50, 5), (90, 9), (100, 10), (1, 1)])
+    def test_nearest_rank(self, q, expected):
+        assert percentile(list(range(10, 0, -1)), q) == expected
+
+
+class TestLatencyHistory:
+    """Test hedge delays learned from recent times to first token."""
+
+    def test_default_delay_until_enough_samples(self, tmp_path):
+        history = LatencyHistory("model", tmp_path / "latency.json")
+        assert history.hedge_delay(90, 10) == HEDGE_DEFAULT_DELAY
+
+    def test_percentile_of_recent_requests(self, tmp_path):
+        history = LatencyHistory("model", tmp_path / "latency.json")
+        for i in range(HEDGE_MIN_SAMPLES):
+            history.record(i + 1.0, hedged=False)
+        assert history.hedge_delay(90, 10) == 9.0
+        assert history.hedge_delay(1, 10) == max(1.0, HEDGE_MIN_DELAY)
+
+    def test_cost_cap(self, tmp_path):
+        history = LatencyHistory("model", tmp_path / "latency.json")
+        for _ in range(HEDGE_HISTORY // 10):
+            history.record(1.0, hedged=True)
+        assert history.hedge_delay(90, 10) is None
+        assert history.hedge_delay(90, 20) is not None
+        assert history.hedge_delay(90, 0) is None
+
+    def test_persisted_per_model(self, tmp_path):
+        path = tmp_path / "latency.json"
+        history = LatencyHistory("model", path)
+        for _ in range(HEDGE_HISTORY + 5):
+            history.record(2.0, hedged=False)
+        history.save()
+
+        assert len(LatencyHistory("model", path).requests) == HEDGE_HISTORY
+        assert LatencyHistory("other", path).requests == []
+
+
+class TestFirstToStream:
+    """Test hedged streaming: the first stream to yield wins."""
+
+    def test_fast_stream_not_hedged(self):
+        streams = Streams((0, ["a", "b"]))
+        items, hedged, _ = asyncio.run(race(streams, hedge_after=1.0))
+        assert (items, hedged, streams.opened) == (["a", "b"], False, 1)
+
+    def test_slow_stream_hedged_and_cancelled(self):
+        streams = Streams((5.0, ["slow"]), (0, ["fast", "!"]))
+        items, hedged, first_token = asyncio.run(race(streams, hedge_after=0.01))
+        assert (items, hedged) == (["fast", "!"], True)
+        assert first_token < 1.0
+        assert sorted(streams.closed) == [0, 1]
+
+    def test_never_hedged_without_delay(self):
+        streams = Streams((0.02, ["only"]))
+        items, hedged, _ = asyncio.run(race(streams, hedge_after=None))
+        assert (items, hedged) == (["only"], False)
+
+    def test_failed_stream_leaves_race_to_other(self):
+        streams = Streams((0.05, ValueError("boom")), (0.1, ["ok"]))
+        items, hedged, _ = asyncio.run(race(streams, hedge_after=0.01))
+        assert (items, hedged) == (["ok"], True)
+
+    def test_error_before_hedge_raised(self):
+        streams = Streams((0, ValueError("boom")))
+        with pytest.raises(ValueError):
+            asyncio.run(race(streams, hedge_after=1.0))
+        assert streams.opened == 1
+
+    def test_both_failing_raises_first_error(self):
+        streams = Streams((0.02, ValueError("first")), (0.5, KeyError("second")))
+        with pytest.raises(ValueError, match="first"):
+            asyncio.run(race(streams, hedge_after=0.01))
+
+    def test_closing_winner_stops_stream(self):
+        streams = Streams((0, ["a", "b", "c"]))
+
+        async def take_one():
+            stream, _, _ = await first_to_stream(streams.open, None)
+            item = await anext(stream)
+            await stream.aclose()
+            return item
+
+        assert asyncio.run(take_one()) == "a"
+        assert streams.closed == [0]
+
+
+class TestHedgedLLM:
+    """Test the hedging chat model wrapper."""
+
+    def test_counts_hedges_and_records_latency(self, tmp_path):
+        streams = Streams((5.0, ["slow"]), (0, ["fast"]))
+        history = LatencyHistory("model", tmp_path / "latency.json")
+        for _ in range(HEDGE_MIN_SAMPLES):
+            history.record(0.001, hedged=False)
+
+        class LLM:
+            def astream(self, messages, **kwargs):
+                return streams.open()
+
+        llm = HedgedLLM(LLM(), history, 90, 10)
+
+        async def collect():
+            return [chunk async for chunk in llm.astream([])]
+
+        assert asyncio.run(collect()) == ["fast"]
+        assert llm.hedged == 1
+        assert history.requests[-1]["hedged"] is True
+        assert LatencyHistory("model", tmp_path / "latency.json").requests == history.requests
+
+    def test_hedge_request_tagged(self, tmp_path):
+        """Test that only the second request carries hedge_tags, and that its win is reported."""
+        streams = Streams((5.0, ["slow"]), (0, ["fast"]))
+        history = LatencyHistory("model", tmp_path / "latency.json")
+        for _ in range(HEDGE_MIN_SAMPLES):
+            history.record(0.001, hedged=False)
+        configs = []
+
+        class LLM:
+            def astream(self, messages, **kwargs):
+                configs.append(kwargs.get("config"))
+                return streams.open()
+
+        llm = HedgedLLM(LLM(), history, 90, 10, hedge_tags=["nostream"])
+
+        async def collect():
+            return [chunk async for chunk in llm.astream([], config={"tags": ["candidate"]})]
+
+        assert asyncio.run(collect()) == ["fast"]
+        assert configs == [{"tags": ["candidate"]}, {"tags": ["candidate", "nostream"]}]
+        assert llm.hedge_won is True
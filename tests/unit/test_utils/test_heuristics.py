@@ -0,0 +1,137 @@
+import pytest
+from codelibre.utils.git_helpers import StagedDiff, sanitize_commit_message
+from codelibre.utils.heuristics import classify_diff, describe_path, file_changes, trivial_commit_message
+
+
+def file_diff(path, removed=(), added=()):
+    """A one-hunk file diff replacing `removed` lines with `added` ones."""
+    lines = [f"-{line}\n" for line in removed] + [f"+{line}\n" for line in added]
+    return (
+        f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+        f"@@ -1,{len(removed)} +1,{len(added)} @@\n" + "".join(lines)
+    )
+
+
+def staged(*files, statuses=None):
+    """StagedDiff of (path, removed, added) edits."""
+    statuses = statuses or {}
+    return StagedDiff(
+        text="".join(file_diff(*f) for f in files),
+        files=[f[0] for f in files],
+        changes=[(statuses.get(f[0], "M"), f[0]) for f in files],
+    )
+
+
+class TestFileChanges:
+    """Test file_changes."""
+
+    def test_lines_per_file(self):
+        diff = staged(("a.py", ["old"], ["new", "-- not a header"]), ("b.py", [], ["x"]))
+        changes = file_changes(diff)
+        assert [(c.path, c.added, c.removed) for c in changes] == [
+            ("a.py", ["new", "-- not a header"], ["old"]),
+            ("b.py", ["x"], []),
+        ]
+
+
+class TestClassifyDiff:
+    """Test classify_diff rules."""
+
+    def test_version_bump(self):
+        diff = staged(
+            ("pyproject.toml", ['version = "0.1.0"'], ['version = "0.2.0"']),
+            ("src/pkg/__init__.py", ['__version__ = "0.1.0"'], ['__version__ = "0.2.0"']),
+        )
+        result = classify_diff(diff)
+        assert result.message == "chore: bump version to 0.2.0"
+        assert result.confidence >= 0.9
+
+    def test_version_file_with_other_changes(self):
+        diff = staged(("pyproject.toml", ['version = "0.1.0"'], ['version = "0.2.0"', 'requests = "*"']))
+        assert classify_diff(diff) is None
+
+    def test_whitespace(self):
+        result = classify_diff(staged(("app.js", ["x =  1", "y  =  2 "], ["x = 1", "y = 2"])))
+        assert result.message == "style: fix whitespace in app"
+        assert result.rule == "whitespace"
+
+    def test_reflow_is_formatting(self):
+        result = classify_diff(staged(("app.js", ["call(a,", "  b)"], ["call(a, b)"])))
+        assert result.rule == "formatting"
+
+    def test_space_between_tokens_is_a_change(self):
+        """Test that a space appearing or vanishing inside a line is not whitespace-only."""
+        assert classify_diff(staged(("app.js", ['label = "a b"'], ['label = "ab"']))) is None
+        assert classify_diff(staged(("app.js", ["return a"], ["returna"]))) is None
+        assert classify_diff(staged(("m.py", ["    return a"], ["    returna"]))) is None
+
+    def test_swapped_lines_are_a_change(self):
+        """Test that reordering lines is not whitespace-only, in any kind of file."""
+        def swap(path, first, second):
+            return (
+                f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+                f"@@ -1,2 +1,2 @@\n-{first}\n {second}\n+{first}\n"
+            )
+
+        diff = StagedDiff(
+            text=swap("m.c", "free(p);", "use(p);") + swap("app.py", "save(a)", "delete(a)"),
+            files=["m.c", "app.py"],
+            changes=[("M", "m.c"), ("M", "app.py")],
+        )
+        assert classify_diff(diff) is None
+        assert classify_diff(StagedDiff(text=swap("m.c", "free(p);", "use(p);"), files=["m.c"], changes=[("M", "m.c")])) is None
+        assert classify_diff(StagedDiff(text=swap("a.py", "save(a)", "delete(a)"), files=["a.py"], changes=[("M", "a.py")])) is None
+
+    def test_python_reindent_is_not_formatting(self):
+        diff = staged(("m.py", ["    return x"], ["        return x"]))
+        assert classify_diff(diff) is None
+
+    def test_code_change(self):
+        assert classify_diff(staged(("m.py", ["return x + 1"], ["return x + 2"]))) is None
+
+    def test_docs(self):
+        result = classify_diff(staged(("README.md", ["old"], ["new"])))
+        assert result.message == "docs: update readme"
+        assert result.confidence >= 0.85
+
+    def test_large_docs_change_is_less_certain(self):
+        result = classify_diff(staged(("docs/guide.md", [], [f"line {i}" for i in range(100)])))
+        assert result.rule == "docs"
+        assert trivial_commit_message(staged(("docs/guide.md", [], [f"line {i}" for i in range(100)]))) is None
+
+    def test_two_docs(self):
+        diff = staged(("README.md", ["a"], ["b"]), ("CHANGELOG.md", ["a"], ["b"]))
+        assert classify_diff(diff).message == "docs: update readme and changelog"
+
+    def test_new_tests(self):
+        diff = staged(("tests/test_git_helpers.py", [], ["def test_x():", "    assert True"]), statuses={"tests/test_git_helpers.py": "A"})
+        assert classify_diff(diff).message == "test: add git helpers tests"
+
+    def test_omitted_files(self):
+        diff = staged(("README.md", ["a"], ["b"]))
+        diff.omitted = ["big.bin"]
+        assert classify_diff(diff) is None
+
+    def test_nothing_staged(self):
+        assert classify_diff(StagedDiff()) is None
+
+    @pytest.mark.parametrize("files", [
+        [("pyproject.toml", ['version = "1.0.0rc1"'], ['version = "1.0.0"'])],
+        [("docs/some-very_long/nested.file-name.with.dots.rst", ["a"], ["b"])],
+        [("src/Weird Name (copy).JS", ["a  = 1"], ["a = 1"])],
+        [("tests/unit/test_a.py", ["a"], ["b"]), ("tests/unit/test_b.py", ["a"], ["b"]), ("tests/test_c.py", ["a"], ["b"])],
+    ])
+    def test_messages_pass_sanitization(self, files):
+        message = classify_diff(staged(*files)).message
+        assert sanitize_commit_message(message) == message
+        prefix, summary = message.split(": ", 1)
+        assert len(summary) <= 45
+
+
+class TestDescribePath:
+    """Test describe_path."""
+
+    def test_names(self):
+        assert describe_path("README.md") == "readme"
+        assert describe_path("tests/test_git_helpers.py") == "git helpers"
+        assert describe_path("web/tests/button.test.js") == "button"
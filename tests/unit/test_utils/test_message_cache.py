@@ -0,0 +1,110 @@
+import json
+import os
+import time
+import pytest
+from codelibre.utils.message_cache import MessageCache, message_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """A message cache in a temporary directory with small limits."""
+    return MessageCache(directory=tmp_path, max_entries=3, max_bytes=10_000, max_age=60)
+
+
+class TestMessageCacheKey:
+    """Test message_cache_key function."""
+
+    def test_same_inputs_same_key(self):
+        """Test that the key is deterministic."""
+        assert message_cache_key("diff", "prompt", "model", ["a"]) == message_cache_key("diff", "prompt", "model", ["a"])
+
+    def test_each_part_changes_key(self):
+        """Test that diff, prompt, model and feedback all affect the key."""
+        base = message_cache_key("diff", "prompt", "model", ["a"])
+        assert message_cache_key("diff2", "prompt", "model", ["a"]) != base
+        assert message_cache_key("diff", "prompt2", "model", ["a"]) != base
+        assert message_cache_key("diff", "prompt", "model2", ["a"]) != base
+        assert message_cache_key("diff", "prompt", "model", ["a", "b"]) != base
+
+    def test_parts_cannot_collide_by_splitting(self):
+        """Test that moving text between parts yields a different key."""
+        assert message_cache_key("ab", "c", "m") != message_cache_key("a", "bc", "m")
+
+
+class TestMessageCache:
+    """Test MessageCache class."""
+
+    def test_miss_returns_none(self, cache):
+        """Test that an unknown key returns None."""
+        assert cache.get("missing") is None
+
+    def test_put_then_get(self, cache):
+        """Test that a stored message is returned."""
+        cache.put("key", "feat: add cache")
+        assert cache.get("key") == "feat: add cache"
+
+    def test_expired_entry_removed(self, cache, tmp_path):
+        """Test that entries unused for longer than max_age are dropped on read."""
+        cache.put("key", "feat: add cache")
+        path = tmp_path / "key.json"
+        os.utime(path, (time.time() - 120, time.time() - 120))
+
+        assert cache.get("key") is None
+        assert not path.exists()
+
+    def test_recently_read_entry_kept(self, cache, tmp_path):
+        """Test that reads keep an entry alive past max_age since it was created, for get and evict alike."""
+        cache.put("key", "feat: add cache")
+        path = tmp_path / "key.json"
+        path.write_text(json.dumps({"message": "feat: add cache", "created": time.time() - 120}))
+
+        assert cache.get("key") == "feat: add cache"
+        cache.evict()
+        assert cache.get("key") == "feat: add cache"
+
+    def test_default_directory_expands_home(self, monkeypatch, tmp_path):
+        """Test that a ~ in CODELIBRE_CACHE_DIR is expanded, as in .env.example."""
+        monkeypatch.setenv("HOME", str(tmp_path))
+        monkeypatch.setenv("CODELIBRE_CACHE_DIR", "~/.cache/codelibre")
+
+        assert MessageCache().directory == tmp_path / ".cache" / "codelibre" / "messages"
+
+    def test_evicts_least_recently_used_over_max_entries(self, cache, tmp_path):
+        """Test that the oldest entries are evicted past max_entries."""
+        for i in range(3):
+            cache.put(f"key{i}", f"msg {i}")
+            os.utime(tmp_path / f"key{i}.json", (1000 + i, time.time() - 30 + i))
+        cache.get("key0")  # refresh key0 so key1 becomes the oldest
+
+        cache.put("key3", "msg 3")
+
+        assert cache.get("key1") is None
+        assert cache.get("key0") == "msg 0"
+        assert cache.get("key3") == "msg 3"
+
+    def test_evicts_over_max_bytes(self, tmp_path):
+        """Test that entries are evicted once the byte limit is exceeded."""
+        cache = MessageCache(directory=tmp_path, max_entries=100, max_bytes=300, max_age=60)
+        for i in range(10):
+            cache.put(f"key{i}", "x" * 50)
+
+        total = sum(p.stat().st_size for p in tmp_path.glob("*.json"))
+        assert total <= 300
+        assert cache.get("key9") == "x" * 50
+
+    def test_clear(self, cache):
+        """Test that clear removes every entry."""
+        cache.put("a", "one")
+        cache.put("b", "two")
+
+        assert cache.clear() == 2
+        assert cache.get("a") is None
+
+    def test_put_ignores_unwritable_directory(self, tmp_path):
+        """Test that filesystem errors on write are swallowed."""
+        blocker = tmp_path / "file"
+        blocker.write_text("not a directory")
+        cache = MessageCache(directory=blocker / "messages")
+
+        cache.put("key", "msg")
+        assert cache.get("key") is None
@@ -0,0 +1,60 @@
+import pytest
+from codelibre.config import Settings
+from codelibre.utils.model_routing import route_model
+
+
+def file_diff(path, lines=2):
+    """A diff adding `lines` lines to `path`."""
+    added = "".join(f"+    value_{i} = compute({i})\n" for i in range(lines))
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,0 +1,{lines} @@\n" + added
+
+
+@pytest.fixture
+def settings():
+    return Settings(
+        api_key="key",
+        default_model="default-model",
+        token_limit=100000,
+        fast_model="fast-model",
+        strong_model="strong-model",
+        routing_fast_max_tokens=500,
+        routing_strong_min_tokens=5000,
+    )
+
+
+class TestRouteModel:
+    """Test route_model tiers."""
+
+    def test_small_change_goes_fast(self, settings):
+        route = route_model(file_diff("src/app.py"), settings)
+        assert (route.tier, route.model) == ("fast", "fast-model")
+
+    def test_medium_change_goes_default(self, settings):
+        route = route_model(file_diff("src/app.py", lines=200), settings)
+        assert (route.tier, route.model) == ("default", "default-model")
+
+    def test_large_change_goes_strong(self, settings):
+        route = route_model(file_diff("src/app.py", lines=2000), settings)
+        assert (route.tier, route.model) == ("strong", "strong-model")
+        assert "tokens" in route.reason
+
+    def test_many_files_go_strong(self, settings):
+        diff = "".join(file_diff(f"src/module_{i}.py") for i in range(15))
+        assert route_model(diff, settings).reason == "15 files"
+
+    def test_many_file_types_go_strong(self, settings):
+        diff = "".join(file_diff(path) for path in ("app.py", "app.ts", "app.css", "schema.sql"))
+        assert route_model(diff, settings).tier == "strong"
+
+    def test_few_small_files_not_fast_beyond_file_limit(self, settings):
+        diff = "".join(file_diff(f"src/module_{i}.py") for i in range(4))
+        assert route_model(diff, settings).tier == "default"
+
+    def test_summarized_goes_strong(self, settings):
+        route = route_model("summary of part one", settings, summarized=True)
+        assert (route.tier, route.reason) == ("strong", "summarized diff")
+
+    def test_unset_tiers_use_default_model(self):
+        settings = Settings(api_key="key", default_model="default-model", token_limit=1000)
+        route = route_model(file_diff("src/app.py"), settings)
+        assert (route.tier, route.model) == ("fast", "default-model")
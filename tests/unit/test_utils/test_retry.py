@@ -0,0 +1,176 @@
+import asyncio
+import email.utils
+import time
+import httpx
+import pytest
+from anthropic import APIConnectionError, APIStatusError, BadRequestError, InternalServerError, RateLimitError
+from codelibre.exceptions import LLMRequestError
+from codelibre.utils.retry import RateLimiter, backoff_delay, is_retryable_error, retry_after_seconds, retry_async
+
+
+REQUEST = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+
+def status_error(cls, status, headers=None, body=None):
+    response = httpx.Response(status, headers=headers or {}, request=REQUEST)
+    return cls("error", response=response, body=body)
+
+
+class FakeClock:
+    """Monotonic clock advanced only by the fake sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+def flaky(errors, result="ok"):
+    """Coroutine factory raising the given errors in turn, then returning result."""
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    call.calls = calls
+    return call
+
+
+class TestRetryAfterSeconds:
+    """Test retry_after_seconds function."""
+
+    def test_milliseconds_header(self):
+        assert retry_after_seconds(status_error(RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+
+    def test_seconds_header(self):
+        assert retry_after_seconds(status_error(RateLimitError, 429, {"retry-after": "7"})) == 7.0
+
+    def test_http_date_header(self):
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        delay = retry_after_seconds(status_error(RateLimitError, 429, {"retry-after": date}))
+        assert 28 <= delay <= 30
+
+    def test_missing_header(self):
+        assert retry_after_seconds(status_error(RateLimitError, 429)) is None
+        assert retry_after_seconds(ValueError("no response")) is None
+
+
+class TestIsRetryableError:
+    """Test is_retryable_error function."""
+
+    def test_retryable(self):
+        """Test that rate limits, overload, server and connection errors retry."""
+        assert is_retryable_error(status_error(RateLimitError, 429))
+        assert is_retryable_error(status_error(InternalServerError, 503))
+        assert is_retryable_error(status_error(APIStatusError, 529))
+        assert is_retryable_error(APIConnectionError(request=REQUEST))
+
+    def test_not_retryable(self):
+        """Test that client errors and unrelated exceptions do not retry."""
+        assert not is_retryable_error(status_error(BadRequestError, 400))
+        assert not is_retryable_error(ValueError("boom"))
+
+    def test_should_retry_header_wins(self):
+        """Test that x-should-retry overrides the status code."""
+        assert not is_retryable_error(status_error(RateLimitError, 429, {"x-should-retry": "false"}))
+        assert is_retryable_error(status_error(BadRequestError, 400, {"x-should-retry": "true"}))
+
+
+class TestBackoffDelay:
+    """Test backoff_delay function."""
+
+    def test_full_jitter_bounds(self):
+        """Test that the delay is scaled by the jitter and capped."""
+        assert backoff_delay(0, base_delay=1, max_delay=30, rng=lambda: 1.0) == 1
+        assert backoff_delay(3, base_delay=1, max_delay=30, rng=lambda: 1.0) == 8
+        assert backoff_delay(10, base_delay=1, max_delay=30, rng=lambda: 1.0) == 30
+        assert backoff_delay(3, base_delay=1, max_delay=30, rng=lambda: 0.25) == 2
+
+
+class TestRetryAsync:
+    """Test retry_async function."""
+
+    def run(self, call, clock, deadline=100, **kwargs):
+        return asyncio.run(retry_async(call, deadline=deadline, clock=clock, sleep=clock.sleep, **kwargs))
+
+    def test_success_first_try(self):
+        clock = FakeClock()
+        call = flaky([])
+        assert self.run(call, clock) == "ok"
+        assert clock.sleeps == []
+
+    def test_retries_transient_errors(self):
+        """Test that 429s and connection errors are retried until success."""
+        clock = FakeClock()
+        call = flaky([status_error(RateLimitError, 429), APIConnectionError(request=REQUEST)])
+
+        assert self.run(call, clock) == "ok"
+        assert len(call.calls) == 3
+        assert len(clock.sleeps) == 2
+
+    def test_honors_retry_after(self):
+        """Test that the server-requested delay is used."""
+        clock = FakeClock()
+        call = flaky([status_error(RateLimitError, 429, {"retry-after": "12"})])
+
+        self.run(call, clock)
+        assert clock.sleeps == [12.0]
+
+    def test_non_retryable_raised(self):
+        """Test that a client error is raised immediately."""
+        clock = FakeClock()
+        with pytest.raises(BadRequestError):
+            self.run(flaky([status_error(BadRequestError, 400)]), clock)
+        assert clock.sleeps == []
+
+    def test_attempts_exhausted(self):
+        """Test that the last error is raised once attempts run out."""
+        clock = FakeClock()
+        errors = [status_error(RateLimitError, 429, {"retry-after": "1"})] * 3
+        with pytest.raises(RateLimitError):
+            self.run(flaky(errors), clock, max_attempts=3)
+        assert len(clock.sleeps) == 2
+
+    def test_wait_past_deadline_not_attempted(self):
+        """Test that a retry that would end after the deadline is not waited for."""
+        clock = FakeClock()
+        call = flaky([status_error(RateLimitError, 429, {"retry-after": "60"})])
+        with pytest.raises(RateLimitError):
+            self.run(call, clock, deadline=30)
+        assert clock.sleeps == []
+
+    def test_slow_call_hits_deadline(self):
+        """Test that a call still running at the deadline is cancelled."""
+        async def slow():
+            await asyncio.sleep(10)
+
+        with pytest.raises(LLMRequestError, match="deadline"):
+            asyncio.run(retry_async(slow, deadline=time.monotonic() + 0.05))
+
+
+class TestRateLimiter:
+    """Test the shared token-bucket rate limiter."""
+
+    def test_burst_then_spaced(self):
+        waits = []
+
+        async def sleep(delay):
+            waits.append(delay)
+
+        limiter = RateLimiter(60, burst=2, clock=lambda: 0.0, sleep=sleep)
+
+        async def acquire(times):
+            for _ in range(times):
+                await limiter.acquire()
+
+        asyncio.run(acquire(4))
+        assert waits == [1.0, 2.0]
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import pytest
+from codelibre.utils import tracing
+from codelibre.utils.tracing import NO_SPAN, disable_tracing, enable_tracing, mark_first, span, traced
+
+
+@pytest.fixture
+def recorder():
+    recorder = enable_tracing()
+    yield recorder
+    disable_tracing()
+
+
+class TestSpan:
+    """Test span and traced."""
+
+    def test_disabled_is_shared_no_op(self):
+        assert tracing.get_recorder() is None
+        assert span("anything") is NO_SPAN
+        with span("anything"):
+            pass
+
+    def test_records_when_enabled(self, recorder):
+        with span("stage"):
+            pass
+        [(name, start, end, _)] = recorder.events
+        assert name == "stage"
+        assert end >= start >= recorder.origin
+
+    def test_records_on_error(self, recorder):
+        with pytest.raises(ValueError):
+            with span("failing"):
+                raise ValueError
+        assert [event[0] for event in recorder.events] == ["failing"]
+
+    def test_traced_sync_and_async(self, recorder):
+        @traced("double")
+        def double(x):
+            return 2 * x
+
+        @traced("triple")
+        async def triple(x):
+            return 3 * x
+
+        assert double(2) == 4
+        assert asyncio.run(triple(2)) == 6
+        assert asyncio.iscoroutinefunction(triple)
+        assert [name for name, _, _ in recorder.summary()] == ["double", "triple"]
+
+    def test_traced_disabled(self):
+        @traced("double")
+        def double(x):
+            return 2 * x
+
+        assert double(2) == 4
+        assert tracing.get_recorder() is None
+
+
+class TestTraceRecorder:
+    """Test TraceRecorder summary and Chrome trace output."""
+
+    def test_summary_aggregates_by_name(self, recorder):
+        for _ in range(3):
+            with span("round"):
+                pass
+        with span("commit"):
+            pass
+        summary = recorder.summary()
+        assert [(name, calls) for name, calls, _ in summary] == [("round", 3), ("commit", 1)]
+
+    def test_mark_first_once_per_start(self, recorder):
+        with span("llm.request"):
+            for _ in range(5):
+                mark_first("llm.first_token", since="llm.request")
+        with span("llm.request"):
+            mark_first("llm.first_token", since="llm.request")
+        assert [name for name, *_ in recorder.events].count("llm.first_token") == 2
+
+    def test_mark_first_without_start(self, recorder):
+        mark_first("llm.first_token", since="llm.request")
+        assert recorder.events == []
+
+    def test_chrome_trace(self, recorder, tmp_path):
+        with span("stage"):
+            pass
+        path = tmp_path / "trace.json"
+        recorder.write_chrome_trace(str(path))
+        [event] = json.loads(path.read_text())["traceEvents"]
+        assert event["name"] == "stage"
+        assert event["ph"] == "X"
+        assert event["ts"] >= 0 and event["dur"] >= 0
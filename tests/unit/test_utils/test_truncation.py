@@ -0,0 +1,118 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from codelibre.config import BASE_TEMPLATE
+from codelibre.exceptions import TruncationException
+from codelibre.utils.estimate_tokens import estimate_anthropic_tokens, estimate_text_tokens
+from codelibre.utils.truncation import truncate_diff, fit_messages_to_budget
+
+
+def make_file_diff(path, hunks=1, lines=10, context=3):
+    """Build a synthetic single-file diff with the given number of hunks."""
+    parts = [
+        f"diff --git a/{path} b/{path}\n",
+        "index 1111111..2222222 100644\n",
+        f"--- a/{path}\n",
+        f"+++ b/{path}\n",
+    ]
+    for h in range(hunks):
+        parts.append(f"@@ -{h * 100 + 1},{lines} +{h * 100 + 1},{lines} @@\n")
+        parts.extend(f" unchanged context line {i}\n" for i in range(context))
+        parts.extend(f"-old value {h} {i}\n" for i in range(lines))
+        parts.extend(f"+new value {h} {i}\n" for i in range(lines))
+    return "".join(parts)
+
+
+class TestTruncateDiff:
+    """Test truncate_diff function."""
+
+    def test_small_diff_unchanged(self):
+        """Test that a diff within budget is returned as-is."""
+        diff = make_file_diff("a.py")
+        assert truncate_diff(diff, 10_000) == diff
+
+    def test_context_lines_stripped_first(self):
+        """Test that context lines are removed before any hunk is dropped."""
+        diff = make_file_diff("a.py", hunks=2, lines=5, context=40)
+        result = truncate_diff(diff, estimate_text_tokens(diff) // 2)
+
+        assert "unchanged context line" not in result
+        assert "+new value 1 4" in result
+        assert "omitted" not in result
+
+    def test_largest_hunks_dropped_first(self):
+        """Test that the largest hunks are replaced by a marker first."""
+        diff = make_file_diff("small.py", lines=2) + make_file_diff("big.py", lines=200)
+        result = truncate_diff(diff, 100)
+
+        assert "+new value 0 1" in result
+        assert "diff --git a/big.py b/big.py" in result
+        assert "@@ 1 hunk omitted (+200 -200) @@" in result
+        assert estimate_text_tokens(result) <= 100
+
+    def test_files_dropped_when_headers_do_not_fit(self):
+        """Test that whole files are dropped and listed when needed."""
+        diff = "".join(make_file_diff(f"file_{i}.py", lines=20) for i in range(30))
+        result = truncate_diff(diff, 120)
+
+        assert "file(s) omitted" in result
+        assert estimate_text_tokens(result) <= 120
+
+    def test_impossible_budget_raises(self):
+        """Test that an unreachable budget raises TruncationException."""
+        diff = "".join(make_file_diff(f"file_{i}.py") for i in range(30))
+        with pytest.raises(TruncationException):
+            truncate_diff(diff, 5)
+
+
+class TestFitMessagesToBudget:
+    """Test fit_messages_to_budget function."""
+
+    def test_within_budget_unchanged(self):
+        """Test that a conversation under the limit is not modified."""
+        messages = [HumanMessage(content=BASE_TEMPLATE.format(diff=make_file_diff("a.py")))]
+        assert fit_messages_to_budget(messages, "system", 10_000) == messages
+
+    def test_old_rounds_dropped_latest_feedback_kept(self):
+        """Test that old rounds go first and the latest feedback survives."""
+        diff_message = HumanMessage(content=BASE_TEMPLATE.format(diff=make_file_diff("a.py", lines=2)))
+        messages = [diff_message]
+        for i in range(20):
+            messages.append(AIMessage(content=f"feat: proposal number {i} " + "x" * 100))
+            messages.append(HumanMessage(content=f"Feedback: round {i} " + "y" * 100))
+        limit = estimate_anthropic_tokens(messages[:1] + messages[-6:]) + 10
+
+        result = fit_messages_to_budget(messages, "", limit)
+
+        assert result[0] == diff_message
+        assert result[-2:] == messages[-2:]
+        assert estimate_anthropic_tokens(result) <= limit
+        # Stale proposals are dropped before the feedback that was given on them
+        kept_ai = [m for m in result[:-2] if isinstance(m, AIMessage)]
+        assert kept_ai == []
+
+    def test_diff_truncated_to_fit(self):
+        """Test that the diff message is truncated when it alone is too big."""
+        diff = make_file_diff("a.py", hunks=5, lines=100)
+        messages = [
+            HumanMessage(content=BASE_TEMPLATE.format(diff=diff)),
+            AIMessage(content="feat: update values"),
+            HumanMessage(content="Feedback: mention the refactor"),
+        ]
+        system_prompt = "You write commit messages."
+
+        result = fit_messages_to_budget(messages, system_prompt, 300)
+
+        assert result[1:] == messages[1:]
+        assert result[0].content.startswith(BASE_TEMPLATE.format(diff=""))
+        assert "omitted" in result[0].content
+        assert estimate_text_tokens(system_prompt) + 4 + estimate_anthropic_tokens(result) <= 300
+
+    def test_protected_messages_too_large_raises(self):
+        """Test that an oversized latest feedback raises TruncationException."""
+        messages = [
+            HumanMessage(content=BASE_TEMPLATE.format(diff=make_file_diff("a.py"))),
+            AIMessage(content="feat: update values"),
+            HumanMessage(content="Feedback: " + "z" * 5000),
+        ]
+        with pytest.raises(TruncationException):
+            fit_messages_to_budget(messages, "system", 200)